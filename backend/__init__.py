@@ -1,23 +1,77 @@
 from fastapi import FastAPI
 from backend.app.api.user_routes import router 
 from backend.app.api.order_routes import router as order_router
+from backend.app.api.agent_routes import router as agent_router
+from backend.app.api.metrics_routes import router as metrics_router
+from backend.app.api.json_response import FastJSONResponse
+from backend.app.observability.middleware import TimingMiddleware
+from backend.app.observability.query_stats import QueryStatsMiddleware
+from backend.config import config
 from contextlib import asynccontextmanager
 from backend.app.db.main import init_db
+from backend.app.services.archive_service import run_archiver
+from backend.app.services.idempotency_service import run_idempotency_purger
+from backend.app.services.dispatch_service import run_dispatcher
+import asyncio
+import importlib
 
-@asynccontextmanager
-async def life_span(app: FastAPI):
-    await init_db()
-    print('server is starting=================|')
-    yield
-    print('server has been stoped=================|')
-
+# "rest": menu, cart, order and user routes only, never imports the agent stack
+# "agent": the streaming chat route only
+# "all": both in one process
+PROFILES = ("all", "rest", "agent")
 version  = 'v1'
-app = FastAPI(
-    title= "Food app",
-    description= "rest api for food ordering system", 
-    version= version,
-    lifespan= life_span
-) 
-
-app.include_router(router, prefix=f"/api/{version}/user")
-app.include_router(order_router, prefix=f"/api/{version}/order")
\ No newline at end of file
+
+
+def _life_span(profile: str):
+    @asynccontextmanager
+    async def life_span(app: FastAPI):
+        await init_db()
+        background = []
+        stop = asyncio.Event()
+        if profile in ("all", "rest"):
+            background.append(asyncio.create_task(run_idempotency_purger(stop)))
+            if config.ARCHIVE_ENABLED:
+                background.append(asyncio.create_task(run_archiver(stop)))
+            if config.DISPATCH_ENABLED:
+                background.append(asyncio.create_task(run_dispatcher(stop)))
+        if profile in ("all", "agent") and config.AGENT_PRELOAD:
+            # pay the agent import cost at startup rather than on the first chat
+            await asyncio.to_thread(importlib.import_module, "backend.app.agents.main")
+        print(f'server is starting ({profile})=================|')
+        yield
+        stop.set()
+        await asyncio.gather(*background, return_exceptions=True)
+        print('server has been stoped=================|')
+    return life_span
+
+
+def create_app(profile: str | None = None) -> FastAPI:
+    """Build the app for one deployment profile (defaults to APP_PROFILE)."""
+    profile = profile or config.APP_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"APP_PROFILE must be one of {', '.join(PROFILES)}, got {profile!r}")
+
+    app = FastAPI(
+        title= "Food app",
+        description= "rest api for food ordering system", 
+        version= version,
+        lifespan= _life_span(profile),
+        # orjson when installed; routes returning plain rows skip ORM encoding
+        default_response_class= FastJSONResponse,
+    ) 
+
+    app.add_middleware(QueryStatsMiddleware)
+
+    if config.METRICS_ENABLED:
+        app.add_middleware(TimingMiddleware)
+        app.include_router(metrics_router)
+
+    if profile in ("all", "rest"):
+        app.include_router(router, prefix=f"/api/{version}/user")
+        app.include_router(order_router, prefix=f"/api/{version}/order")
+    if profile in ("all", "agent"):
+        app.include_router(agent_router, prefix=f"/api/{version}/user")
+    return app
+
+
+app = create_app()
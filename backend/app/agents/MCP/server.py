@@ -1,5 +1,7 @@
 # mcp_tools.py
 import os
+import time
+import uuid
 import requests
 from typing import Optional, Dict, Any
 from mcp.server import FastMCP
@@ -7,61 +9,112 @@ from mcp.server import FastMCP
 mcp = FastMCP("ordering-mcp")
 
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://127.0.0.1:8000/api/v1/order")
+# mutations carry an Idempotency-Key, so they can use a short timeout and retry
+MUTATION_TIMEOUT = float(os.getenv("MCP_MUTATION_TIMEOUT", "5"))
+MUTATION_RETRIES = int(os.getenv("MCP_MUTATION_RETRIES", "2"))
+# the restaurant this chat orders from; set by the agent when it spawns the server
+TENANT_HEADERS = {"X-Restaurant-Id": os.environ["RESTAURANT_ID"]} if os.getenv("RESTAURANT_ID") else {}
+
+
+# last body per GET url, revalidated with If-None-Match so unchanged reads are 304s
+_etag_cache: Dict[str, tuple[str, Any]] = {}
 
 
 def _get(path: str, params: Optional[Dict[str, Any]] = None, timeout: float = 10.0):
     url = BACKEND_API_URL.rstrip("/") + "/" + path.lstrip("/")
-    r = requests.get(url, params=params or {}, timeout=timeout)
+    prepared = requests.Request("GET", url, params=params or {}).prepare().url
+    cached = _etag_cache.get(prepared)
+    headers = {**TENANT_HEADERS, "If-None-Match": cached[0]} if cached else dict(TENANT_HEADERS)
+    r = requests.get(prepared, headers=headers, timeout=timeout)
+    if r.status_code == 304 and cached:
+        return cached[1]
     r.raise_for_status()
     # return JSON if available, else raw text
     try:
-        return r.json()
+        body = r.json()
     except ValueError:
         return r.text
+    if "ETag" in r.headers:
+        _etag_cache[prepared] = (r.headers["ETag"], body)
+    return body
 
-def _post(path: str, params: Optional[Dict[str, Any]] = None, payload: Optional[Dict[str, Any]] = None, timeout: float = 10.0):
-    url = BACKEND_API_URL.rstrip("/") + "/" + path.lstrip("/")
-    r = requests.post(url, params=params or {}, json=payload or {}, timeout=timeout)
-    r.raise_for_status()
-    try:
-        return r.json()
-    except ValueError:
-        return r.text
-    
-def _put(path: str, params: Optional[Dict[str, Any]] = None, payload: Optional[Dict[str, Any]] = None, timeout: float = 10.0):
-    url = BACKEND_API_URL.rstrip("/") + "/" + path.lstrip("/")
-    r = requests.put(url, params=params or {}, json=payload or {}, timeout=timeout)
-    r.raise_for_status()
-    try:
-        return r.json()
-    except ValueError:
-        return r.text
+def _send(method: str, path: str, params: Optional[Dict[str, Any]] = None, payload: Any = None,
+          timeout: float = MUTATION_TIMEOUT):
+    """Send a mutating request, retrying timeouts and 5xx responses under one Idempotency-Key.
 
-def _delete(path: str, params: Optional[Dict[str, Any]] = None, timeout: float = 10.0):
+    The key is generated here, once per tool call, and never taken from the
+    model. The backend replays the first stored response for a repeated key,
+    so a retry after a lost response never applies the change twice.
+    """
     url = BACKEND_API_URL.rstrip("/") + "/" + path.lstrip("/")
-    r = requests.delete(url, params=params or {}, timeout=timeout)
+    headers = {**TENANT_HEADERS, "Idempotency-Key": str(uuid.uuid4())}
+    for attempt in range(MUTATION_RETRIES + 1):
+        try:
+            r = requests.request(method, url, params=params or {}, json=payload, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MUTATION_RETRIES:
+                raise
+        else:
+            # 409: the first attempt is still running on the server
+            if (r.status_code < 500 and r.status_code != 409) or attempt == MUTATION_RETRIES:
+                break
+        time.sleep(0.2 * 2 ** attempt)
     r.raise_for_status()
     try:
         return r.json()
     except ValueError:
         return r.text
 
+def _post(path: str, params: Optional[Dict[str, Any]] = None, payload: Any = None):
+    return _send("POST", path, params=params, payload=payload if payload is not None else {})
+
+def _put(path: str, params: Optional[Dict[str, Any]] = None, payload: Any = None):
+    return _send("PUT", path, params=params, payload=payload if payload is not None else {})
+
+def _delete(path: str, params: Optional[Dict[str, Any]] = None):
+    return _send("DELETE", path, params=params)
+
 
 
 @mcp.tool()
 def get_menu() -> dict:
     """
-        Retrieves the full list of menu items for ordering.
+        Retrieves the full list of menu items. Only use this when the user
+        wants to browse the whole menu; to look up specific dishes use
+        find_menu_item instead.
 
         Returns:
-            A list of menu items, each containing:
+            A compact table:
             {
-                "item_id": int,     # Unique item ID
-                "item_name": str,   # Dish name
-                "item_price": float # Dish price
+                "columns": ["item_id", "item_name", "item_price"],
+                "rows": [[<int>, <str>, <float>], ...]
             }
         """
-    return _get("/menu")
+    return _get("/menu", params={"format": "compact"})
+
+
+@mcp.tool()
+def find_menu_item(query: str, limit: int = 5) -> dict:
+    """
+    Tool: find_menu_item
+    Description:
+        Finds menu items by name. Handles partial names and typos
+        (e.g. "piza", "chiken burger"). Use this to get the item_id and
+        price of dishes the user mentions before adding them to the cart.
+
+    Query params:
+      q=<query>
+      limit=<max results, default 5>
+
+    Returns:
+        The best matches, best first, as a compact table:
+        {
+            "columns": ["item_id", "item_name", "item_price"],
+            "rows": [[<int>, <str>, <float>], ...]
+        }
+        An empty "rows" list means nothing on the menu matches.
+    """
+    return _get("/menu/search", params={"q": query, "limit": limit})
 
 
 @mcp.tool()
@@ -77,9 +130,10 @@ def add_to_cart(username: str, cart_items: list[dict]) -> dict:
         {"item_id": <int>, "quantity": <int>},
         ...
       ]
-    Returns the backend JSON response.
+    Returns the new quantity of each touched item as a compact table:
+      {"columns": ["item_id", "quantity"], "rows": [[<int>, <int>], ...]}
     """
-    params = {"username": username}
+    params = {"username": username, "format": "compact"}
     payload = cart_items  # directly forward list of {item_id, quantity}
     return _post("/cartitems", params=params, payload=payload)
 
@@ -94,47 +148,78 @@ def get_cart(username: str) -> dict:
       username=<username>
 
     Returns:
-        The backend JSON response containing the current cart state, typically a list like:
-        [
-            {'quantity': <int>, 'cart_id': <int>, 'username': <str>, 'item_id': <int>},
-            ...
-        ]
+        The current cart as a compact table plus the cart total:
+        {
+            "columns": ["item_id", "item_name", "quantity", "item_price", "total_price"],
+            "rows": [[<int>, <str>, <int>, <float>, <float>], ...],
+            "cart_total": <float>
+        }
     """
-    params = {"username": username}
+    params = {"username": username, "format": "compact"}
     return _get("/cartitems", params=params)
 
 
 @mcp.tool()
-def update_cart(username: str, cart_items: dict) -> dict:
+def apply_cart_changes(username: str, changes: list[dict]) -> dict:
     """
-    Tool: update_cart
+    Tool: apply_cart_changes
     Description:
-        Updates existing items in the user's cart.
-        Use this tool when the user wants to change quantities or remove items.
-        in the case of removal, set quantity to 0.
+        Applies several cart changes at once, in order, in a single
+        transaction, and returns the resulting cart. Prefer this over
+        separate add/update/delete calls, e.g. "swap the burger for two
+        pizzas" is one call:
+        [{"op": "remove", "item_id": 4}, {"op": "add", "item_id": 2, "quantity": 2}]
 
     Query params:
       username=<username>
 
     JSON payload:
-        A list of objects representing updated cart items:
+        A list of operations:
         [
-            {"item_id": <int>, "quantity": <int>},  
+            {"op": "add", "item_id": <int>, "quantity": <int>},     # increase quantity
+            {"op": "set", "item_id": <int>, "quantity": <int>},     # set quantity, 0 removes
+            {"op": "remove", "item_id": <int>},                     # remove the item
             ...
         ]
 
     Returns:
-        The updated cart contents as returned by the backend.
+        The updated cart; no need to call get_cart afterwards:
+        {
+            "columns": ["item_id", "item_name", "quantity", "item_price", "total_price"],
+            "rows": [[<int>, <str>, <int>, <float>, <float>], ...],
+            "cart_total": <float>
+        }
+    """
+    params = {"username": username, "format": "compact"}
+    return _post("/cartitems/apply", params=params, payload=changes)
+
+
+@mcp.tool()
+def update_cart(username: str, item_id: int, quantity: int) -> dict:
+    """
+    Tool: update_cart
+    Description:
+        Sets the quantity of one item already in the user's cart.
+        A quantity of 0 removes the item.
+
+    Query params:
+      username=<username>
+
+    JSON payload:
+        {"item_id": <int>, "quantity": <int>}
+
+    Returns:
+        The updated cart item as returned by the backend, or null if removed.
     """
     params = {"username": username}
-    payload = cart_items
+    payload = {"item_id": item_id, "quantity": quantity}
     return _put("/cartitems", params=params, payload=payload)
 
 
 @mcp.tool()
-def delete_cart_item(username: str) -> dict:
+def clear_cart(username: str) -> dict:
     """
-    Tool: delete_cart_item
+    Tool: clear_cart
     Description:
         Delete all cart items for the given user.
 
@@ -202,6 +287,29 @@ def get_most_recent_order(username: str) -> dict:
     params = {"username": username}
     return _get("/orders", params=params)
 
+@mcp.tool()
+def get_recommendations(username: str, limit: int = 5) -> dict:
+    """
+    Tool: get_recommendations
+    Description:
+        What other customers have been ordering lately, and the user's own
+        usual items. Use this for "what's popular?", "what do you recommend?"
+        or "my usual".
+
+    Query params:
+      username=<username>
+      limit=<max items per list, default 5>
+
+    Returns:
+        Two compact tables, best first:
+        {
+            "popular": {"columns": ["item_id", "item_name", "item_price", "score"], "rows": [...]},
+            "usual": {"columns": ["item_id", "item_name", "item_price", "order_count", "quantity_total"], "rows": [...]}
+        }
+        "usual" is empty for users who have not ordered yet.
+    """
+    return _get("/recommendations", params={"username": username, "limit": limit, "format": "compact"})
+
 @mcp.tool()
 def delete_cart_item(username: str, item_id: int) -> dict:
     """
@@ -0,0 +1,144 @@
+"""Cached answers for repeated menu questions.
+
+"What vegetarian options do you have?" or "how much is the pizza?" gets the
+same answer for every user until the menu changes, so a chat turn whose
+prompt only asks about the menu is answered from a per-process LRU instead
+of a model run. Entries are keyed on (restaurant, menu version, normalized
+prompt), so a menu change makes every older answer unreachable; they are
+dropped the next time that restaurant is looked up.
+
+A prompt counts as cart-independent only if it mentions the menu or prices
+and nothing personal, cart-related or referring back to earlier turns. An
+answer is stored only if the turn called nothing but menu tools and the
+reply does not mention the user, so a misclassified prompt is not cached.
+"""
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.app.services.order_service import order_service
+from backend.app.observability.metrics import AGENT_ANSWER_CACHE
+from backend.config import config
+
+orderservice = order_service()
+
+# tools that only read the menu; any other tool call makes the answer user-specific
+MENU_TOOLS = frozenset({"get_menu", "find_menu_item"})
+
+_MENU_WORDS = frozenset({
+    "menu", "price", "prices", "cost", "costs", "much", "cheap", "cheapest", "expensive",
+    "vegetarian", "vegan", "halal", "gluten", "spicy", "dessert", "desserts", "drink",
+    "drinks", "options", "serve", "sell", "available", "items", "dishes",
+})
+_PERSONAL_WORDS = frozenset({
+    # the user, their cart and orders
+    "i", "im", "my", "mine", "we", "our", "us", "usual", "cart", "order", "orders",
+    "ordered", "add", "remove", "delete", "clear", "place", "checkout", "buy", "want",
+    "recommend", "recommendation", "recommendations", "popular", "status",
+    # follow-ups that depend on the previous turn
+    "it", "its", "that", "this", "those", "these", "them", "one", "ones", "else", "more",
+    "again", "same", "above",
+})
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class CacheKey(NamedTuple):
+    restaurant_id: int
+    menu_version: int
+    prompt: str
+
+
+def normalize(prompt: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace: "How much is the pizza??" -> "how much is the pizza"."""
+    return " ".join(_WORD.findall(prompt.lower().replace("'", "")))
+
+
+def is_cart_independent(normalized: str) -> bool:
+    words = set(normalized.split())
+    if not words or len(normalized) > config.ANSWER_CACHE_MAX_PROMPT_CHARS:
+        return False
+    return bool(words & _MENU_WORDS) and not words & _PERSONAL_WORDS
+
+
+class AnswerCache:
+    """LRU of answers with a TTL and a per-entry size cap, in one process."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_entry_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._answers: "OrderedDict[CacheKey, tuple[float, str]]" = OrderedDict()
+        # newest menu version seen per restaurant
+        self._versions: dict[int, int] = {}
+
+    def _evict(self, now: float) -> None:
+        # entries are kept in last-used order; expired ones are dropped from
+        # the front, and the rest once the cache is over its size
+        while self._answers:
+            _, (stored, _) = next(iter(self._answers.items()))
+            if now - stored < self.ttl_seconds and len(self._answers) <= self.max_entries:
+                break
+            self._answers.popitem(last=False)
+
+    def _see_version(self, restaurant_id: int, version: int) -> None:
+        if self._versions.get(restaurant_id, version) < version:
+            # the menu changed: nothing keyed on an older version can be hit again
+            for key in [k for k in self._answers if k.restaurant_id == restaurant_id and k.menu_version < version]:
+                del self._answers[key]
+        self._versions[restaurant_id] = max(version, self._versions.get(restaurant_id, version))
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        now = time.monotonic()
+        self._see_version(key.restaurant_id, key.menu_version)
+        self._evict(now)
+        entry = self._answers.get(key)
+        if entry is None:
+            return None
+        self._answers.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: CacheKey, answer: str) -> bool:
+        if not answer or len(answer.encode()) > self.max_entry_bytes:
+            return False
+        if key.menu_version < self._versions.get(key.restaurant_id, key.menu_version):
+            # the menu changed while the turn ran
+            return False
+        self._answers[key] = (time.monotonic(), answer)
+        self._answers.move_to_end(key)
+        self._evict(time.monotonic())
+        return True
+
+
+answer_cache = AnswerCache(config.ANSWER_CACHE_TTL_SECONDS, config.ANSWER_CACHE_MAX_ENTRIES, config.ANSWER_CACHE_MAX_ENTRY_BYTES)
+
+
+async def cache_key(prompt: str, restaurant_id: int, session: AsyncSession) -> Optional[CacheKey]:
+    """The turn's cache key, or None if its answer may depend on more than the menu."""
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    normalized = normalize(prompt)
+    if not is_cart_independent(normalized):
+        if config.METRICS_ENABLED:
+            AGENT_ANSWER_CACHE.inc(result="skipped")
+        return None
+    # usually served from the process menu snapshot without a query
+    snap = await orderservice.get_menu_snapshot(session, restaurant_id)
+    return CacheKey(restaurant_id, snap.version or 0, normalized)
+
+
+def lookup(key: CacheKey) -> Optional[str]:
+    answer = answer_cache.get(key)
+    if config.METRICS_ENABLED:
+        AGENT_ANSWER_CACHE.inc(result="hit" if answer is not None else "miss")
+    return answer
+
+
+def store(key: CacheKey, answer: str, tools_used: Iterable[str], username: str) -> None:
+    """Cache a finished turn's answer if it used only menu tools and is not addressed to the user."""
+    if not set(tools_used) <= MENU_TOOLS or username.lower() in answer.lower():
+        return
+    if answer_cache.put(key, answer) and config.METRICS_ENABLED:
+        AGENT_ANSWER_CACHE.inc(result="stored")
@@ -1,21 +1,39 @@
-from agents import Agent, Runner, set_tracing_disabled, RunContextWrapper
+from agents import Agent, Runner, RunHooks, ModelSettings, set_tracing_disabled, RunContextWrapper
 from agents.mcp import MCPServer, MCPServerStdio
 from openai.types.responses import ResponseTextDeltaEvent
 from backend.app.db.schemas import usercontext
 from backend.app.services.agent_service import PostgresSession
-from backend.app.db.main import get_session
-from backend.app.agents.my_config.gemini_config import MODEL
+from backend.app.db.main import async_session
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.agents.prefetch import build_turn_snapshot
+from backend.app.agents import answer_cache
+from backend.app.agents.my_config.gemini_config import get_model
+from backend.app.observability.metrics import (
+    span, observe_phase, AGENT_TTFT, AGENT_TURN_LATENCY, AGENT_TOKENS_PER_SECOND,
+    AGENT_TOOL_CALLS_PER_TURN, AGENT_TURNS, AGENT_INPUT_TOKENS, AGENT_PROMPT_CACHE_HIT_RATIO,
+    AGENT_CANCELLED_TOKENS_SAVED,
+)
+from backend.app.observability.tool_trace import ToolCallTracer
+from backend.config import config
 from pydantic import BaseModel
+from typing import Awaitable, Callable
+import asyncio
+import logging
+import os
+import random
+import time
 import uuid
 
 set_tracing_disabled(True) 
 
-def dynamic_instructions(context: RunContextWrapper[usercontext], agent: Agent[usercontext]) -> str:
-    return f"""
+log = logging.getLogger(__name__)
+
+# Everything shared by all users lives in this constant prefix so the
+# provider can cache it; per-user and per-turn context is appended at the end.
+STATIC_INSTRUCTIONS = """
             You are a helpful and friendly food-ordering assistant for a chat-based app.
 
-            The user's name is {context.context.username}.
-            Your goal is to help them browse the restaurant menu, add or remove items from their cart, update item quantities, and place food orders.
+            Your goal is to help the user browse the restaurant menu, add or remove items from their cart, update item quantities, and place food orders.
 
             You can:
             - Show available menu items and their prices.
@@ -30,8 +48,11 @@ def dynamic_instructions(context: RunContextWrapper[usercontext], agent: Agent[u
             - Keep responses concise and focused on helping with food ordering.
             - When showing menu items, always include: item_id, item_name, item_price
             - When showing cart items, always include: item_id, item_name, quantity
-            - when adding to cart, check the menu items to find the menu item id
-            - when updating cart, check the cart items to find the cart item to update
+            - when adding to cart, use find_menu_item to look up the item_id of the dishes the user mentions; only call get_menu when the user wants to browse the whole menu
+            - tool results are compact tables: "columns" names the fields of each entry in "rows"
+            - if a menu/cart snapshot is given at the end of these instructions, use it instead of calling get_menu or get_cart; after you change the cart, trust the cart returned by the tool over the snapshot
+            - to change the cart (add, change quantities, remove, swap items) use a single apply_cart_changes call with all the operations; it returns the updated cart, so do not call get_cart afterwards
+            - for "what's popular", recommendations or "my usual", call get_recommendations; to reorder the usual, add its items with apply_cart_changes
 
             Context examples:
             - If the user says "show me the menu", respond with the menu items.
@@ -41,57 +62,290 @@ def dynamic_instructions(context: RunContextWrapper[usercontext], agent: Agent[u
             Keep your tone natural, warm, and efficient.
             """
 
+
+def dynamic_instructions(context: RunContextWrapper[usercontext], agent: Agent[usercontext]) -> str:
+    instructions = STATIC_INSTRUCTIONS + f"""
+            Current user:
+            - The user's name is {context.context.username}.
+            """
+    if context.context.snapshot:
+        instructions += "\n" + context.context.snapshot + "\n"
+    return instructions
+
+
+class SharedToolsMCPServerStdio(MCPServerStdio):
+    """MCP stdio server whose tool list is fetched once per process.
+
+    Every chat spawns its own server, but the tool definitions never change
+    at runtime, so they are listed once, sorted by name for a stable prompt
+    prefix, and reused by every later instance.
+    """
+
+    _shared_tools = None
+    _shared_tools_lock = asyncio.Lock()
+
+    async def list_tools(self, *args, **kwargs):
+        cls = SharedToolsMCPServerStdio
+        if cls._shared_tools is None:
+            async with cls._shared_tools_lock:
+                if cls._shared_tools is None:
+                    tools = await super().list_tools(*args, **kwargs)
+                    cls._shared_tools = sorted(tools, key=lambda t: t.name)
+        return list(cls._shared_tools)
+
+
+class TurnTimingHooks(RunHooks[usercontext]):
+    """Records how long each model call within a turn takes."""
+
+    def __init__(self):
+        self._llm_started: float | None = None
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        self._llm_started = time.perf_counter()
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        if self._llm_started is not None:
+            observe_phase("model", self._llm_started)
+        self._llm_started = None
+
+
 agent = Agent[usercontext](
     name = "food ordering assistant", 
     instructions= dynamic_instructions,
-    model= MODEL,
+    model= get_model(),
+    # ask for usage on streamed responses so token and cache stats are reported
+    model_settings= ModelSettings(include_usage=True),
     )
 
 
-async def agent_stream_generator(prompt: str, conversation_id: str | None = None):
+# keeps fire-and-forget persistence tasks alive after the request is gone
+_background_tasks: set[asyncio.Task] = set()
+# running average of output tokens per completed turn, for "tokens saved"
+_avg_output_tokens = 0.0
+
+
+async def _watch_disconnect(is_disconnected: Callable[[], Awaitable[bool]], on_disconnect: Callable[[], None]):
+    while True:
+        await asyncio.sleep(config.DISCONNECT_POLL_INTERVAL)
+        if await is_disconnected():
+            on_disconnect()
+            return
+
+
+async def _persist_items(conversation_id: str, items: list[dict]):
+    """Append messages to the history outside the turn's own session."""
+    try:
+        async with async_session() as db_session:
+            await PostgresSession(db_session, conversation_id).add_items(items)
+    except Exception as e:
+        log.exception("failed to persist reply for %s: %s", conversation_id, e)
+
+
+def _in_background(coro) -> None:
+    # run in a fresh task: the caller may already be cancelled
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def agent_stream_generator(
+    prompt: str,
+    conversation_id: str | None = None,
+    is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+    restaurant_id: int = DEFAULT_RESTAURANT_ID,
+    on_tool_event: Callable[[str, str, str], None] | None = None,
+):
+    """Stream the agent's reply to `prompt` as text deltas.
+
+    If `is_disconnected` is given it is polled while the turn runs; once the
+    client is gone the run (model stream and in-flight tool calls) is
+    cancelled, the MCP server is shut down and the partial reply is saved.
+    Menu-only questions answered before (for the same menu version) are
+    replayed from the answer cache without starting a run.
+    `on_tool_event(call_id, tool_name, "started" | "done")` is called as
+    tool calls start and return, for clients that show tool progress.
+    """
 
     if conversation_id is None:
         conversation_id = str(uuid.uuid4())
         
     user = usercontext(
-        username = conversation_id
+        username = conversation_id,
+        restaurant_id = restaurant_id,
     )
 
-    # Start the MCP server
-    async with MCPServerStdio(
-        name="ordering-mcp",
-        params={
-            "command": "uv",
-            "args": ["run", "backend/app/agents/MCP/server.py"],   # path to your MCP server file
-        },
-        cache_tools_list=True
-    ) as mcp_server:
-
-        # List available tools (optional for debugging)
-        tools = await mcp_server.list_tools()
-        print("🧩 Available MCP Tools:")
-        for tool in tools:
-            print(f" - {tool.name}")
-
-        # Attach MCP server to agent
-        agent.mcp_servers = [mcp_server]
-
-        # Create DB session
-        async for db_session in get_session():
-            agent_session = PostgresSession(db_session, conversation_id)
-
-            # Run the agent stream
-            result = Runner.run_streamed(
-                agent,
-                input=prompt,
-                session=agent_session,
-                context= user
-            )
-
-            async for event in result.stream_events():
-                if event.type == "raw_response_event":
-                    if isinstance(event.data, ResponseTextDeltaEvent) and event.data.delta:
-                        yield event.data.delta  
-
-                elif event.type == "run_item_stream_event" and event.name == "tool_called":
-                    print(f"🛠️ Agent called tool")
+    turn_start = time.perf_counter()
+    first_token_at = None
+    tool_calls = 0
+    outcome = "error"
+    result = None
+    tracer = ToolCallTracer(conversation_id)
+    prefetch = random.random() < config.AGENT_PREFETCH_RATE
+    streamed: list[str] = []
+    tools_used: list[str] = []
+    # call_id -> tool name, to label "done" events
+    running_tools: dict[str, str] = {}
+    cache_key = None
+    disconnected = False
+
+    def on_disconnect():
+        nonlocal disconnected
+        disconnected = True
+        if result is not None:
+            result.cancel()
+
+    watcher = asyncio.create_task(_watch_disconnect(is_disconnected, on_disconnect)) if is_disconnected else None
+
+    # Create DB session
+    async with async_session() as db_session:
+        agent_session = PostgresSession(db_session, conversation_id)
+        pending: list[asyncio.Task] = []
+
+        try:
+            try:
+                cache_key = await answer_cache.cache_key(prompt, restaurant_id, db_session)
+            except Exception as e:
+                log.warning("answer cache lookup failed, running the agent: %s", e)
+                await db_session.rollback()
+            cached = answer_cache.lookup(cache_key) if cache_key else None
+            if cached is not None:
+                # saved first so the turn is in the history even if the client leaves now
+                _in_background(_persist_items(conversation_id, [
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": cached},
+                ]))
+                first_token_at = time.perf_counter()
+                outcome = "cached"
+                yield cached
+                return
+
+            # Load history and the menu/cart snapshot while the MCP server spawns.
+            # Cacheable turns get no cart, so their answer can't depend on it.
+            pending.append(asyncio.create_task(agent_session.preload()))
+            if prefetch:
+                pending.append(asyncio.create_task(
+                    build_turn_snapshot(conversation_id, restaurant_id, include_cart=cache_key is None)
+                ))
+
+            # Start the MCP server
+            spawn_start = time.perf_counter()
+            async with SharedToolsMCPServerStdio(
+                name="ordering-mcp",
+                params={
+                    "command": "uv",
+                    "args": ["run", "backend/app/agents/MCP/server.py"],   # path to your MCP server file
+                    # the tools send this as X-Restaurant-Id
+                    "env": {**os.environ, "RESTAURANT_ID": str(restaurant_id)},
+                },
+                cache_tools_list=True
+            ) as mcp_server:
+                observe_phase("mcp_spawn", spawn_start)
+
+                # List available tools (optional for debugging)
+                with span("list_tools"):
+                    tools = await mcp_server.list_tools()
+                log.debug("available MCP tools: %s", ", ".join(tool.name for tool in tools))
+
+                # Bind this run's MCP server to a private copy of the agent so
+                # concurrent chats never share (or close) each other's server.
+                run_agent = agent.clone(mcp_servers=[mcp_server])
+
+                results = await asyncio.gather(*pending, return_exceptions=True)
+                if isinstance(results[0], Exception):
+                    # the runner will load the history itself
+                    await db_session.rollback()
+                if prefetch and isinstance(results[1], str):
+                    user.snapshot = results[1]
+                elif prefetch:
+                    log.warning("prefetch failed, continuing without snapshot: %s", results[1])
+
+                if disconnected:
+                    # the client left while we were still setting up
+                    outcome = "cancelled"
+                    return
+
+                # Run the agent stream
+                result = Runner.run_streamed(
+                    run_agent,
+                    input=prompt,
+                    session=agent_session,
+                    context= user,
+                    hooks= TurnTimingHooks()
+                )
+
+                async for event in result.stream_events():
+                    if event.type == "raw_response_event":
+                        if isinstance(event.data, ResponseTextDeltaEvent) and event.data.delta:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            streamed.append(event.data.delta)
+                            yield event.data.delta  
+
+                    elif event.type == "run_item_stream_event" and event.name == "tool_called":
+                        tool_calls += 1
+                        tools_used.append(getattr(event.item.raw_item, "name", "unknown"))
+                        tracer.on_tool_called(event.item.raw_item)
+                        if on_tool_event is not None:
+                            call_id = getattr(event.item.raw_item, "call_id", None) or str(tool_calls)
+                            running_tools[call_id] = tools_used[-1]
+                            on_tool_event(call_id, tools_used[-1], "started")
+
+                    elif event.type == "run_item_stream_event" and event.name == "tool_output":
+                        tracer.on_tool_output(event.item)
+                        if on_tool_event is not None:
+                            raw = event.item.raw_item
+                            call_id = raw.get("call_id") if isinstance(raw, dict) else getattr(raw, "call_id", None)
+                            on_tool_event(call_id, running_tools.pop(call_id, "unknown"), "done")
+            outcome = "cancelled" if disconnected else "completed"
+            if cache_key is not None and outcome == "completed":
+                answer_cache.store(cache_key, "".join(streamed), tools_used, conversation_id)
+        except (asyncio.CancelledError, GeneratorExit):
+            # the server dropped the response (client went away)
+            outcome = "cancelled"
+            if result is not None:
+                result.cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            for task in pending:
+                task.cancel()
+            tracer.finish()
+            if outcome == "cancelled" and streamed:
+                # store what was streamed so history stays user/assistant paired
+                _in_background(_persist_items(
+                    conversation_id, [{"role": "assistant", "content": "".join(streamed) + " [response interrupted]"}]
+                ))
+            if config.METRICS_ENABLED:
+                _record_turn(turn_start, first_token_at, tool_calls, outcome, result, prefetch, streamed)
+
+
+def _record_turn(turn_start: float, first_token_at: float | None, tool_calls: int, outcome: str, result, prefetch: bool, streamed: list[str]) -> None:
+    global _avg_output_tokens
+    end = time.perf_counter()
+    prefetch_label = "on" if prefetch else "off"
+    AGENT_TURNS.inc(outcome=outcome)
+    AGENT_TURN_LATENCY.observe(end - turn_start)
+    if outcome == "cached":
+        # no run, so nothing comparable for the model and prefetch metrics
+        return
+    AGENT_TOOL_CALLS_PER_TURN.observe(tool_calls, prefetch=prefetch_label)
+    usage = result.context_wrapper.usage if result is not None else None
+    if outcome == "cancelled":
+        # usage is only reported per finished model response, so estimate
+        # what was streamed (~4 chars per token) against a typical full turn
+        streamed_tokens = sum(len(delta) for delta in streamed) / 4
+        AGENT_CANCELLED_TOKENS_SAVED.inc(max(0.0, _avg_output_tokens - streamed_tokens))
+    elif outcome == "completed" and usage and usage.output_tokens:
+        _avg_output_tokens += 0.05 * (usage.output_tokens - _avg_output_tokens)
+    if usage and usage.input_tokens:
+        details = getattr(usage, "input_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        AGENT_INPUT_TOKENS.inc(cached, cache="hit")
+        AGENT_INPUT_TOKENS.inc(usage.input_tokens - cached, cache="miss")
+        AGENT_PROMPT_CACHE_HIT_RATIO.observe(cached / usage.input_tokens)
+    if first_token_at is None:
+        return
+    AGENT_TTFT.observe(first_token_at - turn_start, prefetch=prefetch_label)
+    if outcome == "completed" and usage and usage.output_tokens and end > first_token_at:
+        AGENT_TOKENS_PER_SECOND.observe(usage.output_tokens / (end - first_token_at))
@@ -1,12 +1,29 @@
+from functools import lru_cache
 from decouple import config
 from agents import AsyncOpenAI, OpenAIChatCompletionsModel
+from backend.app.agents.my_config.model_router import ModelEndpoint, ModelRouter
 
-key = config("GEMINI_API_KEY")
-base_url = config("BASE_URL")
 
-gemni_client = AsyncOpenAI(
-    api_key= key, 
-    base_url= base_url
-)
+def _chat_model(api_key: str, base_url: str, model: str) -> OpenAIChatCompletionsModel:
+    client = AsyncOpenAI(api_key= api_key, base_url= base_url)
+    return OpenAIChatCompletionsModel(model = model, openai_client = client)
 
-MODEL = OpenAIChatCompletionsModel(model = "gemini-2.5-flash", openai_client = gemni_client)
\ No newline at end of file
+
+@lru_cache(maxsize=1)
+def get_model() -> ModelRouter:
+    """Build the model router on first use, so importing this module needs no credentials.
+
+    Gemini is the primary endpoint. Setting FALLBACK_BASE_URL (plus
+    FALLBACK_API_KEY and FALLBACK_MODEL) adds a secondary endpoint that slow
+    or failing Gemini requests are hedged to.
+    """
+    endpoints = [ModelEndpoint("gemini", _chat_model(
+        config("GEMINI_API_KEY"), config("BASE_URL"), config("MODEL_NAME", default="gemini-2.5-flash"),
+    ))]
+    if config("FALLBACK_BASE_URL", default=""):
+        endpoints.append(ModelEndpoint("fallback", _chat_model(
+            config("FALLBACK_API_KEY", default=config("GEMINI_API_KEY")),
+            config("FALLBACK_BASE_URL"),
+            config("FALLBACK_MODEL", default="gemini-2.5-flash"),
+        )))
+    return ModelRouter(endpoints)
@@ -0,0 +1,272 @@
+"""Hedged, circuit-broken routing over several chat model endpoints.
+
+`ModelRouter` is an agents `Model` that forwards each call to one of its
+endpoints, fastest healthy one first (by a moving average of time to first
+token). If the first streamed event has not arrived after
+`LLM_HEDGE_AFTER_SECONDS`, the same request is also sent to the next
+endpoint; whichever stream produces its first event first is used and the
+other is cancelled. A failure before the first event falls back to the next
+endpoint at once. Endpoints that fail `LLM_CIRCUIT_FAILURES` times in a row
+are skipped for `LLM_CIRCUIT_OPEN_SECONDS`, then given one trial request.
+
+Endpoints are plain `Model`s, so tests can route between local stubs with
+controlled latency: `agent.clone(model=ModelRouter([ModelEndpoint("slow", stub), ...]))`.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional
+
+from agents.models.interface import Model
+
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+log = logging.getLogger(__name__)
+
+LLM_REQUESTS = registry.counter("agent_model_requests_total", "Model requests by endpoint and outcome", ("endpoint", "outcome"))
+LLM_TTFT = registry.histogram("agent_model_first_event_seconds", "Time to the first streamed event per endpoint", ("endpoint",))
+LLM_HEDGES = registry.counter("agent_model_hedges_total", "Hedged model requests by which endpoint won", ("result",))
+LLM_CIRCUIT_OPEN = registry.gauge("agent_model_circuit_open", "1 while an endpoint's circuit is open", ("endpoint",))
+
+_DONE = object()
+
+
+class NoHealthyEndpoint(RuntimeError):
+    pass
+
+
+@dataclass
+class ModelEndpoint:
+    name: str
+    model: Model
+    # moving average of time to first event, None until the first success
+    ttft: Optional[float] = None
+    requests: int = 0
+    errors: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    trial_running: bool = False
+
+    def available(self, now: float) -> bool:
+        if self.open_until <= 0:
+            return True
+        # half-open: one trial request once the open period is over
+        return now >= self.open_until and not self.trial_running
+
+    def stats(self) -> dict:
+        return {
+            "endpoint": self.name,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ttft_seconds": round(self.ttft, 3) if self.ttft is not None else None,
+            "circuit": "closed" if self.open_until <= 0 else ("open" if time.monotonic() < self.open_until else "half_open"),
+        }
+
+
+class _Attempt:
+    """One streamed request to one endpoint, pumped into a queue by a task."""
+
+    def __init__(self, endpoint: ModelEndpoint, args: tuple, kwargs: dict, hedged: bool):
+        self.endpoint = endpoint
+        self.hedged = hedged
+        self.started = time.perf_counter()
+        # resolves to None on the first event, or to the exception if it failed before one
+        self.first: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(args, kwargs))
+
+    async def _pump(self, args: tuple, kwargs: dict) -> None:
+        stream = self.endpoint.model.stream_response(*args, **kwargs)
+        try:
+            async for event in stream:
+                if not self.first.done():
+                    self.first.set_result(None)
+                await self.queue.put(event)
+            if not self.first.done():
+                self.first.set_result(None)
+            await self.queue.put(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not self.first.done():
+                self.first.set_result(e)
+            else:
+                await self.queue.put(e)
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class ModelRouter(Model):
+
+    def __init__(
+        self,
+        endpoints: List[ModelEndpoint],
+        hedge_after: Optional[float] = None,
+        circuit_failures: Optional[int] = None,
+        circuit_open_seconds: Optional[float] = None,
+    ):
+        if not endpoints:
+            raise ValueError("ModelRouter needs at least one endpoint")
+        self.endpoints = endpoints
+        self.hedge_after = config.LLM_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+        self.circuit_failures = circuit_failures or config.LLM_CIRCUIT_FAILURES
+        self.circuit_open_seconds = config.LLM_CIRCUIT_OPEN_SECONDS if circuit_open_seconds is None else circuit_open_seconds
+
+    def stats(self) -> List[dict]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def _ranked(self) -> List[ModelEndpoint]:
+        """Available endpoints, fastest first; unmeasured ones follow in configured order."""
+        now = time.monotonic()
+        available = [e for e in self.endpoints if e.available(now)]
+        if not available:
+            # everything is open: try whichever reopens first rather than failing outright
+            available = [min(self.endpoints, key=lambda e: e.open_until)]
+        return sorted(available, key=lambda e: (e.ttft is None, e.ttft or 0.0))
+
+    def _claim(self, endpoint: ModelEndpoint) -> None:
+        endpoint.requests += 1
+        if endpoint.open_until > 0:
+            endpoint.trial_running = True
+
+    def _succeeded(self, endpoint: ModelEndpoint, ttft: float) -> None:
+        endpoint.ttft = ttft if endpoint.ttft is None else endpoint.ttft + 0.2 * (ttft - endpoint.ttft)
+        endpoint.consecutive_failures = 0
+        endpoint.trial_running = False
+        if endpoint.open_until > 0:
+            endpoint.open_until = 0.0
+            if config.METRICS_ENABLED:
+                LLM_CIRCUIT_OPEN.set(0, endpoint=endpoint.name)
+        if config.METRICS_ENABLED:
+            LLM_TTFT.observe(ttft, endpoint=endpoint.name)
+
+    def _failed(self, endpoint: ModelEndpoint, error: BaseException) -> None:
+        endpoint.errors += 1
+        endpoint.consecutive_failures += 1
+        endpoint.trial_running = False
+        if endpoint.open_until > 0 or endpoint.consecutive_failures >= self.circuit_failures:
+            endpoint.open_until = time.monotonic() + self.circuit_open_seconds
+            log.warning("model endpoint %s circuit open for %ss: %s", endpoint.name, self.circuit_open_seconds, error)
+            if config.METRICS_ENABLED:
+                LLM_CIRCUIT_OPEN.set(1, endpoint=endpoint.name)
+        if config.METRICS_ENABLED:
+            LLM_REQUESTS.inc(endpoint=endpoint.name, outcome="error")
+
+    def _released(self, endpoint: ModelEndpoint, outcome: str) -> None:
+        # a cancelled request says nothing about the endpoint's health
+        endpoint.trial_running = False
+        if config.METRICS_ENABLED:
+            LLM_REQUESTS.inc(endpoint=endpoint.name, outcome=outcome)
+
+    async def _first_stream(self, args: tuple, kwargs: dict) -> _Attempt:
+        """Start streams (hedging and falling back as needed) until one yields an event."""
+        candidates = self._ranked()
+        live: List[_Attempt] = []
+        last_error: Optional[BaseException] = None
+        loop = asyncio.get_running_loop()
+        hedge_at = None
+        hedged_any = False
+
+        def start(hedged: bool) -> None:
+            nonlocal hedge_at, hedged_any
+            hedged_any = hedged_any or hedged
+            endpoint = candidates.pop(0)
+            self._claim(endpoint)
+            live.append(_Attempt(endpoint, args, kwargs, hedged))
+            hedge_at = loop.time() + self.hedge_after if self.hedge_after > 0 else None
+
+        try:
+            start(hedged=False)
+            while True:
+                timeout = None
+                if candidates and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - loop.time())
+                done, _ = await asyncio.wait([a.first for a in live], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    start(hedged=True)
+                    continue
+
+                for attempt in [a for a in live if a.first.done()]:
+                    error = attempt.first.result()
+                    if error is None:
+                        live.remove(attempt)
+                        self._succeeded(attempt.endpoint, time.perf_counter() - attempt.started)
+                        if config.METRICS_ENABLED and hedged_any:
+                            LLM_HEDGES.inc(result="hedge" if attempt.hedged else "primary")
+                        return attempt
+                    live.remove(attempt)
+                    last_error = error
+                    self._failed(attempt.endpoint, error)
+
+                if not live:
+                    if not candidates:
+                        raise last_error
+                    # fall back straight away instead of waiting for the hedge timer
+                    start(hedged=False)
+        finally:
+            for attempt in live:
+                attempt.task.cancel()
+                self._released(attempt.endpoint, "cancelled")
+
+    def stream_response(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        return self._stream(args, kwargs)
+
+    async def _stream(self, args: tuple, kwargs: dict) -> AsyncIterator[Any]:
+        attempt = await self._first_stream(args, kwargs)
+        outcome = "cancelled"
+        try:
+            while True:
+                item = await attempt.queue.get()
+                if item is _DONE:
+                    outcome = "ok"
+                    return
+                if isinstance(item, BaseException):
+                    # tokens were already sent, so there is nothing to fall back to
+                    outcome = "error"
+                    self._failed(attempt.endpoint, item)
+                    raise item
+                yield item
+        finally:
+            attempt.task.cancel()
+            if outcome != "error":
+                self._released(attempt.endpoint, outcome)
+
+    async def get_response(self, *args: Any, **kwargs: Any) -> Any:
+        """Non-streamed call: hedged and falling back the same way, on the whole response."""
+        candidates = self._ranked()
+        running: dict[asyncio.Task, tuple[ModelEndpoint, float]] = {}
+        last_error: Optional[BaseException] = None
+
+        def start() -> None:
+            endpoint = candidates.pop(0)
+            self._claim(endpoint)
+            task = asyncio.create_task(endpoint.model.get_response(*args, **kwargs))
+            running[task] = (endpoint, time.perf_counter())
+
+        try:
+            start()
+            while running:
+                timeout = self.hedge_after if candidates and self.hedge_after > 0 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    start()
+                    continue
+                for task in done:
+                    endpoint, started = running.pop(task)
+                    if task.exception() is None:
+                        self._succeeded(endpoint, time.perf_counter() - started)
+                        self._released(endpoint, "ok")
+                        return task.result()
+                    last_error = task.exception()
+                    self._failed(endpoint, last_error)
+                if not running and candidates:
+                    start()
+            raise last_error or NoHealthyEndpoint("no model endpoint available")
+        finally:
+            for task, (endpoint, _) in running.items():
+                task.cancel()
+                self._released(endpoint, "cancelled")
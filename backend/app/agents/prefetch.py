@@ -0,0 +1,40 @@
+import json
+from datetime import datetime, timezone
+from backend.app.db.main import async_session
+from backend.app.services.order_service import order_service
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.menu_index import compact_table, compact_cart, MENU_COLUMNS
+from backend.app.observability.metrics import span
+from backend.config import config
+
+orderservice = order_service()
+
+
+def _dump(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+async def build_turn_snapshot(username: str, restaurant_id: int = DEFAULT_RESTAURANT_ID, include_cart: bool = True) -> str:
+    """Load the menu (from the process cache) and the user's committed cart for this turn.
+
+    The result is a compact text block appended to the instructions so the
+    model can usually answer without calling get_menu or get_cart first.
+    Large menus are summarised; the model can still use find_menu_item.
+    Turns whose answer may be cached for other users leave out the cart.
+    """
+    with span("prefetch"):
+        async with async_session() as session:
+            snap = await orderservice.get_menu_snapshot(session, restaurant_id)
+            # the cart is read from Postgres: REST workers write carts, and the
+            # agent worker's hot copy may not have seen their changes
+            cart = await orderservice.get_cart(username, session, restaurant_id, from_db=True) if include_cart else None
+
+    taken_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    lines = [f"Snapshot taken at {taken_at} (menu version {snap.version}). It is not updated by tool calls made during this turn."]
+    if len(snap.rows) <= config.PREFETCH_MENU_MAX_ITEMS:
+        lines.append("menu: " + _dump(compact_table(snap.rows, MENU_COLUMNS)))
+    else:
+        lines.append(f"menu: {len(snap.rows)} items, too many to list; use find_menu_item to look items up.")
+    if include_cart:
+        lines.append("cart: " + _dump(compact_cart(cart)))
+    return "\n".join(lines)
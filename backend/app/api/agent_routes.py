@@ -0,0 +1,32 @@
+from fastapi import APIRouter, status, Request, Depends, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from backend.app.api.tenancy import get_restaurant_id
+from backend.app.api.chat_socket import serve_chat_socket
+
+router = APIRouter()
+
+
+class UserMessage(BaseModel):
+    message: str
+
+
+@router.post('/message', status_code= status.HTTP_200_OK)
+async def response_message( username: str, inp: UserMessage, request: Request, restaurant_id: int = Depends(get_restaurant_id)) -> dict:
+    # imported on first use so REST-only workers never load the agent stack
+    from backend.app.agents.main import agent_stream_generator
+
+    return StreamingResponse(
+        # the generator polls for a disconnect and cancels the agent run
+        agent_stream_generator(inp.message, username, is_disconnected= request.is_disconnected, restaurant_id= restaurant_id),
+        # Crucially, set the correct media type for a text stream
+        media_type="text/plain" 
+        # Note: If you wanted full SSE, you'd use 'text/event-stream' 
+        # and format the yield output as 'data: <token>\n\n'
+    )
+
+
+@router.websocket('/ws')
+async def chat_socket(websocket: WebSocket):
+    """Persistent chat channel: auth once, then messages, deltas, tool progress and order updates."""
+    await serve_chat_socket(websocket)
@@ -0,0 +1,249 @@
+"""One WebSocket per chat session, carrying every turn and order update.
+
+Frames are JSON text objects with a "type"; a binary frame gets an error
+frame back (or closes the socket with 1003 in place of the auth frame).
+The client authenticates once, with the token from /login, then sends
+messages and cancels by id:
+
+    -> {"type": "auth", "token": "...", "restaurant_id": 1}
+    <- {"type": "ready", "username": "...", "restaurant_id": 1}
+    -> {"type": "message", "id": "m1", "text": "add 2 burgers"}
+    <- {"type": "accepted", "id": "m1"}
+    <- {"type": "tool", "id": "m1", "call_id": "...", "name": "apply_cart_changes", "status": "started"}
+    <- {"type": "delta", "id": "m1", "text": "Added "}
+    <- {"type": "done", "id": "m1", "outcome": "completed"}
+    -> {"type": "cancel", "id": "m2"}
+    <- {"type": "order", "order_id": 7, "status": "ready"}
+
+Turns of one connection run one at a time, in the order they were sent,
+since they share a conversation history; later messages wait their turn
+and can be cancelled before they start. Order updates are found by polling
+the statuses of the user's orders from the last WS_ORDER_WINDOW_HOURS every
+WS_ORDER_POLL_SECONDS.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from backend.app.db.main import async_session
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.order_service import order_service
+from backend.app.services.restaurant_service import restaurant_service
+from backend.app.services.user_service import user_service
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+WS_CONNECTIONS = registry.gauge("chat_ws_connections", "Open chat WebSocket connections")
+WS_FRAMES = registry.counter("chat_ws_frames_total", "Chat WebSocket frames by direction and type", ("direction", "type"))
+
+log = logging.getLogger(__name__)
+
+orderservice = order_service()
+restaurantservice = restaurant_service()
+userservice = user_service()
+
+
+class BinaryFrame(ValueError):
+    pass
+
+
+async def _receive_json(websocket: WebSocket) -> Any:
+    """The next frame parsed as JSON; raises BinaryFrame for binary frames
+    (which `receive_text` would fail on with KeyError) and ValueError for invalid JSON.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE), message.get("reason"))
+    if message.get("text") is None:
+        raise BinaryFrame("binary frame")
+    return json.loads(message["text"])
+
+
+class ChatConnection:
+
+    def __init__(self, websocket: WebSocket, username: str, restaurant_id: int):
+        self.websocket = websocket
+        self.username = username
+        self.restaurant_id = restaurant_id
+        self.outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.inbox: "asyncio.Queue[tuple[str, str]]" = asyncio.Queue()
+        # ids cancelled while still waiting in the inbox
+        self.cancelled: set[str] = set()
+        self.current_id: Optional[str] = None
+        self.current_turn: Optional[asyncio.Task] = None
+
+    def send(self, frame: Dict[str, Any]) -> None:
+        # a single writer task owns the socket, so frames from turns,
+        # notifications and the reader never interleave mid-send
+        self.outbox.put_nowait(frame)
+
+    async def _writer(self) -> None:
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_json(frame)
+            if config.METRICS_ENABLED:
+                WS_FRAMES.inc(direction="out", type=frame["type"])
+
+    async def _reader(self) -> None:
+        while True:
+            try:
+                frame = await _receive_json(self.websocket)
+            except BinaryFrame:
+                if config.METRICS_ENABLED:
+                    WS_FRAMES.inc(direction="in", type="other")
+                self.send({"type": "error", "detail": "binary frames are not supported, send JSON text"})
+                continue
+            except ValueError:
+                frame = None
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if config.METRICS_ENABLED:
+                WS_FRAMES.inc(direction="in", type=kind if kind in ("message", "cancel", "ping") else "other")
+            if kind == "message":
+                msg_id = str(frame.get("id") or uuid.uuid4())
+                text = frame.get("text")
+                if not isinstance(text, str) or not text.strip():
+                    self.send({"type": "error", "id": msg_id, "detail": "message text is required"})
+                elif self.inbox.qsize() >= config.WS_MAX_PENDING_MESSAGES:
+                    self.send({"type": "error", "id": msg_id, "detail": "too many messages waiting, try again shortly"})
+                else:
+                    self.inbox.put_nowait((msg_id, text))
+                    self.send({"type": "accepted", "id": msg_id})
+            elif kind == "cancel":
+                self._cancel(str(frame.get("id")))
+            elif kind == "ping":
+                self.send({"type": "pong"})
+            elif frame is None:
+                self.send({"type": "error", "detail": "frames must be JSON objects"})
+            else:
+                self.send({"type": "error", "detail": f"unknown frame type {kind!r}"})
+
+    def _cancel(self, msg_id: str) -> None:
+        if msg_id == self.current_id and self.current_turn is not None:
+            self.current_turn.cancel()
+        else:
+            self.cancelled.add(msg_id)
+
+    async def _turns(self) -> None:
+        while True:
+            msg_id, text = await self.inbox.get()
+            if msg_id in self.cancelled:
+                self.cancelled.discard(msg_id)
+                self.send({"type": "done", "id": msg_id, "outcome": "cancelled"})
+                continue
+            self.current_id = msg_id
+            self.current_turn = asyncio.create_task(self._turn(msg_id, text))
+            try:
+                # wait() rather than await, so cancelling the turn doesn't cancel this loop
+                await asyncio.wait([self.current_turn])
+            finally:
+                if not self.current_turn.done():
+                    self.current_turn.cancel()
+                self.current_id = self.current_turn = None
+
+    async def _turn(self, msg_id: str, text: str) -> None:
+        # imported on first use so REST-only workers never load the agent stack
+        from backend.app.agents.main import agent_stream_generator
+
+        def on_tool_event(call_id: str, name: str, state: str) -> None:
+            self.send({"type": "tool", "id": msg_id, "call_id": call_id, "name": name, "status": state})
+
+        try:
+            async for delta in agent_stream_generator(
+                text, self.username, restaurant_id=self.restaurant_id, on_tool_event=on_tool_event,
+            ):
+                self.send({"type": "delta", "id": msg_id, "text": delta})
+        except asyncio.CancelledError:
+            # the generator has already stopped the run and saved the partial reply
+            self.send({"type": "done", "id": msg_id, "outcome": "cancelled"})
+            raise
+        except Exception as e:
+            log.exception("chat turn %s for %s failed: %s", msg_id, self.username, e)
+            self.send({"type": "error", "id": msg_id, "detail": "the assistant failed to answer, please try again"})
+            return
+        self.send({"type": "done", "id": msg_id, "outcome": "completed"})
+
+    async def _order_updates(self) -> None:
+        seen: Optional[Dict[int, str]] = None
+        while True:
+            try:
+                since = datetime.utcnow() - timedelta(hours=config.WS_ORDER_WINDOW_HOURS)
+                async with async_session() as session:
+                    current = await orderservice.get_recent_order_statuses(self.username, since, session, self.restaurant_id)
+            except Exception as e:
+                log.warning("order status poll for %s failed: %s", self.username, e)
+                current = None
+            if current is not None:
+                if seen is not None:
+                    # orders that aged out of the window just drop from the list
+                    for order_id, order_status in current.items():
+                        if seen.get(order_id) != order_status:
+                            self.send({"type": "order", "order_id": order_id, "status": order_status})
+                seen = current
+            await asyncio.sleep(config.WS_ORDER_POLL_SECONDS)
+
+    async def run(self) -> None:
+        """Serve the connection until the client disconnects, then cancel whatever is left."""
+        tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._turns())]
+        if config.WS_ORDER_POLL_SECONDS > 0:
+            tasks.append(asyncio.create_task(self._order_updates()))
+        try:
+            await self._reader()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self.current_turn is not None:
+                # let the turn stop its run and save the partial reply before we return
+                tasks.append(self.current_turn)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[tuple[str, int]]:
+    """Read the auth frame; returns (username, restaurant_id) or None after closing the socket."""
+    try:
+        frame = await asyncio.wait_for(_receive_json(websocket), timeout=config.WS_AUTH_TIMEOUT_SECONDS)
+    except BinaryFrame:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="frames must be JSON text")
+        return None
+    except (asyncio.TimeoutError, ValueError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="send an auth frame first")
+        return None
+    username = None
+    if isinstance(frame, dict) and frame.get("type") == "auth" and isinstance(frame.get("token"), str):
+        username = userservice.verify_token(frame["token"])
+    if not username:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="invalid or expired token")
+        return None
+
+    restaurant_id = frame.get("restaurant_id", DEFAULT_RESTAURANT_ID)
+    async with async_session() as session:
+        known = isinstance(restaurant_id, int) and await restaurantservice.exists(restaurant_id, session)
+    if not known:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=f"restaurant {restaurant_id} not found")
+        return None
+    return username, restaurant_id
+
+
+async def serve_chat_socket(websocket: WebSocket) -> None:
+    await websocket.accept()
+    try:
+        auth = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if auth is None:
+        return
+    username, restaurant_id = auth
+    await websocket.send_json({"type": "ready", "username": username, "restaurant_id": restaurant_id})
+    if config.METRICS_ENABLED:
+        WS_CONNECTIONS.inc()
+    try:
+        await ChatConnection(websocket, username, restaurant_id).run()
+    finally:
+        if config.METRICS_ENABLED:
+            WS_CONNECTIONS.dec()
@@ -0,0 +1,97 @@
+"""Conditional GET and compression for the most-polled read routes.
+
+Routes build a weak ETag from a cheap version number they already have
+(menu version, cart revision, history cursor) and hand the body over as a
+callable, so a matching `If-None-Match` returns 304 without serialising
+anything. Full bodies above `COMPRESS_MIN_BYTES` are brotli- or
+gzip-compressed depending on `Accept-Encoding`.
+"""
+import gzip
+import inspect
+from typing import Any, Callable
+
+from fastapi import Request, Response, status
+
+from backend.app.api.json_response import dumps
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+CONDITIONAL_GETS = registry.counter("http_conditional_gets_total", "Cacheable GET responses by outcome", ("route", "outcome"))
+COMPRESSED_BYTES = registry.counter("http_compressed_bytes_total", "Response bytes before and after compression", ("encoding", "stage"))
+
+
+def weak_etag(*parts: Any) -> str:
+    return 'W/"' + "-".join(str(p) for p in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against every tag in If-None-Match, as RFC 9110 asks for GETs."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def _accepted_encoding(request: Request) -> str | None:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        q = params.strip().removeprefix("q=") if params.strip().startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(name.strip().lower())
+        except ValueError:
+            continue
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(request: Request, body: bytes) -> tuple[bytes, str | None]:
+    if len(body) < config.COMPRESS_MIN_BYTES:
+        return body, None
+    encoding = _accepted_encoding(request)
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=config.COMPRESS_LEVEL_BR)
+    elif encoding == "gzip":
+        compressed = gzip.compress(body, compresslevel=config.COMPRESS_LEVEL_GZIP)
+    else:
+        return body, None
+    if config.METRICS_ENABLED:
+        COMPRESSED_BYTES.inc(len(body), encoding=encoding, stage="raw")
+        COMPRESSED_BYTES.inc(len(compressed), encoding=encoding, stage="sent")
+    return compressed, encoding
+
+
+async def conditional_json(request: Request, etag: str, build: Callable[[], Any]) -> Response:
+    """Return 304 if the client already has `etag`, else the (compressed) JSON from `build()`.
+
+    `build` may be sync or async; it is only called when a body is needed.
+    """
+    route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request, etag):
+        if config.METRICS_ENABLED:
+            CONDITIONAL_GETS.inc(route=route, outcome="not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    content = build()
+    if inspect.isawaitable(content):
+        content = await content
+    body = dumps(content)
+    body, encoding = compress_body(request, body)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if config.METRICS_ENABLED:
+        CONDITIONAL_GETS.inc(route=route, outcome="full")
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,52 @@
+"""orjson-backed JSON responses.
+
+Routes that already hold plain dicts/lists/tuples return `FastJSONResponse`
+directly, which skips FastAPI's `jsonable_encoder` walk and the stdlib
+encoder. orjson is a dependency, but the stdlib path is kept as a fallback
+and both produce the same bytes: tuples become arrays and named tuples
+(rows) become objects.
+"""
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if hasattr(value, "_asdict"):
+        return value._asdict()
+    return jsonable_encoder(value)
+
+
+def _plain(value: Any) -> Any:
+    # jsonable_encoder (like the json module) would write named tuples as
+    # arrays, while orjson hands them to `_default`; convert them first
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if hasattr(value, "_asdict"):
+            return _plain(value._asdict())
+        return [_plain(item) for item in value]
+    if isinstance(value, BaseModel):
+        return _plain(value.model_dump())
+    return value
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(_plain(content)), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+from dataclasses import asdict
+from typing import Optional
+from fastapi import APIRouter, status, Depends, HTTPException, Header, Request
 from fastapi.responses import StreamingResponse
-from backend.app.db.schemas import user, token, menu, order, order_item, CreateOrderRequest, CartItemCreate
+from backend.app.db.schemas import user, token, menu, order, order_item, CreateOrderRequest, CartItemCreate, CartOp
 from sqlmodel.ext.asyncio.session import AsyncSession
 from backend.app.db.main import get_session
 from backend.app.services.order_service import order_service
+from backend.app.services.menu_index import compact_table, compact_cart, MENU_COLUMNS, POPULAR_COLUMNS, USUAL_COLUMNS
+from backend.app.services.idempotency_service import run_idempotent, idempotency_scope
+from backend.app.services.menu_bulk_service import menu_bulk_service, FORMATS
+from backend.app.services.dispatch_service import dispatch_service, worker_id
+from backend.app.api.http_cache import conditional_json, weak_etag
+from backend.app.api.json_response import FastJSONResponse
+from backend.app.api.tenancy import get_restaurant_id, restaurantservice
+from backend.app.observability.query_stats import query_budget
 
-from backend.app.agents.main import agent_stream_generator
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
@@ -13,79 +22,240 @@ from pydantic import BaseModel
 
 router = APIRouter()
 orderservice = order_service()
+menubulkservice = menu_bulk_service()
+dispatchservice = dispatch_service(worker_id())
 
-@router.get('/menu', status_code= status.HTTP_200_OK)
-async def get_menu(session: AsyncSession = Depends(get_session)):
-    menu = await orderservice.get_menu(session)
-    if not menu:
+
+class RestaurantCreate(BaseModel):
+    name: str
+
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+
+
+# query budgets are worst cases: this process has cached nothing yet (menu,
+# cart copy, popularity, known restaurants) and the restaurant is named explicitly
+@router.get('/restaurants', status_code= status.HTTP_200_OK, dependencies=[Depends(query_budget(1))])
+async def list_restaurants(session: AsyncSession = Depends(get_session)):
+    return FastJSONResponse(await restaurantservice.list_restaurants(session))
+
+@router.post('/restaurants', status_code= status.HTTP_201_CREATED, dependencies=[Depends(query_budget(4))])
+async def create_restaurant(data: RestaurantCreate, session: AsyncSession = Depends(get_session)):
+    """Create a restaurant (tenant) with an empty menu; pass its id as `X-Restaurant-Id` afterwards."""
+    return await restaurantservice.create_restaurant(data.name, session)
+
+@router.get('/menu', status_code= status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def get_menu(request: Request, format: str = "json", restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Return the menu; `format=compact` returns a column header plus value rows.
+
+    The ETag is the restaurant's menu version, so pollers get 304 until the menu changes.
+    """
+    snap = await orderservice.get_menu_snapshot(session, restaurant_id)
+    if not snap.rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The menu is currently empty. Please check back later."
         )
-        
-    return menu
 
-@router.post('/menu', status_code= status.HTTP_201_CREATED)
-async def create_menu_item(item_data: menu, session: AsyncSession = Depends(get_session)):
-    new_item = await orderservice.create_menu_item(item_data, session)
+    def build():
+        if format == "compact":
+            return compact_table(snap.rows, MENU_COLUMNS)
+        return [row._asdict() for row in snap.rows]
+
+    return await conditional_json(request, weak_etag("menu", restaurant_id, snap.version, format), build)
+
+@router.get('/menu/search', status_code= status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def search_menu(q: str, limit: int = 5, restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Return the best matching menu items for a (possibly misspelled) name."""
+    matches = await orderservice.search_menu(q, session, limit=max(1, min(limit, 20)), restaurant_id=restaurant_id)
+    return FastJSONResponse(compact_table(matches, MENU_COLUMNS))
+
+@router.post('/menu/import', status_code= status.HTTP_200_OK)
+async def import_menu(request: Request, format: Optional[str] = None, atomic: bool = False, restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Bulk create/update menu items from a streamed CSV or NDJSON body, keyed on item_code.
+
+    Invalid rows are skipped and listed in the report (first MENU_IMPORT_MAX_ERRORS);
+    with `atomic=true` any invalid row cancels the whole import. The menu
+    version is bumped once.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    try:
+        report = await menubulkservice.import_menu(request.stream(), fmt, session, atomic= atomic, restaurant_id= restaurant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return FastJSONResponse(
+        asdict(report),
+        status_code=status.HTTP_200_OK if report.applied else status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+@router.get('/menu/export', status_code= status.HTTP_200_OK)
+async def export_menu(format: str = "csv", restaurant_id: int = Depends(get_restaurant_id)):
+    """Stream the whole menu as CSV or NDJSON in the import format (plus item_id)."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"format must be one of {', '.join(FORMATS)}")
+    return StreamingResponse(
+        menubulkservice.export_menu(format, restaurant_id),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="menu.{format}"'},
+    )
+
+@router.post('/menu', status_code= status.HTTP_201_CREATED, dependencies=[Depends(query_budget(4))])
+async def create_menu_item(item_data: menu, restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    new_item = await orderservice.create_menu_item(item_data, session, restaurant_id)
     return new_item
 
 
 
 
-@router.post('/orders', status_code=status.HTTP_201_CREATED)
-async def create_order(req: CreateOrderRequest, session: AsyncSession = Depends(get_session)):
+@router.post('/orders', status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_budget(7))])
+async def create_order(req: CreateOrderRequest, idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Create an order and its items using a single request body containing order and items."""
-    result = await orderservice.create_order(req.order, req.items, session)
-    return result
+    async def handler():
+        try:
+            return await orderservice.create_order(req.order, req.items, session, restaurant_id)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-@router.post('/orders_cart', status_code=status.HTTP_201_CREATED)
-async def create_order_from_cart(username: str, session: AsyncSession = Depends(get_session)):
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("orders", restaurant_id, req.order.username), {"restaurant_id": restaurant_id, "request": req}, session,
+        handler, status_code=status.HTTP_201_CREATED,
+    )
+
+@router.post('/orders_cart', status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_budget(8))])
+async def create_order_from_cart(username: str, idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Create an order from the user's cart items."""
-    result = await orderservice.create_order_from_cart(username, session)
-    return result
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("orders_cart", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id}, session,
+        lambda: orderservice.create_order_from_cart(username, session, restaurant_id),
+        status_code=status.HTTP_201_CREATED,
+    )
 
 
-@router.get('/orders', status_code=status.HTTP_200_OK)
-async def get_most_recent_order(username: str, session: AsyncSession = Depends(get_session)):
+@router.get('/orders', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def get_most_recent_order(username: str, restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Return the most recent order for the given username (no status filtering)."""
-    order_obj = await orderservice.get_most_recent_order(username, session)
-    if not order_obj:
-        return {}
-    return order_obj
+    order_obj = await orderservice.get_most_recent_order(username, session, restaurant_id)
+    return FastJSONResponse(order_obj or {})
+
 
+@router.get('/kitchen', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def get_kitchen_queue(restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Return the orders the dispatcher handed to the kitchen ("preparing"), oldest claim first."""
+    return FastJSONResponse(await dispatchservice.kitchen_queue(session, restaurant_id))
 
 
+@router.post('/orders/{order_id}/status', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def update_order_status(order_id: int, data: OrderStatusUpdate, restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Record the kitchen's progress on an order ("preparing" -> "ready" -> "completed").
 
-@router.post('/cartitems', status_code=status.HTTP_201_CREATED)
-async def add_cart_item( username: str, cart_items: list[CartItemCreate], session: AsyncSession = Depends(get_session)):
+    Repeating a report that was already applied is a no-op; any other
+    status change out of order returns 409.
+    """
+    try:
+        moved = await dispatchservice.advance(order_id, data.status, session, restaurant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not moved:
+        current = await dispatchservice.status_of(order_id, session, restaurant_id)
+        if current is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Order {order_id} not found.")
+        if current != data.status:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Order {order_id} is {current!r}.")
+    return {"order_id": order_id, "status": data.status}
+
+
+@router.get('/recommendations', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(5))])
+async def get_recommendations(username: str, limit: int = 5, format: str = "json", restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Return what is popular lately and the user's usual items, from precomputed counters."""
+    recommendations = await orderservice.get_recommendations(username, session, limit=max(1, min(limit, 20)), restaurant_id=restaurant_id)
+    if format == "compact":
+        recommendations = {
+            "popular": compact_table(recommendations["popular"], POPULAR_COLUMNS),
+            "usual": compact_table(recommendations["usual"], USUAL_COLUMNS),
+        }
+    return FastJSONResponse(recommendations)
+
+
+
+
+@router.post('/cartitems', status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_budget(6))])
+async def add_cart_item( username: str, cart_items: list[CartItemCreate], format: str = "json", idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Add an item to the cart for the given username."""
     items_as_dicts = [item.model_dump() for item in cart_items]
-    new_cart_items = await orderservice.add_to_cart(username= username, items= items_as_dicts, session= session)
-    return new_cart_items
 
-@router.get('/cartitems', status_code=status.HTTP_200_OK)
-async def get_cart_items(username: str, session: AsyncSession = Depends(get_session)):
-    """Return all cart items for the given username."""
-    cart_items = await orderservice.get_cart(username, session)
-    return cart_items
+    async def handler():
+        new_cart_items = await orderservice.add_to_cart(username= username, items= items_as_dicts, session= session, restaurant_id= restaurant_id)
+        if format == "compact":
+            return compact_table(new_cart_items, ("item_id", "quantity"))
+        return new_cart_items
+
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("cartitems", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id, "items": items_as_dicts, "format": format}, session,
+        handler, status_code=status.HTTP_201_CREATED,
+    )
+
+@router.get('/cartitems', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(5))])
+async def get_cart_items(username: str, request: Request, format: str = "json", restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Return all cart items for the given username; `format=compact` returns a table plus the cart total.
 
-@router.put('/cartitems', status_code=status.HTTP_200_OK)
-async def updatecart( username: str, cart_item: CartItemCreate, session: AsyncSession = Depends(get_session)):
+    The ETag combines the cart revision with the menu version (prices come from the menu).
+    """
+    revision = await orderservice.get_cart_revision(username, session, restaurant_id)
+    snap = await orderservice.get_menu_snapshot(session, restaurant_id)
+
+    async def build():
+        cart_items = await orderservice.get_cart(username, session, restaurant_id)
+        if format == "compact":
+            return compact_cart(cart_items)
+        return cart_items
+
+    return await conditional_json(request, weak_etag("cart", restaurant_id, revision, snap.version, format), build)
+
+@router.post('/cartitems/apply', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(7))])
+async def apply_cart_changes( username: str, ops: list[CartOp], format: str = "json", idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
+    """Apply add/set/remove operations atomically and return the resulting priced cart."""
+    async def handler():
+        try:
+            cart_items = await orderservice.apply_cart_changes(username= username, ops= ops, session= session, restaurant_id= restaurant_id)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if format == "compact":
+            return compact_cart(cart_items)
+        return cart_items
+
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("cartitems_apply", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id, "ops": ops, "format": format}, session, handler,
+    )
+
+@router.put('/cartitems', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(4))])
+async def updatecart( username: str, cart_item: CartItemCreate, idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Update an item in the cart for the given username."""
-    updated_item = await orderservice.update_cart(username= username, item_id= cart_item.item_id, quantity= cart_item.quantity, session= session)
-    return updated_item
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("cartitems_update", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id, "item": cart_item}, session,
+        lambda: orderservice.update_cart(username= username, item_id= cart_item.item_id, quantity= cart_item.quantity, session= session, restaurant_id= restaurant_id),
+    )
 
-@router.delete('/cartitem', status_code=status.HTTP_200_OK)
-async def delete_cart_item( username: str, item_id: int, session: AsyncSession = Depends(get_session)):
+@router.delete('/cartitem', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(4))])
+async def delete_cart_item( username: str, item_id: int, idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Delete a specific cart item for the given username."""
-    await orderservice.delete_cart_item(username= username, item_id= item_id, session= session)
-    return {"detail": f"Cart item {item_id} deleted successfully."}
+    async def handler():
+        await orderservice.delete_cart_item(username= username, item_id= item_id, session= session, restaurant_id= restaurant_id)
+        return {"detail": f"Cart item {item_id} deleted successfully."}
+
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("cartitem_delete", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id, "item_id": item_id}, session, handler,
+    )
 
-@router.delete('/cartitems', status_code=status.HTTP_200_OK)
-async def delete_cart( username: str, session: AsyncSession = Depends(get_session)):
+@router.delete('/cartitems', status_code=status.HTTP_200_OK, dependencies=[Depends(query_budget(4))])
+async def delete_cart( username: str, idempotency_key: Optional[str] = Header(None), restaurant_id: int = Depends(get_restaurant_id), session: AsyncSession = Depends(get_session)):
     """Delete all cart items for the given username."""
-    await orderservice.delete_cart(username= username, session= session)
-    return {"detail": "Cart cleared successfully."}
+    async def handler():
+        await orderservice.delete_cart(username= username, session= session, restaurant_id= restaurant_id)
+        return {"detail": "Cart cleared successfully."}
+
+    return await run_idempotent(
+        idempotency_key, idempotency_scope("cartitems_delete", restaurant_id, username), {"username": username, "restaurant_id": restaurant_id}, session, handler,
+    )
 
 
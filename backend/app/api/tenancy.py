@@ -0,0 +1,28 @@
+"""Picks the restaurant (tenant) a request is for.
+
+Clients name it with an `X-Restaurant-Id` header or a `restaurant_id` query
+parameter; requests without one go to the default restaurant, so
+single-location clients need no change. Everything downstream (menu
+snapshot, cart, orders) is then scoped to that restaurant.
+"""
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from backend.app.db.main import get_session
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.restaurant_service import restaurant_service
+
+restaurantservice = restaurant_service()
+
+
+async def get_restaurant_id(
+    restaurant_id: Optional[int] = None,
+    x_restaurant_id: Optional[int] = Header(None),
+    session: AsyncSession = Depends(get_session),
+) -> int:
+    chosen = restaurant_id if restaurant_id is not None else x_restaurant_id
+    if chosen is None:
+        return DEFAULT_RESTAURANT_ID
+    if not await restaurantservice.exists(chosen, session):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Restaurant {chosen} not found.")
+    return chosen
@@ -1,25 +1,24 @@
-from fastapi import APIRouter, status, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, status, Depends, HTTPException, Request
 from backend.app.db.schemas import user, token
 from sqlmodel.ext.asyncio.session import AsyncSession
 from backend.app.db.main import get_session
 from backend.app.services.user_service import user_service
-from backend.app.agents.main import agent_stream_generator
+from backend.app.observability.query_stats import query_budget
+from backend.app.api.http_cache import conditional_json, weak_etag
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
 
 router = APIRouter()
 userservice = user_service()
 
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="/login")
 
-@router.post('/register', status_code= status.HTTP_201_CREATED, response_model= user)
+@router.post('/register', status_code= status.HTTP_201_CREATED, response_model= user, dependencies=[Depends(query_budget(2))])
 async def register_user(user_data: user, session: AsyncSession = Depends(get_session)) -> dict:
     new_user = await userservice.create_user(user_data, session)
     return new_user
     
 
-@router.post('/login', status_code= status.HTTP_200_OK, response_model= token)
+@router.post('/login', status_code= status.HTTP_200_OK, response_model= token, dependencies=[Depends(query_budget(1))])
 async def verify_login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_session)) -> dict:
     is_verified = await userservice.verify_password(form_data, session)
     if not is_verified:
@@ -27,21 +26,12 @@ async def verify_login(form_data: OAuth2PasswordRequestForm = Depends(), session
     return {"access_token": is_verified, "token_type": "bearer"}
 
 
-class UserMessage(BaseModel):
-    message: str
-
-@router.post('/message', status_code= status.HTTP_200_OK)
-async def response_message( username: str, inp: UserMessage) -> dict:
-    # response = {"message": f"You said: {inp.message}"}
-    return StreamingResponse(
-        agent_stream_generator(inp.message, username),
-        # Crucially, set the correct media type for a text stream
-        media_type="text/plain" 
-        # Note: If you wanted full SSE, you'd use 'text/event-stream' 
-        # and format the yield output as 'data: <token>\n\n'
-    )
-    
-@router.get('/chat', status_code= status.HTTP_200_OK)
-async def get_chat_history( username: str, session: AsyncSession = Depends(get_session)):
-    messages = await userservice.get_chat(username, session)
-    return messages
\ No newline at end of file
+@router.get('/chat', status_code= status.HTTP_200_OK, dependencies=[Depends(query_budget(3))])
+async def get_chat_history( username: str, request: Request, include_archived: bool = True, session: AsyncSession = Depends(get_session)):
+    """Chat history; answers 304 when `If-None-Match` carries the current history cursor."""
+    last_seq, count = await userservice.get_chat_cursor(username, session)
+    etag = weak_etag("chat", last_seq, count, int(include_archived))
+    return await conditional_json(
+        request, etag,
+        lambda: userservice.get_chat(username, session, include_archived= include_archived),
+    )
\ No newline at end of file
@@ -1,35 +1,76 @@
-from sqlmodel import create_engine, text, SQLModel
+from sqlmodel import create_engine, text, select, SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
 from backend.config import config
 from backend.app.db.models.user_model import Users
-from backend.app.db.models.menu_model import Menu
+from backend.app.db.models.restaurant_model import Restaurant, DEFAULT_RESTAURANT_ID, PARTITIONED, PARTITIONED_TABLES
+from backend.app.db.models.menu_model import Menu, MenuVersion
 from backend.app.db.models.order_model import Order
 from backend.app.db.models.orderitems_model import OrderItem
-from backend.app.db.models.conversation_msg_model import ConversationMessage
-from backend.app.db.models.cart_model import CartItem
+from backend.app.db.models.conversation_msg_model import ConversationMessage, ConversationHead
+from backend.app.db.models.conversation_archive_model import ConversationArchive
+from backend.app.db.models.idempotency_model import IdempotencyRecord
+from backend.app.db.models.cart_model import CartItem, CartRevision
+from backend.app.db.models.popularity_model import ItemPopularity, UserItemCount
+from backend.app.observability.query_stats import install_query_hooks
 
 
 
 engine = create_async_engine(
             url= config.DB_URL,
-            echo= True
+            echo= config.DB_ECHO
         )
-    
+install_query_hooks(engine)
+
+
+async def create_partitions(conn, restaurant_id: int):
+    """Create the restaurant's partition of every restaurant-partitioned table (Postgres only)."""
+    if not PARTITIONED:
+        return
+    for table in PARTITIONED_TABLES:
+        await conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{table}_r{int(restaurant_id)}" PARTITION OF "{table}" FOR VALUES IN ({int(restaurant_id)})'
+        ))
+
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
-        
+        # single-location installs keep working without creating a restaurant
+        insert = sqlite.insert if conn.dialect.name == "sqlite" else postgresql.insert
+        await conn.execute(
+            insert(Restaurant).values(restaurant_id=DEFAULT_RESTAURANT_ID, name="default").on_conflict_do_nothing()
+        )
+        if conn.dialect.name == "postgresql":
+            # the default row is inserted with an explicit id, so move the sequence past it
+            await conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('restaurant', 'restaurant_id'), (SELECT max(restaurant_id) FROM restaurant))"
+            ))
+        result = await conn.execute(select(Restaurant.restaurant_id))
+        for restaurant_id in result.scalars().all():
+            await create_partitions(conn, restaurant_id)
+
+
+async_session = sessionmaker(
+    bind= engine,
+    class_ = AsyncSession,
+    expire_on_commit= False
+)
+
+
+def insert_for(session: AsyncSession, model):
+    """INSERT supporting ON CONFLICT for the session's database.
+
+    Postgres in production; SQLite is accepted so the benchmarks can run offline.
+    """
+    if session.bind.dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
 
 async def get_session() -> AsyncSession:
-    session = sessionmaker(
-        bind= engine,
-        class_ = AsyncSession,
-        expire_on_commit= False
-    )
-    
-    async with session() as sess:
-        yield sess
\ No newline at end of file
+    async with async_session() as sess:
+        yield sess
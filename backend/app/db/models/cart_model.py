@@ -1,13 +1,19 @@
 from typing import Optional, TYPE_CHECKING
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import UniqueConstraint
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
 
 if TYPE_CHECKING:
     from .menu_model import Menu
 
 
 class CartItem(SQLModel, table=True):
+    # one line per item of a user's cart at one restaurant; the cart store
+    # writes through with an upsert on it
+    __table_args__ = (UniqueConstraint("restaurant_id", "username", "item_id"),)
 
     cart_id: Optional[int] = Field(default=None, primary_key=True, index=True)
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, foreign_key="restaurant.restaurant_id")
     username: str = Field(foreign_key="users.username")
     item_id: int = Field(foreign_key="menu.item_id")
     quantity: int = Field(default=1)
@@ -17,4 +23,16 @@ class CartItem(SQLModel, table=True):
         return f"<CartItem {self.cart_id} user={self.username} item_id={self.item_id} qty={self.quantity}>"
 
 
+class CartRevision(SQLModel, table=True):
+    """Change counter of one user's cart, bumped in every transaction that changes it.
+
+    Hot copies of a cart are only trusted while their revision matches this
+    row, and locking the row serialises cart writers across workers. A
+    missing row means revision 0.
+    """
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, primary_key=True)
+    username: str = Field(primary_key=True)
+    revision: int = Field(default=0)
+
+
 
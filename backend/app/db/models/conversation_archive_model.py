@@ -0,0 +1,18 @@
+from typing import Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary
+from datetime import datetime
+
+
+class ConversationArchive(SQLModel, table=True):
+    """A compressed NDJSON chunk of cold ConversationMessage rows."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(index=True)
+    codec: str
+    message_count: int
+    first_seq: int
+    last_seq: int
+    first_created_at: datetime
+    last_created_at: datetime
+    payload: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
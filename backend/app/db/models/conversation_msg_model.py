@@ -1,13 +1,27 @@
 from typing import Dict, Any
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import Column, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
-import uuid
+
+# JSONB on Postgres (indexable, binary), plain JSON elsewhere
+JSON_CONTENT = JSON().with_variant(JSONB(), "postgresql")
+
 
 class ConversationMessage(SQLModel, table=True):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    """One entry of a conversation's append-only log, keyed by (conversation_id, seq).
+
+    `seq` is assigned from ConversationHead and only ever grows, so history
+    reads and `pop_item` are range scans on the primary key.
+    """
+    conversation_id: str = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
     role: str
-    content: Dict[str, Any] = Field(sa_column=Column(JSON))  # ✅ Correct way to use JSON
-    conversation_id: str
+    content: Dict[str, Any] = Field(sa_column=Column(JSON_CONTENT))
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ConversationHead(SQLModel, table=True):
+    """Last sequence number handed out per conversation."""
+    conversation_id: str = Field(primary_key=True)
+    last_seq: int = Field(default=0)
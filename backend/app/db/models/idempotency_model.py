@@ -0,0 +1,18 @@
+from typing import Any, Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column
+from datetime import datetime
+from backend.app.db.models.conversation_msg_model import JSON_CONTENT
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """First response to a mutating request, replayed when the same Idempotency-Key is retried.
+
+    `status_code` is NULL while the first request is still running.
+    """
+    key: str = Field(primary_key=True)
+    scope: str = Field(primary_key=True)
+    request_hash: str
+    status_code: Optional[int] = None
+    response: Optional[Any] = Field(default=None, sa_column=Column(JSON_CONTENT))
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
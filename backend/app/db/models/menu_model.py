@@ -1,12 +1,29 @@
 from sqlmodel import SQLModel, Field, Column, Relationship
 import sqlalchemy.dialects.postgresql as pg
 from typing import Optional, List
+from sqlalchemy import UniqueConstraint
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
 
 class Menu(SQLModel, table=True):
+    # item_code is unique within a restaurant's menu
+    __table_args__ = (UniqueConstraint("restaurant_id", "item_code"),)
+
     item_id: Optional[int] = Field(default=None, primary_key=True, index=True)
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, foreign_key="restaurant.restaurant_id", index=True)
+    # stable external key used by bulk import/export
+    item_code: Optional[str] = Field(default=None)
     item_name: str
     item_price: float
     
     order_items: list["OrderItem"] = Relationship(back_populates="menu_item")
     cart_items: List["CartItem"] = Relationship(back_populates="menu_item")
 
+
+
+class MenuVersion(SQLModel, table=True):
+    """Per-restaurant counter bumped in the same transaction as any menu change.
+
+    `id` is the restaurant_id.
+    """
+    id: int = Field(default=DEFAULT_RESTAURANT_ID, primary_key=True)
+    version: int = Field(default=0)
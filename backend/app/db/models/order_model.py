@@ -1,14 +1,37 @@
 from typing import Optional
+from datetime import datetime
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, UniqueConstraint
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID, PARTITIONED, PARTITION_BY_RESTAURANT
+
+# kitchen flow; "recieved" keeps the spelling existing rows and clients use
+ORDER_STATUSES = ("recieved", "preparing", "ready", "completed")
+
 
 class Order(SQLModel, table=True):
-    
-    order_id: Optional[int] = Field(default=None, primary_key=True, index=True)
+    # (restaurant_id, order_id) is the primary key on Postgres, where the
+    # table is partitioned by restaurant; order_id alone stays unique in practice
+    __table_args__ = (
+        *(() if PARTITIONED else (UniqueConstraint("restaurant_id", "order_id"),)),
+        # a user's recent orders, polled by every open chat socket
+        Index("ix_order_restaurant_id_username_created_at", "restaurant_id", "username", "created_at"),
+        PARTITION_BY_RESTAURANT,
+    )
+
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, foreign_key="restaurant.restaurant_id", primary_key=PARTITIONED)
+
+    order_id: Optional[int] = Field(default=None, primary_key=True, index=True, sa_column_kwargs={"autoincrement": True})
     
     username: str = Field(foreign_key="users.username")
     
-    status: str
+    status: str = Field(index=True)
+
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+    # dispatcher worker that moved the order to "preparing", and when
+    claimed_by: Optional[str] = None
+    claimed_at: Optional[datetime] = None
     
     items: list["OrderItem"] = Relationship(back_populates="order")
     
-    user: "Users" = Relationship(back_populates="orders")
\ No newline at end of file
+    user: "Users" = Relationship(back_populates="orders")
@@ -1,7 +1,16 @@
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import ForeignKeyConstraint
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID, PARTITION_BY_RESTAURANT
 
 class OrderItem(SQLModel, table=True):
-    order_id: int = Field(foreign_key="order.order_id", primary_key=True)
+    __table_args__ = (
+        ForeignKeyConstraint(["restaurant_id", "order_id"], ["order.restaurant_id", "order.order_id"]),
+        PARTITION_BY_RESTAURANT,
+    )
+
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, primary_key=True)
+
+    order_id: int = Field(primary_key=True)
     
     item_id: int = Field(foreign_key="menu.item_id", primary_key=True)
     
@@ -9,4 +18,4 @@ class OrderItem(SQLModel, table=True):
     
     order: "Order" = Relationship(back_populates="items")
     
-    menu_item: "Menu" = Relationship(back_populates="order_items")
\ No newline at end of file
+    menu_item: "Menu" = Relationship(back_populates="order_items")
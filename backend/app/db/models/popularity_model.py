@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+
+
+class ItemPopularity(SQLModel, table=True):
+    """Running order totals per menu item, bumped in the checkout transaction."""
+    item_id: int = Field(foreign_key="menu.item_id", primary_key=True)
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, index=True)
+    order_count: int = 0
+    quantity_total: int = 0
+    last_ordered_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UserItemCount(SQLModel, table=True):
+    """Running order totals per user, restaurant and item, for "my usual"."""
+    username: str = Field(foreign_key="users.username", primary_key=True)
+    restaurant_id: int = Field(default=DEFAULT_RESTAURANT_ID, primary_key=True)
+    item_id: int = Field(foreign_key="menu.item_id", primary_key=True)
+    order_count: int = 0
+    quantity_total: int = 0
+    last_ordered_at: datetime = Field(default_factory=datetime.utcnow)
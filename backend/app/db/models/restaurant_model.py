@@ -0,0 +1,21 @@
+from typing import Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy.engine import make_url
+from backend.config import config
+
+# the restaurant every single-location install (and any request without a tenant) uses
+DEFAULT_RESTAURANT_ID = 1
+
+# Orders are LIST-partitioned by restaurant on Postgres, which needs the
+# partition key in the primary key; elsewhere (SQLite benchmarks) the tables
+# stay plain so order_id can keep autoincrementing on its own.
+PARTITIONED = make_url(config.DB_URL).get_backend_name() == "postgresql"
+PARTITION_BY_RESTAURANT = {"postgresql_partition_by": "LIST (restaurant_id)"} if PARTITIONED else {}
+
+# tables with one partition per restaurant
+PARTITIONED_TABLES = ("order", "orderitem")
+
+
+class Restaurant(SQLModel, table=True):
+    restaurant_id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
@@ -1,8 +1,9 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Literal
 from typing import List
 import uuid
 from datetime import datetime, date
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
 
 
 class user(BaseModel):
@@ -11,6 +12,10 @@ class user(BaseModel):
     
 class usercontext(BaseModel):
     username: str
+    # the restaurant (tenant) this chat orders from
+    restaurant_id: int = DEFAULT_RESTAURANT_ID
+    # compact menu/cart snapshot prefetched at the start of the turn
+    snapshot: Optional[str] = None
 
 
 class token(BaseModel):
@@ -20,6 +25,7 @@ class token(BaseModel):
 
 class menu(BaseModel):
     item_id: Optional[int] = None
+    item_code: Optional[str] = None
     item_name: str
     item_price: float
     
@@ -43,6 +49,12 @@ class CartItemCreate(BaseModel):
     quantity: int = 1
 
 
+class CartOp(BaseModel):
+    op: Literal["add", "set", "remove"]
+    item_id: int
+    quantity: int = 1
+
+
 class CartItemRead(BaseModel):
     cart_id: int
     username: str
@@ -0,0 +1,193 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are plain objects guarded by a lock, so
+recording a sample costs a dict lookup and a few additions. Everything is
+rendered on demand by `render_metrics()` for the `/metrics` route.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from backend.config import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelKey, Tuple[list, list]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(k, list(v[0]), v[1][0]) for k, v in self._values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', repr(float(bound))))} {running}")
+            running += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {running}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ---- shared metrics -------------------------------------------------------
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+
+PHASE_LATENCY = registry.histogram("agent_phase_duration_seconds", "Time spent per chat turn phase", ("phase",))
+AGENT_TTFT = registry.histogram("agent_time_to_first_token_seconds", "Time from request to first streamed token", ("prefetch",))
+AGENT_TURN_LATENCY = registry.histogram("agent_turn_duration_seconds", "Total chat turn duration")
+AGENT_TOKENS_PER_SECOND = registry.histogram("agent_output_tokens_per_second", "Model output tokens per second", buckets=RATE_BUCKETS)
+AGENT_TOOL_CALLS_PER_TURN = registry.histogram("agent_tool_calls_per_turn", "Tool calls made per chat turn", ("prefetch",), buckets=COUNT_BUCKETS)
+AGENT_TURNS = registry.counter("agent_turns_total", "Chat turns by outcome", ("outcome",))
+AGENT_CANCELLED_TOKENS_SAVED = registry.counter("agent_cancelled_tokens_saved_total", "Estimated output tokens not generated because the client disconnected mid-turn")
+AGENT_INPUT_TOKENS = registry.counter("agent_input_tokens_total", "Model input tokens by provider prompt-cache result", ("cache",))
+AGENT_PROMPT_CACHE_HIT_RATIO = registry.histogram("agent_prompt_cache_hit_ratio", "Share of a run's input tokens served from the provider prompt cache", buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1.0))
+AGENT_ANSWER_CACHE = registry.counter("agent_answer_cache_total", "Menu-question answer cache lookups and stores by result", ("result",))
+
+
+def observe_phase(phase: str, started: float) -> None:
+    """Record the time elapsed since `started` (a `perf_counter` reading)."""
+    if config.METRICS_ENABLED:
+        PHASE_LATENCY.observe(time.perf_counter() - started, phase=phase)
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    """Time a block and record it under `agent_phase_duration_seconds{phase}`."""
+    if not config.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_LATENCY.observe(time.perf_counter() - start, phase=phase)
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,36 @@
+import time
+from backend.app.observability.metrics import HTTP_REQUESTS, HTTP_LATENCY
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware recording latency and status for every route.
+
+    Routes are labelled with their path template (e.g. `/api/v1/order/menu`)
+    rather than the raw URL so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=method, route=route_path)
+            HTTP_REQUESTS.inc(method=method, route=route_path, status=str(status_code))
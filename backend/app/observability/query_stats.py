@@ -0,0 +1,146 @@
+"""Per-request SQL statement accounting.
+
+SQLAlchemy cursor events feed a `QueryStats` object stored in a context
+variable for the lifetime of a request. The middleware exposes the totals as
+response headers in debug mode, exports them as metrics, and can enforce the
+query budget a route declares with `Depends(query_budget(n))`.
+"""
+import re
+import time
+from collections import Counter as ShapeCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from backend.config import config
+from backend.app.observability.metrics import registry, COUNT_BUCKETS
+
+DB_QUERIES = registry.counter("db_queries_total", "SQL statements executed")
+DB_QUERY_LATENCY = registry.histogram("db_query_duration_seconds", "SQL statement latency")
+DB_QUERIES_PER_REQUEST = registry.histogram("db_queries_per_request", "SQL statements per HTTP request", ("route",), buckets=COUNT_BUCKETS)
+DB_TIME_PER_REQUEST = registry.histogram("db_time_per_request_seconds", "Total SQL time per HTTP request", ("route",))
+DB_REPEATED_SHAPES = registry.counter("db_repeated_query_shapes_total", "Requests running one statement shape above the N+1 threshold", ("route",))
+
+_PLACEHOLDER_LIST = re.compile(r"(\$\d+|\?|%\(\w+\)s|:\w+)(::\w+)?(\s*,\s*(\$\d+|\?|%\(\w+\)s|:\w+)(::\w+)?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """Collapse whitespace and expanded IN lists so equivalent statements compare equal."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    return _PLACEHOLDER_LIST.sub("?, ...", shape)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: ShapeCounter = ShapeCounter()
+        self.budget: Optional[int] = None
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: Optional[int] = None) -> dict[str, int]:
+        """Statement shapes executed at least `threshold` times (likely N+1 loops)."""
+        threshold = threshold or config.N_PLUS_ONE_THRESHOLD
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries():
+    """Collect the statements run inside the block, outside of any request."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def query_budget(max_queries: int):
+    """Route dependency declaring the most statements a request may run."""
+    async def _declare() -> None:
+        stats = _current.get()
+        if stats is not None:
+            stats.budget = max_queries
+    return _declare
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if config.METRICS_ENABLED:
+        DB_QUERIES.inc()
+        DB_QUERY_LATENCY.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def install_query_hooks(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware that scopes a `QueryStats` to each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # the handler has finished its queries by the time headers go out
+                if config.QUERY_BUDGET_ENFORCE and stats.budget is not None and stats.count > stats.budget:
+                    raise QueryBudgetExceeded(
+                        f"{scope.get('method')} {scope.get('path')} ran {stats.count} queries, "
+                        f"budget is {stats.budget}: {dict(stats.shapes)}"
+                    )
+                if config.DEBUG:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-query-count", str(stats.count).encode()))
+                    headers.append((b"x-db-time-ms", f"{stats.total_time * 1000:.2f}".encode()))
+                    headers.append((b"x-db-repeated-queries", str(sum(stats.repeated().values())).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if config.METRICS_ENABLED:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                DB_QUERIES_PER_REQUEST.observe(stats.count, route=route)
+                DB_TIME_PER_REQUEST.observe(stats.total_time, route=route)
+                if stats.repeated():
+                    DB_REPEATED_SHAPES.inc(route=route)
@@ -0,0 +1,172 @@
+"""Tool-call tracing for agent runs.
+
+`ToolCallTracer` pairs the `tool_called` / `tool_output` stream events of a
+turn, records latency, argument hash and output size per tool, folds them
+into per-conversation aggregates, and writes a sampled JSONL trace for
+offline analysis (enable with `TOOL_TRACE_PATH`).
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Optional
+
+from backend.config import config
+from backend.app.observability.metrics import registry, observe_phase, COUNT_BUCKETS
+
+log = logging.getLogger(__name__)
+
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+MAX_TRACKED_CONVERSATIONS = 10_000
+
+TOOL_CALLS = registry.counter("agent_tool_calls_total", "Agent tool calls", ("tool", "success"))
+TOOL_LATENCY = registry.histogram("agent_tool_call_duration_seconds", "Agent tool call latency", ("tool",))
+TOOL_OUTPUT_BYTES = registry.histogram("agent_tool_output_bytes", "Size of tool output added to the model context", ("tool",), buckets=SIZE_BUCKETS)
+TOOL_REPEATED_CALLS = registry.counter("agent_tool_repeated_calls_total", "Tool calls repeating an earlier call with identical arguments in the same conversation", ("tool",))
+TOOL_CALLS_PER_CONVERSATION = registry.histogram("agent_tool_calls_per_conversation", "Tool calls made so far in a conversation, sampled per turn", buckets=COUNT_BUCKETS)
+
+# prefixes the Agents SDK and FastMCP use when a tool call fails
+_ERROR_PREFIXES = ("An error occurred while running the tool", "Error executing tool")
+
+
+def arguments_hash(arguments: Any) -> str:
+    """Stable short hash of tool arguments, regardless of key order."""
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments) if arguments else {}
+        except ValueError:
+            pass
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+@dataclass
+class ToolCallRecord:
+    conversation_id: str
+    call_id: str
+    tool: str
+    args_hash: str
+    started_at: float
+    latency: float = 0.0
+    output_bytes: int = 0
+    success: bool = True
+
+
+@dataclass
+class ConversationToolStats:
+    calls: int = 0
+    failures: int = 0
+    repeated: int = 0
+    output_bytes: int = 0
+    latency: float = 0.0
+    per_tool: Dict[str, int] = field(default_factory=dict)
+    seen_calls: set = field(default_factory=set, repr=False)
+
+
+_conversations: "OrderedDict[str, ConversationToolStats]" = OrderedDict()
+_conversations_lock = threading.Lock()
+_trace_lock = threading.Lock()
+
+
+def conversation_tool_stats(conversation_id: str) -> Optional[ConversationToolStats]:
+    return _conversations.get(conversation_id)
+
+
+def _stats_for(conversation_id: str) -> ConversationToolStats:
+    with _conversations_lock:
+        stats = _conversations.get(conversation_id)
+        if stats is None:
+            stats = _conversations[conversation_id] = ConversationToolStats()
+            if len(_conversations) > MAX_TRACKED_CONVERSATIONS:
+                _conversations.popitem(last=False)
+        else:
+            _conversations.move_to_end(conversation_id)
+        return stats
+
+
+def _write_trace(entries: list[dict]) -> None:
+    if not entries:
+        return
+    lines = "".join(json.dumps(e, default=str) + "\n" for e in entries)
+    with _trace_lock, open(config.TOOL_TRACE_PATH, "a", encoding="utf-8") as fh:
+        fh.write(lines)
+
+
+class ToolCallTracer:
+    """Collects tool-call records for one agent turn."""
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self.records: list[ToolCallRecord] = []
+        self._pending: Dict[str, ToolCallRecord] = {}
+        self.sampled = bool(config.TOOL_TRACE_PATH) and random.random() < config.TOOL_TRACE_SAMPLE_RATE
+
+    def on_tool_called(self, raw_item: Any) -> None:
+        call_id = getattr(raw_item, "call_id", None) or getattr(raw_item, "id", None) or str(len(self._pending))
+        record = ToolCallRecord(
+            conversation_id=self.conversation_id,
+            call_id=call_id,
+            tool=getattr(raw_item, "name", "unknown"),
+            args_hash=arguments_hash(getattr(raw_item, "arguments", None)),
+            started_at=time.perf_counter(),
+        )
+        self._pending[call_id] = record
+
+    def on_tool_output(self, item: Any) -> None:
+        raw = item.raw_item
+        call_id = raw.get("call_id") if isinstance(raw, dict) else getattr(raw, "call_id", None)
+        record = self._pending.pop(call_id, None)
+        if record is None:
+            return
+        output = item.output if isinstance(item.output, str) else json.dumps(item.output, default=str)
+        record.latency = time.perf_counter() - record.started_at
+        record.output_bytes = len(output.encode())
+        record.success = not output.startswith(_ERROR_PREFIXES)
+        self._record(record)
+
+    def _record(self, record: ToolCallRecord) -> None:
+        self.records.append(record)
+        stats = _stats_for(self.conversation_id)
+        stats.calls += 1
+        stats.failures += 0 if record.success else 1
+        stats.output_bytes += record.output_bytes
+        stats.latency += record.latency
+        stats.per_tool[record.tool] = stats.per_tool.get(record.tool, 0) + 1
+        signature = (record.tool, record.args_hash)
+        repeated = signature in stats.seen_calls
+        stats.seen_calls.add(signature)
+        if repeated:
+            stats.repeated += 1
+
+        if config.METRICS_ENABLED:
+            observe_phase("tool_call", record.started_at)
+            TOOL_CALLS.inc(tool=record.tool, success=str(record.success).lower())
+            TOOL_LATENCY.observe(record.latency, tool=record.tool)
+            TOOL_OUTPUT_BYTES.observe(record.output_bytes, tool=record.tool)
+            if repeated:
+                TOOL_REPEATED_CALLS.inc(tool=record.tool)
+
+    def finish(self) -> None:
+        """Close out the turn: export the conversation total and flush the sampled trace."""
+        stats = _conversations.get(self.conversation_id)
+        if stats is not None and self.records and config.METRICS_ENABLED:
+            TOOL_CALLS_PER_CONVERSATION.observe(stats.calls)
+        if not self.sampled:
+            return
+        entries = []
+        for r in self.records:
+            entry = {"event": "tool_call", "ts": time.time(), **asdict(r)}
+            entry.pop("started_at")
+            entries.append(entry)
+        if stats is not None:
+            summary = asdict(stats)
+            summary.pop("seen_calls")
+            entries.append({"event": "turn_summary", "ts": time.time(), "conversation_id": self.conversation_id, **summary})
+        try:
+            _write_trace(entries)
+        except OSError as e:
+            log.warning("tool trace write failed: %s", e)
@@ -1,47 +1,79 @@
 from typing import List, Dict, Any, Optional
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy import select, delete
-from backend.app.db.models.conversation_msg_model import ConversationMessage
+from sqlalchemy import select, delete, func
+from backend.app.db.models.conversation_msg_model import ConversationMessage, ConversationHead
+from backend.app.db.main import insert_for
+from backend.app.db.models.conversation_archive_model import ConversationArchive
+from backend.app.services.archive_service import archive_service
+from backend.app.observability.metrics import span
 
 class PostgresSession:
     def __init__(self, db: AsyncSession, conversation_id: str):
         self.db = db
         self.conversation_id = conversation_id
+        self._preloaded: Optional[List[Dict[str, Any]]] = None
+
+    async def preload(self) -> None:
+        """Load the full history ahead of the run; the next `get_items()` returns it."""
+        self._preloaded = await self.get_items()
 
     async def get_items(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Retrieve messages in the format expected by the OpenAI Agents SDK."""
+        if limit is None and self._preloaded is not None:
+            items, self._preloaded = self._preloaded, None
+            return items
+
         query = (
             select(ConversationMessage)
             .where(ConversationMessage.conversation_id == self.conversation_id)
-            .order_by(ConversationMessage.created_at.asc())
         )
         if limit:
-            query = query.limit(limit)
+            # newest `limit` messages, returned oldest first
+            query = query.order_by(ConversationMessage.seq.desc()).limit(limit)
+        else:
+            query = query.order_by(ConversationMessage.seq.asc())
 
-        result = await self.db.execute(query)
-        rows = result.scalars().all()
+        with span("history_load"):
+            result = await self.db.execute(query)
+            rows = result.scalars().all()
+            if limit:
+                rows = list(reversed(rows))
 
         # Return messages in the SDK's expected format
-        messages = []
-        for row in rows:
-            msg = {"role": row.role}
-            
-            # Handle content - could be dict or string
-            if isinstance(row.content, dict):
-                if "text" in row.content:
-                    msg["content"] = row.content["text"]
-                else:
-                    # If it's a dict but not the simple format, keep it as is
-                    msg["content"] = row.content
-            else:
-                msg["content"] = str(row.content)
-            
-            messages.append(msg)
-        
+        messages = [self._to_sdk(row.role, row.content) for row in rows]
+
+        # Older messages live in the compressed archive. The hot table holds a
+        # contiguous tail of the history, so it has been archived from only if
+        # that tail no longer starts at seq 1. Page in what the caller asked
+        # for beyond the hot rows: everything for the runner's unlimited read.
+        archived_before = not rows or rows[0].seq > 1
+        if archived_before and (limit is None or len(messages) < limit):
+            older = await archive_service().read_archive(
+                self.conversation_id, self.db, None if limit is None else limit - len(messages)
+            )
+            messages = [self._to_sdk(msg["role"], msg["content"]) for msg in older] + messages
+
         return messages
 
+    @staticmethod
+    def _to_sdk(role: str, content: Any) -> Dict[str, Any]:
+        msg = {"role": role}
+
+        # Handle content - could be dict or string
+        if isinstance(content, dict):
+            if "text" in content:
+                msg["content"] = content["text"]
+            else:
+                # If it's a dict but not the simple format, keep it as is
+                msg["content"] = content
+        else:
+            msg["content"] = str(content)
+
+        return msg
+
     async def add_items(self, items: List[Dict[str, Any]]) -> None:
         """Store messages from the OpenAI Agents SDK."""
+        new_msgs = []
         for item in items:
             role = item.get("role")
             content = item.get("content")
@@ -71,30 +103,60 @@ class PostgresSession:
             else:
                 content_to_store = {"text": str(content)}
 
-            new_msg = ConversationMessage(
+            new_msgs.append(ConversationMessage(
                 conversation_id=self.conversation_id,
                 role=role,
                 content=content_to_store
+            ))
+
+        if not new_msgs:
+            return
+
+        with span("history_save"):
+            first = await self._reserve_seq(len(new_msgs))
+            for offset, new_msg in enumerate(new_msgs):
+                new_msg.seq = first + offset
+            self.db.add_all(new_msgs)
+            await self.db.commit()
+
+    async def _reserve_seq(self, n: int) -> int:
+        """Reserve `n` consecutive sequence numbers and return the first one.
+
+        The upsert locks the conversation's head row until commit, so
+        concurrent writers to one conversation get disjoint, ordered ranges.
+        """
+        statement = (
+            insert_for(self.db, ConversationHead)
+            .values(conversation_id=self.conversation_id, last_seq=n)
+            .on_conflict_do_update(
+                index_elements=[ConversationHead.conversation_id],
+                set_={"last_seq": ConversationHead.last_seq + n},
             )
-            self.db.add(new_msg)
-        
-        await self.db.commit()
+            .returning(ConversationHead.last_seq)
+        )
+        result = await self.db.execute(statement)
+        return result.scalar_one() - n + 1
 
     async def pop_item(self) -> Optional[Dict[str, Any]]:
         """Remove and return the last message."""
-        result = await self.db.execute(
-            select(ConversationMessage)
+        last_seq = (
+            select(func.max(ConversationMessage.seq))
             .where(ConversationMessage.conversation_id == self.conversation_id)
-            .order_by(ConversationMessage.created_at.desc())
-            .limit(1)
+            .scalar_subquery()
         )
-        row = result.scalars().first()
+        result = await self.db.execute(
+            delete(ConversationMessage)
+            .where(
+                ConversationMessage.conversation_id == self.conversation_id,
+                ConversationMessage.seq == last_seq,
+            )
+            .returning(ConversationMessage.role, ConversationMessage.content)
+        )
+        row = result.first()
+        await self.db.commit()
         if not row:
             return None
 
-        await self.db.delete(row)
-        await self.db.commit()
-
         # Return in SDK format
         msg = {"role": row.role}
         if isinstance(row.content, dict) and "text" in row.content:
@@ -105,10 +167,15 @@ class PostgresSession:
         return msg
 
     async def clear_session(self) -> None:
-        """Clear all messages for this conversation."""
+        """Clear all messages for this conversation, including archived ones."""
         await self.db.execute(
             delete(ConversationMessage).where(
                 ConversationMessage.conversation_id == self.conversation_id
             )
         )
+        await self.db.execute(
+            delete(ConversationArchive).where(
+                ConversationArchive.conversation_id == self.conversation_id
+            )
+        )
         await self.db.commit()
\ No newline at end of file
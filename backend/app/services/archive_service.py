@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import and_, delete, func
+from backend.app.db.models.conversation_msg_model import ConversationMessage
+from backend.app.db.models.conversation_archive_model import ConversationArchive
+from backend.app.db.main import async_session
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+try:
+    import zstandard
+except ImportError:  # optional: fall back to zlib from the standard library
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+ARCHIVED_MESSAGES = registry.counter("conversation_archived_messages_total", "Conversation messages moved to the compressed archive")
+ARCHIVE_BYTES = registry.counter("conversation_archive_bytes_total", "Compressed bytes written to the conversation archive", ("codec",))
+
+
+def compress(data: bytes) -> tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd conversation archives")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    raise ValueError(f"unknown archive codec {codec!r}")
+
+
+def _encode_rows(rows: List[ConversationMessage]) -> bytes:
+    lines = (
+        json.dumps({
+            "seq": row.seq,
+            "role": row.role,
+            "content": row.content,
+            "created_at": row.created_at.isoformat(),
+        }, separators=(",", ":"))
+        for row in rows
+    )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _decode_chunk(chunk: ConversationArchive) -> List[Dict[str, Any]]:
+    messages = []
+    for line in decompress(chunk.codec, chunk.payload).decode().splitlines():
+        if line:
+            msg = json.loads(line)
+            msg["conversation_id"] = chunk.conversation_id
+            messages.append(msg)
+    return messages
+
+
+class archive_service:
+
+    async def find_cold_conversations(self, session: AsyncSession, limit: int) -> List[str]:
+        """Conversations with more than ARCHIVE_KEEP_LAST hot rows, the oldest past ARCHIVE_AFTER_DAYS."""
+        cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+        statement = (
+            select(ConversationMessage.conversation_id)
+            .group_by(ConversationMessage.conversation_id)
+            .having(and_(
+                func.count() > config.ARCHIVE_KEEP_LAST,
+                func.min(ConversationMessage.created_at) < cutoff,
+            ))
+            .limit(limit)
+        )
+        result = await session.exec(statement)
+        return list(result.all())
+
+    async def archive_conversation(self, conversation_id: str, session: AsyncSession) -> int:
+        """Move the oldest messages of a conversation into compressed archive chunks.
+
+        Messages are archived oldest first while they are both beyond the
+        newest ARCHIVE_KEEP_LAST messages and older than ARCHIVE_AFTER_DAYS,
+        so the hot table always holds a contiguous tail of the history and
+        an idle conversation keeps its recent turns hot.
+        Returns the number of messages archived.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+        statement = (
+            select(ConversationMessage)
+            .where(ConversationMessage.conversation_id == conversation_id)
+            .order_by(ConversationMessage.seq.asc())
+        )
+        result = await session.exec(statement)
+        rows = result.all()
+
+        over_limit = len(rows) - config.ARCHIVE_KEEP_LAST
+        n = 0
+        while n < over_limit and rows[n].created_at < cutoff:
+            n += 1
+        if n == 0:
+            return 0
+
+        cold = rows[:n]
+        try:
+            for start in range(0, n, config.ARCHIVE_CHUNK_MESSAGES):
+                chunk = cold[start:start + config.ARCHIVE_CHUNK_MESSAGES]
+                codec, payload = compress(_encode_rows(chunk))
+                session.add(ConversationArchive(
+                    conversation_id=conversation_id,
+                    codec=codec,
+                    message_count=len(chunk),
+                    first_seq=chunk[0].seq,
+                    last_seq=chunk[-1].seq,
+                    first_created_at=chunk[0].created_at,
+                    last_created_at=chunk[-1].created_at,
+                    payload=payload,
+                ))
+                ARCHIVE_BYTES.inc(len(payload), codec=codec)
+            await session.execute(
+                delete(ConversationMessage).where(
+                    ConversationMessage.conversation_id == conversation_id,
+                    ConversationMessage.seq <= cold[-1].seq,
+                )
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+        ARCHIVED_MESSAGES.inc(n)
+        return n
+
+    async def read_archive(self, conversation_id: str, session: AsyncSession, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return archived messages in chronological order; with `limit`, only the newest ones.
+
+        Chunks are read newest first and decoding stops once enough messages
+        are collected, so paging a little way back only touches a chunk or two.
+        """
+        statement = (
+            select(ConversationArchive)
+            .where(ConversationArchive.conversation_id == conversation_id)
+            .order_by(ConversationArchive.last_seq.desc())
+        )
+        result = await session.exec(statement)
+        collected: List[List[Dict[str, Any]]] = []
+        total = 0
+        for chunk in result.all():
+            messages = _decode_chunk(chunk)
+            collected.append(messages)
+            total += len(messages)
+            if limit is not None and total >= limit:
+                break
+
+        messages = [msg for chunk_messages in reversed(collected) for msg in chunk_messages]
+        if limit is not None:
+            messages = messages[-limit:] if limit > 0 else []
+        return messages
+
+    async def run_once(self, session: AsyncSession) -> int:
+        archived = 0
+        for conversation_id in await self.find_cold_conversations(session, config.ARCHIVE_BATCH_CONVERSATIONS):
+            archived += await self.archive_conversation(conversation_id, session)
+        return archived
+
+
+async def run_archiver(stop: asyncio.Event):
+    """Background loop archiving cold conversations every ARCHIVE_INTERVAL_SECONDS."""
+    service = archive_service()
+    while not stop.is_set():
+        try:
+            async with async_session() as session:
+                archived = await service.run_once(session)
+            if archived:
+                log.info("archived %d conversation messages", archived)
+        except Exception as e:
+            log.exception("conversation archiver failed: %s", e)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=config.ARCHIVE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,312 @@
+"""Hot cart store in front of the `CartItem` table.
+
+Carts are small, per-user and short-lived, so their lines are served from a
+`CartBackend` (process memory by default, or Redis to share one copy between
+workers) and every change is written through to Postgres as one set-based
+diff before the hot copy is replaced. Idle carts expire from the hot store
+only; Postgres keeps them and they are reloaded on the next read.
+
+Postgres stays the source of truth: every cart has a revision row
+(`CartRevision`) bumped in the same transaction as each change, and a hot
+copy is only used while its revision matches. A copy left stale by a write
+in another worker or tier is reloaded, never served, so the memory backend
+is safe with several workers; it just misses more often than Redis.
+"""
+import asyncio
+import json
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, NamedTuple, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import delete
+
+from backend.app.db.models.cart_model import CartItem, CartRevision
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.db.main import insert_for
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: only needed for CART_STORE_BACKEND=redis
+    aioredis = None
+
+CART_STORE_LOOKUPS = registry.counter("cart_store_lookups_total", "Cart reads by hot store result", ("result",))
+CART_STORE_WRITES = registry.counter("cart_store_writes_total", "Cart changes written through to Postgres")
+
+
+class CartLine(NamedTuple):
+    item_id: int
+    quantity: int
+    cart_id: Optional[int] = None
+
+
+@dataclass
+class CartState:
+    username: str
+    restaurant_id: int = DEFAULT_RESTAURANT_ID
+    lines: Dict[int, CartLine] = field(default_factory=dict)
+    # bumped on every change; lets clients tell whether a cart moved
+    revision: int = 0
+
+    def quantities(self) -> Dict[int, int]:
+        return {item_id: line.quantity for item_id, line in self.lines.items()}
+
+    def as_dicts(self) -> list[dict]:
+        """Lines in the shape of a `CartItem` row, without building ORM objects."""
+        return [
+            {
+                "cart_id": line.cart_id, "restaurant_id": self.restaurant_id, "username": self.username,
+                "item_id": line.item_id, "quantity": line.quantity,
+            }
+            for line in self.lines.values()
+        ]
+
+
+class CartBackend:
+    """Where hot carts live, one per (restaurant, user).
+
+    Implementations must expire carts idle for `CART_IDLE_SECONDS`.
+    """
+
+    async def get(self, restaurant_id: int, username: str) -> Optional[CartState]:
+        raise NotImplementedError
+
+    async def put(self, state: CartState) -> None:
+        raise NotImplementedError
+
+    async def drop(self, restaurant_id: int, username: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCartBackend(CartBackend):
+    """Per-process LRU of carts; each worker keeps its own copies, checked against Postgres on use."""
+
+    def __init__(self, idle_seconds: float, max_carts: int):
+        self.idle_seconds = idle_seconds
+        self.max_carts = max_carts
+        self._carts: "OrderedDict[tuple[int, str], tuple[float, CartState]]" = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        # entries are kept in last-touched order, so expired ones sit at the front
+        while self._carts:
+            _, (touched, _) = next(iter(self._carts.items()))
+            if now - touched < self.idle_seconds and len(self._carts) <= self.max_carts:
+                break
+            self._carts.popitem(last=False)
+
+    async def get(self, restaurant_id: int, username: str) -> Optional[CartState]:
+        now = time.monotonic()
+        self._evict(now)
+        key = (restaurant_id, username)
+        entry = self._carts.get(key)
+        if entry is None:
+            return None
+        self._carts[key] = (now, entry[1])
+        self._carts.move_to_end(key)
+        return entry[1]
+
+    async def put(self, state: CartState) -> None:
+        key = (state.restaurant_id, state.username)
+        self._carts[key] = (time.monotonic(), state)
+        self._carts.move_to_end(key)
+        self._evict(time.monotonic())
+
+    async def drop(self, restaurant_id: int, username: str) -> None:
+        self._carts.pop((restaurant_id, username), None)
+
+
+class RedisCartBackend(CartBackend):
+    """Carts shared by all workers, stored as small JSON values with an idle TTL."""
+
+    def __init__(self, url: str, idle_seconds: float):
+        if aioredis is None:
+            raise RuntimeError("CART_STORE_BACKEND=redis requires the redis package")
+        self.client = aioredis.from_url(url)
+        self.ttl = max(1, int(idle_seconds))
+
+    @staticmethod
+    def _key(restaurant_id: int, username: str) -> str:
+        return f"cart:{restaurant_id}:{username}"
+
+    async def get(self, restaurant_id: int, username: str) -> Optional[CartState]:
+        raw = await self.client.getex(self._key(restaurant_id, username), ex=self.ttl)
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        lines = {item_id: CartLine(item_id, quantity, cart_id) for item_id, quantity, cart_id in data["lines"]}
+        return CartState(username=username, restaurant_id=restaurant_id, lines=lines, revision=data["revision"])
+
+    async def put(self, state: CartState) -> None:
+        data = {"lines": [list(line) for line in state.lines.values()], "revision": state.revision}
+        await self.client.set(
+            self._key(state.restaurant_id, state.username), json.dumps(data, separators=(",", ":")), ex=self.ttl
+        )
+
+    async def drop(self, restaurant_id: int, username: str) -> None:
+        await self.client.delete(self._key(restaurant_id, username))
+
+
+def make_backend() -> CartBackend:
+    if config.CART_STORE_BACKEND == "redis":
+        return RedisCartBackend(config.CART_STORE_URL, config.CART_IDLE_SECONDS)
+    if config.CART_STORE_BACKEND == "memory":
+        return MemoryCartBackend(config.CART_IDLE_SECONDS, config.CART_STORE_MAX_CARTS)
+    raise ValueError(f"unknown CART_STORE_BACKEND {config.CART_STORE_BACKEND!r}")
+
+
+class CartStore:
+
+    def __init__(self, backend: CartBackend):
+        self.backend = backend
+        self._locks: "weakref.WeakValueDictionary[tuple[int, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def lock(self, username: str, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> asyncio.Lock:
+        """Serialises read-modify-write of one user's cart within this process.
+
+        Across processes the revision row locked by `load(..., for_update=True)`
+        does the same; this lock just keeps local writers off that row lock.
+        """
+        key = (restaurant_id, username)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def _revision(self, username: str, session: AsyncSession, restaurant_id: int, for_update: bool) -> int:
+        if not for_update:
+            result = await session.exec(
+                select(CartRevision.revision)
+                .where(CartRevision.restaurant_id == restaurant_id, CartRevision.username == username)
+            )
+            return result.first() or 0
+        # bump now and hold the row lock until the transaction ends; the caller
+        # is about to write, and a rolled back write rolls the bump back too
+        statement = insert_for(session, CartRevision).values(restaurant_id=restaurant_id, username=username, revision=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=["restaurant_id", "username"],
+            set_={"revision": CartRevision.revision + 1},
+        ).returning(CartRevision.revision)
+        result = await session.execute(statement)
+        return result.scalar_one() - 1
+
+    async def load(
+        self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID, for_update: bool = False,
+    ) -> CartState:
+        """The user's cart, from the hot store when its copy is still current.
+
+        The copy's revision is checked against Postgres first (once per
+        session for plain reads). `for_update` locks the cart's revision row
+        until the transaction ends, so concurrent writers in any worker see
+        each other's changes; pass it before `write` or `cleared`.
+        """
+        key = (restaurant_id, username)
+        checked = session.info.setdefault("carts", {})
+        if not for_update and key in checked:
+            return checked[key]
+        revision = await self._revision(username, session, restaurant_id, for_update)
+        state = await self.backend.get(restaurant_id, username)
+        if state is not None and state.revision == revision:
+            if config.METRICS_ENABLED:
+                CART_STORE_LOOKUPS.inc(result="hit")
+        else:
+            if config.METRICS_ENABLED:
+                CART_STORE_LOOKUPS.inc(result="miss" if state is None else "stale")
+            state = await self.read(username, session, restaurant_id, revision)
+            await self.backend.put(state)
+        checked[key] = state
+        return state
+
+    async def read(
+        self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID, revision: int = 0,
+    ) -> CartState:
+        """The cart as committed in Postgres, bypassing (and not filling) the hot store."""
+        result = await session.exec(
+            select(CartItem.item_id, CartItem.quantity, CartItem.cart_id)
+            .where(CartItem.restaurant_id == restaurant_id, CartItem.username == username)
+            .order_by(CartItem.cart_id)
+        )
+        return CartState(
+            username=username,
+            restaurant_id=restaurant_id,
+            lines={row[0]: CartLine(*row) for row in result.all()},
+            revision=revision,
+        )
+
+    async def write(self, state: CartState, quantities: Dict[int, int], session: AsyncSession) -> CartState:
+        """Write the cart's new `{item_id: quantity}` through to Postgres, then to the hot store.
+
+        `state` must come from `load(..., for_update=True)` in this
+        transaction. Only the difference is sent: one DELETE for dropped
+        lines and one upsert for new or changed ones, committed together
+        with the revision bump. On failure the hot copy is dropped.
+        """
+        removed = [item_id for item_id in state.lines if quantities.get(item_id, 0) <= 0]
+        changed = [
+            {"restaurant_id": state.restaurant_id, "username": state.username, "item_id": item_id, "quantity": qty}
+            for item_id, qty in quantities.items()
+            if qty > 0 and (item_id not in state.lines or state.lines[item_id].quantity != qty)
+        ]
+        cart_ids = {item_id: line.cart_id for item_id, line in state.lines.items()}
+        try:
+            if removed:
+                await session.execute(
+                    delete(CartItem).where(
+                        CartItem.restaurant_id == state.restaurant_id,
+                        CartItem.username == state.username,
+                        CartItem.item_id.in_(removed),
+                    )
+                )
+            if changed:
+                statement = insert_for(session, CartItem).values(changed)
+                statement = statement.on_conflict_do_update(
+                    index_elements=["restaurant_id", "username", "item_id"],
+                    set_={"quantity": statement.excluded.quantity},
+                ).returning(CartItem.item_id, CartItem.cart_id)
+                result = await session.execute(statement)
+                cart_ids.update({item_id: cart_id for item_id, cart_id in result.all()})
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            session.info.get("carts", {}).pop((state.restaurant_id, state.username), None)
+            await self.backend.drop(state.restaurant_id, state.username)
+            raise
+
+        new_state = CartState(
+            username=state.username,
+            restaurant_id=state.restaurant_id,
+            lines={
+                item_id: CartLine(item_id, qty, cart_ids.get(item_id))
+                for item_id, qty in quantities.items() if qty > 0
+            },
+            revision=state.revision + 1,
+        )
+        await self._replace(new_state, session)
+        if config.METRICS_ENABLED:
+            CART_STORE_WRITES.inc()
+        return new_state
+
+    async def _replace(self, state: CartState, session: AsyncSession) -> None:
+        session.info.setdefault("carts", {})[(state.restaurant_id, state.username)] = state
+        await self.backend.put(state)
+
+    async def cleared(self, state: CartState, session: AsyncSession) -> None:
+        """Record that the caller already deleted the cart rows and committed (e.g. at checkout).
+
+        `state` must come from `load(..., for_update=True)` in that transaction.
+        """
+        await self._replace(
+            CartState(username=state.username, restaurant_id=state.restaurant_id, revision=state.revision + 1), session
+        )
+
+    async def drop(self, username: str, restaurant_id: int = DEFAULT_RESTAURANT_ID, session: Optional[AsyncSession] = None) -> None:
+        if session is not None:
+            session.info.get("carts", {}).pop((restaurant_id, username), None)
+        await self.backend.drop(restaurant_id, username)
+
+
+cart_store = CartStore(make_backend())
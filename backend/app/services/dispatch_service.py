@@ -0,0 +1,229 @@
+"""Kitchen dispatch: hands "recieved" orders to the kitchen as it has room.
+
+Each app process runs one dispatcher. For every restaurant with waiting
+orders it tops the kitchen up to `DISPATCH_KITCHEN_CAPACITY` orders in
+"preparing", claiming them with `SELECT ... FOR UPDATE SKIP LOCKED`. Orders
+are taken oldest first, with every ordered item counting as
+`DISPATCH_SECONDS_PER_ITEM` of extra age, so small orders jump ahead of big
+ones without starving them. Claims for one restaurant are serialised on its
+`restaurant` row, so several processes never overfill a kitchen.
+
+The kitchen reads its queue and reports progress through the order API
+(`GET /order/kitchen`, `POST /order/orders/{order_id}/status`), which moves
+orders on with `advance`; nothing here pretends to prepare them.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import extract, func, update
+
+from backend.app.db.models.menu_model import Menu
+from backend.app.db.models.order_model import Order
+from backend.app.db.models.orderitems_model import OrderItem
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID, Restaurant
+from backend.app.db.main import async_session
+from backend.app.observability.metrics import registry
+from backend.config import config
+
+log = logging.getLogger(__name__)
+
+WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+DISPATCH_BACKLOG = registry.gauge("dispatch_backlog_orders", "Orders waiting to be claimed, as of the last poll")
+DISPATCH_PREPARING = registry.gauge("dispatch_preparing_orders", "Orders handed to the kitchen and not ready yet, as of the last poll")
+DISPATCH_TRANSITIONS = registry.counter("dispatch_transitions_total", "Order status changes made by the dispatcher and the kitchen", ("status",))
+DISPATCH_WAIT = registry.histogram("dispatch_wait_seconds", "Time from order creation to claim", buckets=WAIT_BUCKETS)
+DISPATCH_PREP = registry.histogram("dispatch_prep_seconds", "Time from claim to ready", buckets=WAIT_BUCKETS)
+
+# status changes the kitchen reports, keyed by the status they leave;
+# "recieved" -> "preparing" is the dispatcher's
+KITCHEN_TRANSITIONS = {"preparing": "ready", "ready": "completed"}
+
+
+class ClaimedOrder(NamedTuple):
+    restaurant_id: int
+    order_id: int
+    created_at: datetime
+    items: int
+    claimed_at: datetime
+
+
+class KitchenLoad(NamedTuple):
+    restaurant_id: int
+    waiting: int
+    preparing: int
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class dispatch_service:
+
+    def __init__(self, worker: str):
+        self.worker = worker
+
+    async def loads(self, session: AsyncSession) -> List[KitchenLoad]:
+        """Waiting and preparing order counts of every restaurant with either."""
+        result = await session.exec(
+            select(
+                Order.restaurant_id,
+                func.count().filter(Order.status == "recieved"),
+                func.count().filter(Order.status == "preparing"),
+            )
+            .where(Order.status.in_(("recieved", "preparing")))
+            .group_by(Order.restaurant_id)
+        )
+        return [KitchenLoad(*row) for row in result.all()]
+
+    async def claim_batch(self, restaurant_id: int, limit: int, session: AsyncSession) -> List[ClaimedOrder]:
+        """Claim up to `limit` of the restaurant's orders for its kitchen and mark them "preparing".
+
+        Fewer are claimed if that would put more than DISPATCH_KITCHEN_CAPACITY
+        orders in "preparing". Returns nothing when another dispatcher is
+        claiming for the same restaurant right now.
+        """
+        now = datetime.utcnow()
+        claimed: List[ClaimedOrder] = []
+        try:
+            # NO KEY UPDATE, so orders being inserted (which key-share lock
+            # their restaurant) neither block nor are blocked by this
+            result = await session.exec(
+                select(Restaurant.restaurant_id)
+                .where(Restaurant.restaurant_id == restaurant_id)
+                .with_for_update(key_share=True, skip_locked=True)
+            )
+            if result.first() is None:
+                await session.rollback()
+                return []
+            result = await session.exec(
+                select(func.count()).select_from(Order)
+                .where(Order.restaurant_id == restaurant_id, Order.status == "preparing")
+            )
+            room = min(limit, config.DISPATCH_KITCHEN_CAPACITY - result.one())
+            if room > 0:
+                size = (
+                    select(func.coalesce(func.sum(OrderItem.quantity), 0))
+                    .where(OrderItem.restaurant_id == Order.restaurant_id, OrderItem.order_id == Order.order_id)
+                    .correlate(Order)
+                    .scalar_subquery()
+                )
+                result = await session.exec(
+                    select(Order.order_id, Order.created_at, size)
+                    .where(Order.restaurant_id == restaurant_id, Order.status == "recieved")
+                    .order_by(extract("epoch", Order.created_at) + size * config.DISPATCH_SECONDS_PER_ITEM, Order.order_id)
+                    .limit(room)
+                    .with_for_update(of=Order, skip_locked=True)
+                )
+                claimed = [ClaimedOrder(restaurant_id, *row, now) for row in result.all()]
+            if claimed:
+                await session.execute(
+                    update(Order)
+                    .where(Order.restaurant_id == restaurant_id, Order.order_id.in_([o.order_id for o in claimed]))
+                    .values(status="preparing", claimed_by=self.worker, claimed_at=now)
+                )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+        if claimed and config.METRICS_ENABLED:
+            DISPATCH_TRANSITIONS.inc(len(claimed), status="preparing")
+            for order in claimed:
+                DISPATCH_WAIT.observe((now - order.created_at).total_seconds())
+        return claimed
+
+    async def kitchen_queue(self, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> list[dict]:
+        """The restaurant's "preparing" orders with their items, in the order they were claimed."""
+        result = await session.exec(
+            select(Order.order_id, Order.username, Order.claimed_at)
+            .where(Order.restaurant_id == restaurant_id, Order.status == "preparing")
+            .order_by(Order.claimed_at, Order.order_id)
+        )
+        orders = {
+            order_id: {"order_id": order_id, "username": username, "claimed_at": claimed_at, "items": []}
+            for order_id, username, claimed_at in result.all()
+        }
+        if not orders:
+            return []
+        result = await session.exec(
+            select(OrderItem.order_id, OrderItem.item_id, Menu.item_name, OrderItem.quantity)
+            .select_from(OrderItem)
+            .outerjoin(Menu, Menu.item_id == OrderItem.item_id)
+            .where(OrderItem.restaurant_id == restaurant_id, OrderItem.order_id.in_(list(orders)))
+            .order_by(OrderItem.order_id, OrderItem.item_id)
+        )
+        for order_id, item_id, item_name, quantity in result.all():
+            orders[order_id]["items"].append({"item_id": item_id, "item_name": item_name, "quantity": quantity})
+        return list(orders.values())
+
+    async def advance(self, order_id: int, status: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> bool:
+        """Move an order to `status`, reported by the kitchen, if it is in the status before it.
+
+        Returns False (changing nothing) when the order is missing or in any
+        other status, e.g. because the same report was already applied.
+        """
+        previous = [before for before, after in KITCHEN_TRANSITIONS.items() if after == status]
+        if not previous:
+            raise ValueError(f"status must be one of {', '.join(KITCHEN_TRANSITIONS.values())}")
+        try:
+            result = await session.execute(
+                update(Order)
+                .where(Order.restaurant_id == restaurant_id, Order.order_id == order_id, Order.status == previous[0])
+                .values(status=status)
+                .returning(Order.claimed_at)
+            )
+            moved = result.first()
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        if moved is None:
+            return False
+        if config.METRICS_ENABLED:
+            DISPATCH_TRANSITIONS.inc(status=status)
+            if status == "ready" and moved.claimed_at is not None:
+                DISPATCH_PREP.observe((datetime.utcnow() - moved.claimed_at).total_seconds())
+        return True
+
+    async def status_of(self, order_id: int, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> Optional[str]:
+        result = await session.exec(
+            select(Order.status).where(Order.restaurant_id == restaurant_id, Order.order_id == order_id)
+        )
+        return result.first()
+
+
+async def _wait(stop: asyncio.Event, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run_dispatcher(stop: asyncio.Event):
+    """Keep every restaurant's kitchen topped up with claimed orders until `stop` is set."""
+    service = dispatch_service(worker_id())
+    while not stop.is_set():
+        full_batch = False
+        try:
+            async with async_session() as session:
+                loads = await service.loads(session)
+                await session.commit()
+                if config.METRICS_ENABLED:
+                    DISPATCH_BACKLOG.set(sum(load.waiting for load in loads))
+                    DISPATCH_PREPARING.set(sum(load.preparing for load in loads))
+                for load in loads:
+                    if load.waiting and load.preparing < config.DISPATCH_KITCHEN_CAPACITY:
+                        claimed = await service.claim_batch(load.restaurant_id, config.DISPATCH_BATCH_SIZE, session)
+                        full_batch = full_batch or len(claimed) == config.DISPATCH_BATCH_SIZE
+        except Exception as e:
+            log.exception("order dispatcher failed to claim: %s", e)
+        # a full batch means more are probably waiting, so poll again straight away
+        if not full_batch:
+            await _wait(stop, config.DISPATCH_POLL_INTERVAL)
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import delete, update, or_, and_
+from backend.app.db.models.idempotency_model import IdempotencyRecord
+from backend.app.db.main import async_session, insert_for
+from backend.app.observability.metrics import registry
+from backend.app.observability.query_stats import current_stats
+from backend.config import config
+
+log = logging.getLogger(__name__)
+
+IDEMPOTENT_REPLAYS = registry.counter("idempotent_replays_total", "Mutating requests answered from a stored response", ("scope",))
+
+# statements the key adds to a request: reserve + complete, or reserve + lookup on a replay
+IDEMPOTENCY_QUERIES = 2
+
+
+def idempotency_scope(route: str, restaurant_id: int, username: str) -> str:
+    """Scope of a stored response: the same key from another user or restaurant is a different request."""
+    return f"{route}:{restaurant_id}:{username}"
+
+
+def request_hash(payload: Any) -> str:
+    canonical = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class idempotency_service:
+
+    async def reserve(self, key: str, scope: str, digest: str, session: AsyncSession) -> Optional[IdempotencyRecord]:
+        """Claim `key` for this request; returns the existing record if someone already did."""
+        statement = (
+            insert_for(session, IdempotencyRecord)
+            .values(key=key, scope=scope, request_hash=digest, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["key", "scope"])
+            .returning(IdempotencyRecord.key)
+        )
+        result = await session.execute(statement)
+        claimed = result.first() is not None
+        await session.commit()
+        if claimed:
+            return None
+        result = await session.exec(
+            select(IdempotencyRecord).where(IdempotencyRecord.key == key, IdempotencyRecord.scope == scope)
+        )
+        return result.first()
+
+    async def complete(self, key: str, scope: str, status_code: int, body: Any, session: AsyncSession) -> None:
+        await session.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key, IdempotencyRecord.scope == scope)
+            .values(status_code=status_code, response=body)
+        )
+        await session.commit()
+
+    async def release(self, key: str, scope: str, session: AsyncSession) -> None:
+        """Forget a reservation whose request failed, so a retry runs it again."""
+        await session.rollback()
+        await session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.key == key, IdempotencyRecord.scope == scope)
+        )
+        await session.commit()
+
+    async def purge(self, session: AsyncSession) -> int:
+        """Drop expired responses, abandoned reservations, and the oldest keys beyond the cap."""
+        now = datetime.utcnow()
+        expired = await session.execute(
+            delete(IdempotencyRecord).where(or_(
+                IdempotencyRecord.created_at < now - timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS),
+                and_(
+                    IdempotencyRecord.status_code.is_(None),
+                    IdempotencyRecord.created_at < now - timedelta(seconds=config.IDEMPOTENCY_PENDING_TIMEOUT),
+                ),
+            ))
+        )
+        newest = (
+            select(IdempotencyRecord.created_at)
+            .order_by(IdempotencyRecord.created_at.desc())
+            .offset(config.IDEMPOTENCY_MAX_KEYS)
+            .limit(1)
+            .scalar_subquery()
+        )
+        overflow = await session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.created_at <= newest)
+        )
+        await session.commit()
+        return (expired.rowcount or 0) + (overflow.rowcount or 0)
+
+
+async def run_idempotent(
+    key: Optional[str],
+    scope: str,
+    payload: Any,
+    session: AsyncSession,
+    handler: Callable[[], Awaitable[Any]],
+    status_code: int = status.HTTP_200_OK,
+):
+    """Run a mutating route handler at most once per Idempotency-Key.
+
+    Without a key the handler simply runs. With one, the first response is
+    stored and replayed for retries with the same key and request; a retry
+    while the first request is still running gets 409, and reusing a key
+    for a different request gets 422.
+    """
+    if not key:
+        return await handler()
+
+    stats = current_stats()
+    if stats is not None and stats.budget is not None:
+        stats.budget += IDEMPOTENCY_QUERIES
+
+    service = idempotency_service()
+    digest = request_hash(payload)
+    existing = await service.reserve(key, scope, digest, session)
+    if existing is not None:
+        if existing.request_hash != digest:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request.",
+            )
+        if existing.status_code is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress.",
+            )
+        if config.METRICS_ENABLED:
+            IDEMPOTENT_REPLAYS.inc(scope=scope.split(":", 1)[0])
+        return JSONResponse(
+            content=existing.response,
+            status_code=existing.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        result = await handler()
+    except BaseException:
+        await asyncio.shield(service.release(key, scope, session))
+        raise
+    body = jsonable_encoder(result)
+    await service.complete(key, scope, status_code, body, session)
+    return body
+
+
+async def run_idempotency_purger(stop: asyncio.Event):
+    """Background loop trimming the idempotency table every IDEMPOTENCY_PURGE_INTERVAL seconds."""
+    service = idempotency_service()
+    while not stop.is_set():
+        try:
+            async with async_session() as session:
+                await service.purge(session)
+        except Exception as e:
+            log.exception("idempotency purge failed: %s", e)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=config.IDEMPOTENCY_PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,249 @@
+"""Bulk menu import and export keyed on `Menu.item_code` within one restaurant.
+
+Uploads are parsed line by line as they stream in (CSV with a header row,
+or NDJSON), validated per row, and loaded in batches: with asyncpg the
+rows are COPY'd into a temporary staging table and merged with one
+`INSERT ... ON CONFLICT (restaurant_id, item_code)`; other drivers
+(including SQLite in tests) get batched upserts. Everything runs in one
+transaction that bumps the restaurant's menu version once.
+"""
+import codecs
+import csv
+import io
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import text
+
+from backend.app.db.main import async_session, insert_for
+from backend.app.db.models.menu_model import Menu
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.order_service import order_service, menu_snapshot_for
+from backend.config import config
+
+FORMATS = ("csv", "ndjson")
+CSV_COLUMNS = ("item_code", "item_name", "item_price")
+EXPORT_COLUMNS = ("item_id", "item_code", "item_name", "item_price")
+
+orderservice = order_service()
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: list[dict] = field(default_factory=list)
+    menu_version: Optional[int] = None
+    applied: bool = False
+
+    def reject(self, line: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < config.MENU_IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    """Numbered text lines from a byte stream, decoded incrementally as UTF-8."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    number = 0
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *complete, buffer = buffer.split("\n")
+        for line in complete:
+            number += 1
+            yield number, line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield number + 1, buffer.rstrip("\r")
+
+
+def validate_row(raw: dict) -> tuple[str, str, float]:
+    code = str(raw.get("item_code") or "").strip()
+    name = str(raw.get("item_name") or "").strip()
+    if not code:
+        raise RowError("item_code is required")
+    if not name:
+        raise RowError("item_name is required")
+    try:
+        price = float(raw.get("item_price"))
+    except (TypeError, ValueError):
+        raise RowError(f"item_price {raw.get('item_price')!r} is not a number")
+    if not math.isfinite(price) or price < 0:
+        raise RowError("item_price must be a non-negative number")
+    return code, name, price
+
+
+async def parse_rows(chunks: AsyncIterator[bytes], fmt: str, report: ImportReport) -> AsyncIterator[tuple[str, str, float]]:
+    """Valid (item_code, item_name, item_price) rows; invalid ones are recorded on `report`."""
+    header: Optional[list[str]] = None
+    async for number, line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [h.strip() for h in next(csv.reader([line]))]
+            missing = set(CSV_COLUMNS) - set(header)
+            if missing:
+                raise RowError(f"CSV header is missing {', '.join(sorted(missing))}")
+            continue
+
+        report.received += 1
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise RowError(f"expected {len(header)} fields, got {len(values)}")
+                raw = dict(zip(header, values))
+            else:
+                try:
+                    raw = json.loads(line)
+                except ValueError as e:
+                    raise RowError(f"invalid JSON: {e}")
+                if not isinstance(raw, dict):
+                    raise RowError("each line must be a JSON object")
+            yield validate_row(raw)
+        except RowError as e:
+            report.reject(number, str(e))
+
+
+class menu_bulk_service:
+
+    async def _driver_connection(self, session: AsyncSession) -> Any:
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        return raw.driver_connection
+
+    async def _copy_import(self, driver: Any, rows: AsyncIterator, session: AsyncSession, report: ImportReport, restaurant_id: int) -> None:
+        await session.execute(text(
+            "CREATE TEMP TABLE menu_import (ord bigint, item_code text, item_name text, item_price double precision) ON COMMIT DROP"
+        ))
+        batch, ordinal = [], 0
+        async for code, name, price in rows:
+            ordinal += 1
+            batch.append((ordinal, code, name, price))
+            if len(batch) >= config.MENU_IMPORT_BATCH:
+                await driver.copy_records_to_table("menu_import", records=batch)
+                batch = []
+        if batch:
+            await driver.copy_records_to_table("menu_import", records=batch)
+
+        # the last row for a repeated item_code wins; xmax = 0 marks freshly inserted rows
+        result = await session.execute(text("""
+            INSERT INTO menu (restaurant_id, item_code, item_name, item_price)
+            SELECT DISTINCT ON (item_code) :restaurant_id, item_code, item_name, item_price
+            FROM menu_import ORDER BY item_code, ord DESC
+            ON CONFLICT (restaurant_id, item_code) DO UPDATE
+                SET item_name = EXCLUDED.item_name, item_price = EXCLUDED.item_price
+            RETURNING (xmax = 0) AS inserted
+        """), {"restaurant_id": restaurant_id})
+        for (inserted,) in result.all():
+            if inserted:
+                report.inserted += 1
+            else:
+                report.updated += 1
+
+    async def _upsert_batch(self, batch: dict[str, tuple[str, float]], session: AsyncSession, report: ImportReport, restaurant_id: int) -> None:
+        statement = insert_for(session, Menu).values([
+            {"restaurant_id": restaurant_id, "item_code": code, "item_name": name, "item_price": price}
+            for code, (name, price) in batch.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=["restaurant_id", "item_code"],
+            set_={"item_name": statement.excluded.item_name, "item_price": statement.excluded.item_price},
+        )
+        if session.bind.dialect.name == "postgresql":
+            # xmax = 0 marks freshly inserted rows
+            result = await session.execute(statement.returning(text("(xmax = 0)")))
+            inserted = sum(1 for (fresh,) in result.all() if fresh)
+        else:
+            # no xmax elsewhere: count the codes that exist before the upsert
+            existing = await session.execute(
+                select(Menu.item_code).where(Menu.restaurant_id == restaurant_id, Menu.item_code.in_(batch))
+            )
+            inserted = len(batch) - len(existing.all())
+            await session.execute(statement)
+        report.inserted += inserted
+        report.updated += len(batch) - inserted
+
+    async def _batched_import(self, rows: AsyncIterator, session: AsyncSession, report: ImportReport, restaurant_id: int) -> None:
+        # a dict per batch, since one upsert may not touch the same key twice
+        batch: dict[str, tuple[str, float]] = {}
+        async for code, name, price in rows:
+            batch.pop(code, None)
+            batch[code] = (name, price)
+            if len(batch) >= config.MENU_IMPORT_BATCH:
+                await self._upsert_batch(batch, session, report, restaurant_id)
+                batch = {}
+        if batch:
+            await self._upsert_batch(batch, session, report, restaurant_id)
+
+    async def import_menu(self, chunks: AsyncIterator[bytes], fmt: str, session: AsyncSession, atomic: bool = False, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> ImportReport:
+        """Stream an upload into the restaurant's menu. Invalid rows are skipped and reported;
+        with `atomic` any invalid row rolls the whole import back.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        report = ImportReport()
+        rows = parse_rows(chunks, fmt, report)
+        try:
+            driver = await self._driver_connection(session)
+            if hasattr(driver, "copy_records_to_table"):
+                await self._copy_import(driver, rows, session, report, restaurant_id)
+            else:
+                await self._batched_import(rows, session, report, restaurant_id)
+
+            if atomic and report.rejected:
+                await session.rollback()
+                report.inserted = report.updated = 0
+                return report
+            if report.inserted or report.updated:
+                await orderservice._bump_menu_version(session, restaurant_id)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+        menu_snapshot_for(restaurant_id).invalidate()
+        report.applied = True
+        report.menu_version = await orderservice.get_menu_version(session, restaurant_id)
+        return report
+
+    async def export_menu(self, fmt: str, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> AsyncIterator[bytes]:
+        """Stream the restaurant's menu in import format (plus item_id) from a server-side cursor.
+
+        Uses its own session because the response body outlives the request's dependencies.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if fmt == "csv":
+            yield (",".join(EXPORT_COLUMNS) + "\n").encode()
+
+        statement = (
+            select(Menu.item_id, Menu.item_code, Menu.item_name, Menu.item_price)
+            .where(Menu.restaurant_id == restaurant_id)
+            .order_by(Menu.item_id)
+            .execution_options(yield_per=config.MENU_IMPORT_BATCH)
+        )
+        async with async_session() as session:
+            result = await session.stream(statement)
+            async for partition in result.partitions():
+                if fmt == "csv":
+                    out = io.StringIO()
+                    csv.writer(out, lineterminator="\n").writerows(partition)
+                    yield out.getvalue().encode()
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+                        for row in partition
+                    ).encode()
+
@@ -0,0 +1,134 @@
+import re
+from bisect import bisect_left
+from typing import Iterable, NamedTuple, Optional
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+class MenuRow(NamedTuple):
+    item_id: int
+    item_name: str
+    item_price: float
+
+
+class MenuMatch(NamedTuple):
+    item_id: int
+    item_name: str
+    item_price: float
+    score: float
+
+
+def normalize(text: str) -> str:
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MenuSearchIndex:
+    """In-memory lookup of menu items by name.
+
+    Matches are tried in order of confidence: exact name, prefix of the name
+    or of any word in it, then trigram similarity for typos ("piza",
+    "chiken burgr"). Built once per menu version.
+    """
+
+    EXACT, PREFIX, WORD_PREFIX = 1.0, 0.9, 0.8
+
+    def __init__(self, rows: Iterable[MenuRow], min_similarity: float = 0.5):
+        self.rows = list(rows)
+        self.min_similarity = min_similarity
+        self._exact: dict[str, list[int]] = {}
+        self._names: list[tuple[str, int]] = []
+        self._words: list[tuple[str, int]] = []
+        self._grams: list[set[str]] = []
+        self._by_gram: dict[str, list[int]] = {}
+        self._by_id: dict[int, MenuRow] = {row.item_id: row for row in self.rows}
+
+        for pos, row in enumerate(self.rows):
+            name = normalize(row.item_name)
+            self._exact.setdefault(name, []).append(pos)
+            self._names.append((name, pos))
+            for word in set(name.split()):
+                self._words.append((word, pos))
+            grams = trigrams(name)
+            self._grams.append(grams)
+            for gram in grams:
+                self._by_gram.setdefault(gram, []).append(pos)
+        self._names.sort()
+        self._words.sort()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def _prefixed(entries: list[tuple[str, int]], prefix: str) -> Iterable[int]:
+        i = bisect_left(entries, (prefix, -1))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            yield entries[i][1]
+            i += 1
+
+    def search(self, query: str, limit: int = 5) -> list[MenuMatch]:
+        q = normalize(query)
+        if not q:
+            return []
+        scores: dict[int, float] = {}
+
+        def offer(pos: int, score: float) -> None:
+            if score > scores.get(pos, 0.0):
+                scores[pos] = score
+
+        for pos in self._exact.get(q, ()):
+            offer(pos, self.EXACT)
+        for pos in self._prefixed(self._names, q):
+            offer(pos, self.PREFIX)
+        for pos in self._prefixed(self._words, q):
+            offer(pos, self.WORD_PREFIX)
+
+        if len(scores) < limit:
+            # trigram similarity over candidates sharing any gram: coverage of
+            # the query gates the match, Jaccard breaks ties towards shorter names
+            q_grams = trigrams(q)
+            shared: dict[int, int] = {}
+            for gram in q_grams:
+                for pos in self._by_gram.get(gram, ()):
+                    shared[pos] = shared.get(pos, 0) + 1
+            for pos, n in shared.items():
+                coverage = n / len(q_grams)
+                if coverage < self.min_similarity:
+                    continue
+                jaccard = n / (len(q_grams) + len(self._grams[pos]) - n)
+                # fuzzy matches always rank below exact/prefix hits
+                offer(pos, round((0.6 * coverage + 0.4 * jaccard) * self.WORD_PREFIX, 4))
+
+        best = sorted(scores.items(), key=lambda kv: (-kv[1], self.rows[kv[0]].item_name))[:limit]
+        return [MenuMatch(*self.rows[pos], score) for pos, score in best]
+
+    def get(self, item_id: int) -> Optional[MenuRow]:
+        return self._by_id.get(item_id)
+
+
+def compact_table(rows: Iterable, columns: tuple[str, ...]) -> dict:
+    """Encode rows as one header plus value lists instead of repeated keys."""
+    out = []
+    for row in rows:
+        if isinstance(row, dict):
+            out.append([row.get(c) for c in columns])
+        else:
+            out.append([getattr(row, c) for c in columns])
+    return {"columns": list(columns), "rows": out}
+
+
+MENU_COLUMNS = ("item_id", "item_name", "item_price")
+CART_COLUMNS = ("item_id", "item_name", "quantity", "item_price", "total_price")
+POPULAR_COLUMNS = ("item_id", "item_name", "item_price", "score")
+USUAL_COLUMNS = ("item_id", "item_name", "item_price", "order_count", "quantity_total")
+
+
+def compact_cart(cart_items: list[dict]) -> dict:
+    """Compact table of priced cart lines (as returned by `get_cart`) plus the total."""
+    table = compact_table(cart_items, CART_COLUMNS)
+    table["cart_total"] = sum(item["total_price"] or 0 for item in cart_items)
+    return table
@@ -1,151 +1,270 @@
+import asyncio
+import time
 from sqlmodel.ext.asyncio.session import AsyncSession
-from backend.app.db.models.menu_model import Menu
-from backend.app.db.models.order_model import Order
+from backend.app.db.models.menu_model import Menu, MenuVersion
+from backend.app.db.models.order_model import Order, ORDER_STATUSES
 from backend.app.db.models.orderitems_model import OrderItem
 from backend.app.db.models.cart_model import CartItem
 from sqlmodel import select, desc
-from sqlalchemy.orm import selectinload
-from backend.app.db.schemas import user, order, menu, order_item
+from sqlalchemy import delete, update
+from backend.app.db.schemas import user, order, menu, order_item, CartOp
 from passlib.context import CryptContext
 from datetime import timedelta, datetime, timezone
 from jose import JWTError, jwt
+from backend.app.services.menu_index import MenuRow, MenuSearchIndex
+from backend.app.services.cart_store import CartLine, cart_store
+from backend.app.services.popularity import popularity_for, record_order_counts
+from backend.app.db.models.popularity_model import UserItemCount
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.config import config
+
+
+class MenuSnapshot:
+    """Process-wide copy of one restaurant's menu and its search index, keyed by menu version."""
+
+    def __init__(self):
+        self.version: int | None = None
+        self.rows: list[MenuRow] = []
+        self.index = MenuSearchIndex([])
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.checked_at = 0.0
+
+
+# one snapshot per restaurant, so a menu change only reloads that restaurant
+menu_snapshots: dict[int, MenuSnapshot] = {}
+
+
+def menu_snapshot_for(restaurant_id: int) -> MenuSnapshot:
+    snap = menu_snapshots.get(restaurant_id)
+    if snap is None:
+        snap = menu_snapshots[restaurant_id] = MenuSnapshot()
+    return snap
+
+
+def _priced_line(username: str, line: CartLine, menu_item: MenuRow | None) -> dict:
+    return {
+        "cart_id": line.cart_id,
+        "username": username,
+        "item_id": line.item_id,
+        "quantity": line.quantity,
+        "item_name": menu_item.item_name if menu_item else None,
+        "item_price": menu_item.item_price if menu_item else None,
+        "total_price": (
+            line.quantity * menu_item.item_price
+            if menu_item else None
+        ),
+    }
+
+
+def _order_dict(new_order: Order, items: list[OrderItem]) -> dict:
+    return {
+        "order": {
+            "order_id": new_order.order_id, "restaurant_id": new_order.restaurant_id,
+            "username": new_order.username, "status": new_order.status,
+        },
+        "items": [{"order_id": oi.order_id, "item_id": oi.item_id, "quantity": oi.quantity} for oi in items],
+    }
+
 
 class order_service:
+
+    async def get_menu_version(self, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> int:
+        result = await session.exec(select(MenuVersion.version).where(MenuVersion.id == restaurant_id))
+        return result.first() or 0
+
+    async def _bump_menu_version(self, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Increment the restaurant's menu version inside the caller's transaction."""
+        result = await session.execute(
+            update(MenuVersion).where(MenuVersion.id == restaurant_id).values(version=MenuVersion.version + 1)
+        )
+        if result.rowcount == 0:
+            session.add(MenuVersion(id=restaurant_id, version=1))
+
+    async def get_menu_snapshot(self, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> MenuSnapshot:
+        """Return the restaurant's cached menu, reloading it only when its menu version moved."""
+        snap = menu_snapshot_for(restaurant_id)
+        if snap.version is not None and time.monotonic() - snap.checked_at < config.MENU_CACHE_TTL:
+            return snap
+        async with snap.lock:
+            if snap.version is not None and time.monotonic() - snap.checked_at < config.MENU_CACHE_TTL:
+                return snap
+            # read the version first so the rows are never older than it
+            version = await self.get_menu_version(session, restaurant_id)
+            if version != snap.version:
+                statement = (
+                    select(Menu.item_id, Menu.item_name, Menu.item_price)
+                    .where(Menu.restaurant_id == restaurant_id)
+                    .order_by(Menu.item_id)
+                )
+                result = await session.exec(statement)
+                snap.rows = [MenuRow(*row) for row in result.all()]
+                snap.index = MenuSearchIndex(snap.rows)
+                snap.version = version
+            snap.checked_at = time.monotonic()
+        return snap
+
+    async def get_menu(self, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        return [row._asdict() for row in snap.rows]
+
+    async def search_menu(self, query: str, session: AsyncSession, limit: int = 5, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Find menu items by exact, prefix or fuzzy (trigram) name match."""
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        return snap.index.search(query, limit)
     
-    async def get_menu(self, session: AsyncSession):
-        statement = select(Menu)
-        result = await session.exec(statement)
-        return result.all()
-    
-    async def create_menu_item(self, item_data: menu, session: AsyncSession):
+    async def create_menu_item(self, item_data: menu, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
         item_data_dict = item_data.model_dump()
         new_item = Menu(
-            **item_data_dict
+            **item_data_dict, restaurant_id=restaurant_id
         )
         session.add(new_item)
+        await self._bump_menu_version(session, restaurant_id)
         await session.commit()
         await session.refresh(new_item)
+        menu_snapshot_for(restaurant_id).invalidate()
         return new_item
     
     
     
-    async def get_order(self, username: str, status: str, session: AsyncSession):
+    async def get_order(self, username: str, status: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
 
-        allowed = {"recieved", "preparing"}
-        if status.lower() not in allowed:
+        if status.lower() not in ORDER_STATUSES:
             return []
 
-        statement = select(Order).where(Order.username == username, Order.status == status)
+        statement = select(Order).where(
+            Order.restaurant_id == restaurant_id, Order.username == username, Order.status == status
+        )
         result = await session.exec(statement)
         return result.all()
 
-    async def create_order(self, order_data: order, items: list[order_item], session: AsyncSession):
+    async def get_recent_order_statuses(self, username: str, since: datetime, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> dict[int, str]:
+        """{order_id: status} of the user's orders placed at or after `since`, completed ones included."""
+        statement = select(Order.order_id, Order.status).where(
+            Order.restaurant_id == restaurant_id, Order.username == username, Order.created_at >= since
+        )
+        result = await session.exec(statement)
+        return dict(result.all())
+
+    async def create_order(self, order_data: order, items: list[order_item], session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Create an Order with the given items; raises ValueError for items not on the restaurant's menu."""
+        # the item_id foreign key accepts any restaurant's item
+        await self._check_menu_items({it.item_id for it in items}, session, restaurant_id)
 
         # create the Order row
         order_dict = order_data.model_dump()
         # remove order_id if provided
         order_dict.pop("order_id", None)
 
-        new_order = Order(**order_dict)
-        session.add(new_order)
-        await session.commit()
-        await session.refresh(new_order)
-
+        new_order = Order(**order_dict, restaurant_id=restaurant_id)
         created_items = []
         try:
+            session.add(new_order)
+            # flush to get the order_id, then commit order and items together
+            await session.flush()
+
+            quantities: dict[int, int] = {}
             for it in items:
                 it_dict = it.model_dump()
-                oi = OrderItem(order_id=new_order.order_id, item_id=it_dict["item_id"], quantity=it_dict["quantity"])
+                oi = OrderItem(
+                    restaurant_id=restaurant_id, order_id=new_order.order_id,
+                    item_id=it_dict["item_id"], quantity=it_dict["quantity"],
+                )
                 session.add(oi)
                 created_items.append(oi)
+                quantities[oi.item_id] = quantities.get(oi.item_id, 0) + oi.quantity
 
+            await record_order_counts(new_order.username, quantities, session, restaurant_id)
             await session.commit()
-            # refresh created order items so they contain any defaults from DB
-            for oi in created_items:
-                await session.refresh(oi)
 
         except Exception:
             await session.rollback()
             raise
 
-        return {"order": new_order, "items": created_items}
+        popularity_for(restaurant_id).record(quantities)
+
+        return _order_dict(new_order, created_items)
     
-    async def create_order_from_cart(self, username: str, session: AsyncSession):
-        """Create an Order from the user's cart, create OrderItems, and clear the cart.
+    async def create_order_from_cart(self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Create an Order from the user's cart at one restaurant, create OrderItems, and clear the cart.
 
         Returns a dict with 'order' and 'items'.
         """
-        # load cart items
-        stmt = select(CartItem).where(CartItem.username == username)
-        result = await session.exec(stmt)
-        cart_rows = result.all()
-        if not cart_rows:
-            raise ValueError("cart is empty")
-
-        # build order data
-        new_order = Order(username=username, status="recieved")
-        session.add(new_order)
-        await session.commit()
-        await session.refresh(new_order)
-
-        created_items = []
-        try:
-            for c in cart_rows:
-                oi = OrderItem(order_id=new_order.order_id, item_id=c.item_id, quantity=c.quantity)
-                session.add(oi)
-                created_items.append(oi)
-
-            await session.commit()
-
-            for oi in created_items:
-                await session.refresh(oi)
-
-            # clear cart for user
-            for c in cart_rows:
-                await session.delete(c)
-            await session.commit()
-            
-            self.delete_cart( username, session)
-
-        except Exception:
-            await session.rollback()
-            raise
-
-        return {"order": new_order, "items": created_items}
-
-    async def get_most_recent_order(self, username: str, session: AsyncSession):
-        """Return the most recent Order for a username, formatted as specified."""
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            if not state.lines:
+                raise ValueError("cart is empty")
+
+            # build order data
+            new_order = Order(restaurant_id=restaurant_id, username=username, status="recieved")
+            created_items = []
+            try:
+                session.add(new_order)
+                await session.flush()
+
+                for line in state.lines.values():
+                    oi = OrderItem(
+                        restaurant_id=restaurant_id, order_id=new_order.order_id,
+                        item_id=line.item_id, quantity=line.quantity,
+                    )
+                    session.add(oi)
+                    created_items.append(oi)
+                await session.flush()
+
+                # clear cart for user in the same transaction
+                await session.execute(
+                    delete(CartItem).where(CartItem.restaurant_id == restaurant_id, CartItem.username == username)
+                )
+                await record_order_counts(username, state.quantities(), session, restaurant_id)
+                await session.commit()
+
+            except BaseException:
+                await session.rollback()
+                await cart_store.drop(username, restaurant_id, session)
+                raise
+
+            await cart_store.cleared(state, session)
+            popularity_for(restaurant_id).record(state.quantities())
+
+        return _order_dict(new_order, created_items)
+
+    async def get_most_recent_order(self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Return the user's most recent Order at the restaurant, formatted as specified."""
 
         statement = (
-            select(Order)
-            .options(
-                selectinload(Order.items).selectinload(OrderItem.menu_item),  # Eager load related data
-                selectinload(Order.user)
-            )
-            .where(Order.username == username)
+            select(Order.order_id, Order.username, Order.status)
+            .where(Order.restaurant_id == restaurant_id, Order.username == username)
             .order_by(desc(Order.order_id))
             .limit(1)
         )
-
         result = await session.exec(statement)
         order = result.first()
 
         if not order:
             return None
 
+        # only the columns the response needs, no ORM objects or eager loads
+        statement = (
+            select(Menu.item_name, OrderItem.quantity, Menu.item_price)
+            .select_from(OrderItem)
+            .outerjoin(Menu, Menu.item_id == OrderItem.item_id)
+            .where(OrderItem.restaurant_id == restaurant_id, OrderItem.order_id == order.order_id)
+        )
+        result = await session.exec(statement)
+
         items_data = []
         total_amount = 0.0
 
-        for item in order.items:
-            menu_item = item.menu_item
-            item_data = {
-                "item_name": menu_item.item_name if menu_item else None,
-                "quantity": item.quantity,
-                "price": menu_item.item_price if menu_item else 0.0,
-            }
-            items_data.append(item_data)
-            if menu_item:
-                total_amount += item.quantity * menu_item.item_price
+        for item_name, quantity, item_price in result.all():
+            items_data.append({
+                "item_name": item_name,
+                "quantity": quantity,
+                "price": item_price if item_price is not None else 0.0,
+            })
+            if item_price is not None:
+                total_amount += quantity * item_price
 
         return {
             "order_id": order.order_id,
@@ -159,38 +278,104 @@ class order_service:
     
     
     
-    async def get_cart(self, username: str, session: AsyncSession):
-        """Retrieve the current cart for a user, including menu item details."""
+    async def get_popular_items(self, session: AsyncSession, limit: int = 5, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """The restaurant's most ordered items lately, from the in-memory decayed ranking."""
+        tracker = popularity_for(restaurant_id)
+        await tracker.refresh(session)
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        rows = []
+        # items dropped from the menu are skipped, so look a little past `limit`
+        for item_id, score in tracker.ranked(config.POPULARITY_TOP_N):
+            menu_item = snap.index.get(item_id)
+            if menu_item is not None:
+                rows.append({**menu_item._asdict(), "score": round(score, 2)})
+            if len(rows) >= limit:
+                break
+        return rows
+
+    async def get_usual_items(self, username: str, session: AsyncSession, limit: int = 5, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """The user's most often ordered items at the restaurant, from the per-user counters."""
         statement = (
-            select(CartItem)
-            .where(CartItem.username == username)
-            .options(selectinload(CartItem.menu_item))
+            select(UserItemCount.item_id, UserItemCount.order_count, UserItemCount.quantity_total)
+            .where(UserItemCount.username == username, UserItemCount.restaurant_id == restaurant_id)
+            .order_by(desc(UserItemCount.order_count), desc(UserItemCount.last_ordered_at))
+            .limit(limit)
         )
         result = await session.exec(statement)
-        rows = result.all()
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        rows = []
+        for item_id, order_count, quantity_total in result.all():
+            menu_item = snap.index.get(item_id)
+            if menu_item is not None:
+                rows.append({**menu_item._asdict(), "order_count": order_count, "quantity_total": quantity_total})
+        return rows
+
+    async def get_recommendations(self, username: str, session: AsyncSession, limit: int = 5, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        return {
+            "popular": await self.get_popular_items(session, limit, restaurant_id),
+            "usual": await self.get_usual_items(username, session, limit, restaurant_id),
+        }
+
+    async def get_cart(self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID, from_db: bool = False):
+        """Retrieve the user's current cart at the restaurant, including menu item details.
 
-        if not rows:
+        `from_db` reads the committed rows instead of this process's hot copy,
+        for callers that may run in a different worker than the cart writes.
+        """
+        if from_db:
+            state = await cart_store.read(username, session, restaurant_id)
+        else:
+            state = await cart_store.load(username, session, restaurant_id)
+        if not state.lines:
             return []
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        return [_priced_line(username, line, snap.index.get(line.item_id)) for line in state.lines.values()]
 
-        # Convert to JSON-friendly structure
-        cart_with_menu = []
-        for item in rows:
-            cart_with_menu.append({
-                "cart_id": item.cart_id,
-                "username": item.username,
-                "item_id": item.item_id,
-                "quantity": item.quantity,
-                "item_name": item.menu_item.item_name if item.menu_item else None,
-                "item_price": item.menu_item.item_price if item.menu_item else None,
-                "total_price": (
-                    item.quantity * item.menu_item.item_price
-                    if item.menu_item else None
-                ),
-            })
+    async def get_cart_revision(self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> int:
+        state = await cart_store.load(username, session, restaurant_id)
+        return state.revision
+
+    async def _check_menu_items(self, item_ids, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID) -> MenuSnapshot:
+        snap = await self.get_menu_snapshot(session, restaurant_id)
+        for item_id in item_ids:
+            if snap.index.get(item_id) is None:
+                raise ValueError(f"menu item {item_id} not found")
+        return snap
+
+    async def apply_cart_changes(self, username: str, ops: list[CartOp], session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
+        """Apply a list of add/set/remove operations in one transaction.
+
+        - add: increase the item's quantity by `quantity` (creating the line)
+        - set: set the quantity exactly; 0 or less removes the line
+        - remove: drop the line if present
+
+        Returns the resulting cart in the same shape as `get_cart`.
+        """
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            quantities = state.quantities()
+            snap = await self._check_menu_items(
+                {op.item_id for op in ops if op.op != "remove"}, session, restaurant_id
+            )
+
+            for op in ops:
+                if op.op == "remove":
+                    quantities.pop(op.item_id, None)
+                    continue
+                if op.op == "add" and op.quantity <= 0:
+                    raise ValueError("quantities must be > 0")
 
-        return cart_with_menu
+                new_qty = op.quantity + (quantities.get(op.item_id, 0) if op.op == "add" else 0)
+                if new_qty <= 0:
+                    quantities.pop(op.item_id, None)
+                else:
+                    quantities[op.item_id] = new_qty
+
+            state = await cart_store.write(state, quantities, session)
+
+        return [_priced_line(username, line, snap.index.get(line.item_id)) for line in state.lines.values()]
 
-    async def add_to_cart(self, username: str, item_id: int = None, quantity: int = 1, items: list = None, session: AsyncSession = None):
+    async def add_to_cart(self, username: str, item_id: int = None, quantity: int = 1, items: list = None, session: AsyncSession = None, restaurant_id: int = DEFAULT_RESTAURANT_ID):
         """Add one or more items to the user's cart.
 
         Usage:
@@ -198,7 +383,7 @@ class order_service:
         - Multiple items: provide `items` as a list where each entry is either
           a dict {'item_id': int, 'quantity': int} or a tuple (item_id, quantity).
 
-        Returns a list of CartItem rows that were created/updated.
+        Returns the created/updated lines as plain dicts (CartItem fields).
         """
         if session is None:
             raise ValueError("session is required")
@@ -228,89 +413,58 @@ class order_service:
             if _qty <= 0:
                 raise ValueError("quantities must be > 0")
 
-        processed = []
-        try:
-            # Validate all menu items exist first
-            for _iid, _qty in to_process:
-                stmt_menu = select(Menu).where(Menu.item_id == _iid)
-                res_menu = await session.exec(stmt_menu)
-                menu_row = res_menu.one_or_none()
-                if not menu_row:
-                    raise ValueError(f"menu item {_iid} not found")
-
-            # Process each cart entry: either increment existing or create new
-            for _iid, _qty in to_process:
-                stmt = select(CartItem).where(CartItem.username == username, CartItem.item_id == _iid)
-                result = await session.exec(stmt)
-                existing = result.one_or_none()
-
-                if existing:
-                    existing.quantity = existing.quantity + _qty
-                    session.add(existing)
-                    processed.append(existing)
-                else:
-                    new_cart = CartItem(username=username, item_id=_iid, quantity=_qty)
-                    session.add(new_cart)
-                    processed.append(new_cart)
-
-            # commit once for the batch
-            await session.commit()
+        # merge repeated item ids so each one is touched once
+        merged: dict[int, int] = {}
+        for _iid, _qty in to_process:
+            merged[_iid] = merged.get(_iid, 0) + _qty
 
-            # refresh processed rows to pick up defaults
-            for row in processed:
-                await session.refresh(row)
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            # validate all menu items against the restaurant's cached menu
+            await self._check_menu_items(merged, session, restaurant_id)
 
-        except Exception:
-            await session.rollback()
-            raise
+            quantities = state.quantities()
+            for _iid, _qty in merged.items():
+                quantities[_iid] = quantities.get(_iid, 0) + _qty
+            state = await cart_store.write(state, quantities, session)
 
-        return processed
+        return [row for row in state.as_dicts() if row["item_id"] in merged]
 
-    async def update_cart(self, username: str, item_id: int, quantity: int, session: AsyncSession):
+    async def update_cart(self, username: str, item_id: int, quantity: int, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
         """Update the quantity of a cart item. If quantity <= 0 the item is removed.
 
-        Returns the updated CartItem or None if removed.
+        Returns the updated line as a dict, or None if removed.
         """
-        stmt = select(CartItem).where(CartItem.username == username, CartItem.item_id == item_id)
-        result = await session.exec(stmt)
-        existing = result.one_or_none()
-        if not existing:
-            raise ValueError("cart item not found")
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            if item_id not in state.lines:
+                raise ValueError("cart item not found")
+
+            quantities = state.quantities()
+            if quantity <= 0:
+                # remove
+                quantities.pop(item_id)
+            else:
+                quantities[item_id] = quantity
+            state = await cart_store.write(state, quantities, session)
 
         if quantity <= 0:
-            # remove
-            await session.delete(existing)
-            await session.commit()
             return None
-        else:
-            existing.quantity = quantity
-            session.add(existing)
-            await session.commit()
-            await session.refresh(existing)
-            return existing
+        return next(row for row in state.as_dicts() if row["item_id"] == item_id)
         
-    async def delete_cart_item( self, username: str, item_id: int, session: AsyncSession):
+    async def delete_cart_item( self, username: str, item_id: int, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
         """Delete a specific cart item for a user."""
-        stmt = select(CartItem).where(CartItem.username == username, CartItem.item_id == item_id)
-        result = await session.exec(stmt)
-        cart_item = result.one_or_none()
-        if cart_item:
-            await session.delete(cart_item)
-            await session.commit()
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            if item_id in state.lines:
+                quantities = state.quantities()
+                quantities.pop(item_id)
+                await cart_store.write(state, quantities, session)
         
         
         
-    async def delete_cart( self, username: str, session: AsyncSession):
+    async def delete_cart( self, username: str, session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID):
         """Delete all cart items for a user."""
-        stmt = select(CartItem).where(CartItem.username == username)
-        result = await session.exec(stmt)
-        cart_rows = result.all()
-        for c in cart_rows:
-            await session.delete(c)
-        await session.commit()
-
-
-    
-    
-    
-    
\ No newline at end of file
+        async with cart_store.lock(username, restaurant_id):
+            state = await cart_store.load(username, session, restaurant_id, for_update=True)
+            await cart_store.write(state, {}, session)
@@ -0,0 +1,133 @@
+"""Item popularity, maintained as orders are placed instead of scanned on demand.
+
+Checkout bumps `ItemPopularity` and `UserItemCount` in the order's transaction.
+Each process also keeps a time-decayed score per item in memory: an order
+adds `quantity * 2 ** (t / half_life)` (forward decay), so old scores never
+need touching, and the top `POPULARITY_TOP_N` items are kept sorted and
+only re-sorted when an order lands in or above them.
+"""
+import asyncio
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+
+from backend.app.db.models.popularity_model import ItemPopularity, UserItemCount
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.db.main import insert_for
+from backend.config import config
+
+
+async def record_order_counts(
+    username: str, quantities: Dict[int, int], session: AsyncSession, restaurant_id: int = DEFAULT_RESTAURANT_ID,
+) -> None:
+    """Add one order's `{item_id: quantity}` to the counters, in the caller's transaction."""
+    if not quantities:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"restaurant_id": restaurant_id, "item_id": item_id, "order_count": 1, "quantity_total": qty, "last_ordered_at": now}
+        for item_id, qty in quantities.items()
+    ]
+    for model, key, extra in (
+        (ItemPopularity, ["item_id"], {}),
+        (UserItemCount, ["username", "restaurant_id", "item_id"], {"username": username}),
+    ):
+        statement = insert_for(session, model).values([{**extra, **row} for row in rows])
+        statement = statement.on_conflict_do_update(
+            index_elements=key,
+            set_={
+                "order_count": model.order_count + 1,
+                "quantity_total": model.quantity_total + statement.excluded.quantity_total,
+                "last_ordered_at": statement.excluded.last_ordered_at,
+            },
+        )
+        await session.execute(statement)
+
+
+class PopularityTracker:
+    """Decayed item scores with a sorted top-N for one restaurant, in one process."""
+
+    def __init__(self, restaurant_id: int, half_life_hours: float, top_n: int):
+        self.restaurant_id = restaurant_id
+        self.rate = math.log(2) / (half_life_hours * 3600)
+        self.top_n = top_n
+        self.origin = time.time()
+        self.scores: Dict[int, float] = {}
+        self.top: List[Tuple[float, int]] = []
+        self.loaded_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _weight(self, at: float) -> float:
+        return math.exp(self.rate * (at - self.origin))
+
+    def _rescale(self, now: float) -> None:
+        # keep the weights in float range by moving the origin forward now and then
+        factor = 1 / self._weight(now)
+        self.scores = {item_id: score * factor for item_id, score in self.scores.items()}
+        self.top = [(score * factor, item_id) for score, item_id in self.top]
+        self.origin = now
+
+    def _rebuild_top(self) -> None:
+        self.top = sorted(((s, i) for i, s in self.scores.items()), reverse=True)[:self.top_n]
+
+    def add(self, item_id: int, quantity: float, at: float | None = None) -> None:
+        at = time.time() if at is None else at
+        if self.rate * (at - self.origin) > 300:
+            self._rescale(at)
+        score = self.scores.get(item_id, 0.0) + quantity * self._weight(at)
+        self.scores[item_id] = score
+        # scores only grow, so the top list changes only if this item reaches it
+        if any(i == item_id for _, i in self.top):
+            self.top = sorted(((self.scores[i], i) for _, i in self.top), reverse=True)
+        elif len(self.top) < self.top_n or score > self.top[-1][0]:
+            self.top = sorted(self.top + [(score, item_id)], reverse=True)[:self.top_n]
+
+    def record(self, quantities: Dict[int, int]) -> None:
+        now = time.time()
+        for item_id, qty in quantities.items():
+            self.add(item_id, qty, now)
+
+    def ranked(self, limit: int) -> List[Tuple[int, float]]:
+        """Top items as (item_id, score), score decayed to now."""
+        scale = 1 / self._weight(time.time())
+        return [(item_id, score * scale) for score, item_id in self.top[:limit]]
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """Rebuild the scores from the counters every POPULARITY_REFRESH_SECONDS.
+
+        Each item's total is treated as if it was all ordered at its last
+        order time; between refreshes this process adds its own checkouts,
+        and the refresh picks up those of other processes.
+        """
+        if time.monotonic() - self.loaded_at < config.POPULARITY_REFRESH_SECONDS:
+            return
+        async with self.lock:
+            if time.monotonic() - self.loaded_at < config.POPULARITY_REFRESH_SECONDS:
+                return
+            result = await session.exec(
+                select(ItemPopularity.item_id, ItemPopularity.quantity_total, ItemPopularity.last_ordered_at)
+                .where(ItemPopularity.restaurant_id == self.restaurant_id)
+            )
+            self.origin = time.time()
+            self.scores = {}
+            for item_id, quantity_total, last_ordered_at in result.all():
+                at = last_ordered_at.replace(tzinfo=timezone.utc).timestamp()
+                self.scores[item_id] = quantity_total * self._weight(min(at, self.origin))
+            self._rebuild_top()
+            self.loaded_at = time.monotonic()
+
+
+_trackers: Dict[int, PopularityTracker] = {}
+
+
+def popularity_for(restaurant_id: int) -> PopularityTracker:
+    tracker = _trackers.get(restaurant_id)
+    if tracker is None:
+        tracker = _trackers[restaurant_id] = PopularityTracker(
+            restaurant_id, config.POPULARITY_HALF_LIFE_HOURS, config.POPULARITY_TOP_N
+        )
+    return tracker
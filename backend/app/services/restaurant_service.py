@@ -0,0 +1,39 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from backend.app.db.models.restaurant_model import Restaurant
+from backend.app.db.models.menu_model import MenuVersion
+from backend.app.db.main import create_partitions
+
+# restaurants seen by this process; restaurants are never deleted, so a hit needs no query
+_known_restaurants: set[int] = set()
+
+
+class restaurant_service:
+
+    async def list_restaurants(self, session: AsyncSession):
+        result = await session.exec(select(Restaurant.restaurant_id, Restaurant.name).order_by(Restaurant.restaurant_id))
+        return [row._asdict() for row in result.all()]
+
+    async def create_restaurant(self, name: str, session: AsyncSession):
+        """Create a restaurant with an empty menu and its own order partitions."""
+        new_restaurant = Restaurant(name=name)
+        try:
+            session.add(new_restaurant)
+            await session.flush()
+            session.add(MenuVersion(id=new_restaurant.restaurant_id, version=0))
+            await create_partitions(await session.connection(), new_restaurant.restaurant_id)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        _known_restaurants.add(new_restaurant.restaurant_id)
+        return {"restaurant_id": new_restaurant.restaurant_id, "name": new_restaurant.name}
+
+    async def exists(self, restaurant_id: int, session: AsyncSession) -> bool:
+        if restaurant_id in _known_restaurants:
+            return True
+        result = await session.exec(select(Restaurant.restaurant_id).where(Restaurant.restaurant_id == restaurant_id))
+        if result.first() is None:
+            return False
+        _known_restaurants.add(restaurant_id)
+        return True
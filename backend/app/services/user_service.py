@@ -2,7 +2,9 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from backend.app.db.models.user_model import Users
 from backend.app.db.models.conversation_msg_model import ConversationMessage
 from sqlmodel import select, desc
+from sqlalchemy import func
 from backend.app.db.schemas import user
+from backend.app.services.archive_service import archive_service
 from passlib.context import CryptContext
 from datetime import timedelta, datetime, timezone
 from jose import JWTError, jwt
@@ -44,13 +46,40 @@ class user_service:
         expires = datetime.now(timezone.utc) + timedelta(minutes=20)
         encode.update({"exp": expires})
         return jwt.encode(encode, "secret", algorithm="HS256")
+
+    def verify_token(self, token: str) -> str | None:
+        """Username from a token issued by `verify_password`, or None if it is invalid or expired."""
+        try:
+            payload = jwt.decode(token, "secret", algorithms=["HS256"])
+        except JWTError:
+            return None
+        return payload.get("username")
     
-    async def get_chat(self, username: str, session: AsyncSession):
+    async def get_chat_cursor(self, username: str, session: AsyncSession) -> tuple[int, int]:
+        """(last seq, message count) of the hot history; changes on every append, pop or archive run."""
+        statement = (
+            select(func.max(ConversationMessage.seq), func.count())
+            .where(ConversationMessage.conversation_id == username)
+        )
+        result = await session.exec(statement)
+        last_seq, count = result.one()
+        return last_seq or 0, count
+
+    async def get_chat(self, username: str, session: AsyncSession, include_archived: bool = True):
+        """Return the full chat history; `include_archived=False` skips decoding the archive."""
         statement = (
-            select(ConversationMessage)
+            select(ConversationMessage.seq, ConversationMessage.role, ConversationMessage.content, ConversationMessage.created_at)
             .where(ConversationMessage.conversation_id == username)
+            .order_by(ConversationMessage.seq.asc())
         )
         result = await session.exec(statement)
-        messages = result.all()
+        # plain dicts in the same shape as archived messages, no ORM instances
+        messages = [
+            {"conversation_id": username, "seq": seq, "role": role, "content": content, "created_at": created_at}
+            for seq, role, content, created_at in result.all()
+        ]
+        if include_archived:
+            archived = await archive_service().read_archive(username, session)
+            return archived + messages
         return messages
     
\ No newline at end of file
@@ -1,8 +1,87 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class settings(BaseSettings):
     DB_URL: str
+    # which routers this process serves: "all", "rest" (no agent imports) or "agent"
+    APP_PROFILE: str = "all"
+    # import the agent stack at startup in profiles that serve chat
+    AGENT_PRELOAD: bool = True
+    DB_ECHO: bool = False
+    DEBUG: bool = False
+    METRICS_ENABLED: bool = True
+    # fail requests that run more SQL statements than their route declares
+    QUERY_BUDGET_ENFORCE: bool = False
+    N_PLUS_ONE_THRESHOLD: int = 3
+    # sampled JSONL trace of agent tool calls; disabled when unset
+    TOOL_TRACE_PATH: Optional[str] = None
+    TOOL_TRACE_SAMPLE_RATE: float = 0.1
+    # how long a worker trusts its cached menu before re-checking the version
+    MENU_CACHE_TTL: float = 1.0
+    # share of chat turns that get a menu/cart snapshot up front (1.0 = all,
+    # lower values allow comparing TTFT and tool calls with and without it)
+    AGENT_PREFETCH_RATE: float = 1.0
+    PREFETCH_MENU_MAX_ITEMS: int = 50
+    # how often a streaming chat checks whether the client is still connected
+    DISCONNECT_POLL_INTERVAL: float = 0.5
+    # background archival of cold conversation messages
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_INTERVAL_SECONDS: float = 300.0
+    ARCHIVE_AFTER_DAYS: float = 7.0
+    ARCHIVE_KEEP_LAST: int = 50
+    ARCHIVE_CHUNK_MESSAGES: int = 500
+    ARCHIVE_BATCH_CONVERSATIONS: int = 100
+    # stored responses for Idempotency-Key retries on order/cart mutations
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_MAX_KEYS: int = 100_000
+    IDEMPOTENCY_PENDING_TIMEOUT: float = 60.0
+    IDEMPOTENCY_PURGE_INTERVAL: float = 60.0
+    # hot cart store: "memory" (per worker) or "redis" (shared, needs the redis extra and CART_STORE_URL);
+    # either way copies are checked against the cart revision in Postgres before use
+    CART_STORE_BACKEND: str = "memory"
+    CART_STORE_URL: str = "redis://localhost:6379/0"
+    CART_IDLE_SECONDS: float = 1800.0
+    CART_STORE_MAX_CARTS: int = 100_000
+    # compress cacheable JSON reads at or above this size (brotli if installed, else gzip)
+    COMPRESS_MIN_BYTES: int = 1024
+    COMPRESS_LEVEL_GZIP: int = 6
+    COMPRESS_LEVEL_BR: int = 5
+    # bulk menu import: rows per COPY/upsert batch and how many row errors to report
+    MENU_IMPORT_BATCH: int = 1000
+    MENU_IMPORT_MAX_ERRORS: int = 100
+    # kitchen dispatch: claims "recieved" orders in batches and hands them to the kitchen
+    # ("preparing"), keeping at most DISPATCH_KITCHEN_CAPACITY per restaurant in preparation
+    DISPATCH_ENABLED: bool = False
+    DISPATCH_KITCHEN_CAPACITY: int = 10
+    DISPATCH_BATCH_SIZE: int = 20
+    DISPATCH_POLL_INTERVAL: float = 1.0
+    # each ordered item counts as this many seconds of extra age when prioritising,
+    # so small orders go first but large ones are not starved
+    DISPATCH_SECONDS_PER_ITEM: float = 30.0
+    # popularity: decayed top-N kept in memory, rebuilt from the counters now and then
+    POPULARITY_HALF_LIFE_HOURS: float = 72.0
+    POPULARITY_TOP_N: int = 20
+    POPULARITY_REFRESH_SECONDS: float = 300.0
+    # model router: start a hedged request on the next endpoint when the first
+    # token takes longer than this (0 disables hedging, failures still fall back)
+    LLM_HEDGE_AFTER_SECONDS: float = 2.0
+    # consecutive failures that open an endpoint's circuit, and for how long
+    LLM_CIRCUIT_FAILURES: int = 3
+    LLM_CIRCUIT_OPEN_SECONDS: float = 30.0
+    # answers to menu-only questions, keyed on restaurant, menu version and normalized prompt
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_MAX_ENTRY_BYTES: int = 8192
+    ANSWER_CACHE_MAX_PROMPT_CHARS: int = 200
+    # chat WebSocket: time allowed for the auth frame, messages queued behind the running
+    # turn, how often the user's orders are checked for status changes (0 = never), and
+    # how far back: older orders are no longer watched
+    WS_AUTH_TIMEOUT_SECONDS: float = 10.0
+    WS_MAX_PENDING_MESSAGES: int = 5
+    WS_ORDER_POLL_SECONDS: float = 3.0
+    WS_ORDER_WINDOW_HOURS: float = 24.0
     model_config = SettingsConfigDict(
         env_file= ".env",
         extra= "ignore"
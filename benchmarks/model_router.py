@@ -0,0 +1,120 @@
+"""Time to first event through `ModelRouter` with local stub endpoints.
+
+    uv run python -m benchmarks.model_router [--requests 200] [--hedge-after 0.3]
+
+The primary stub usually answers in `--fast` seconds but stalls for
+`--slow` seconds on `--stall-rate` of requests and fails on `--error-rate`
+of them; the secondary always answers in `--secondary` seconds. Each run
+streams the same requests through a router without hedging and one that
+hedges after `--hedge-after`, and prints p50/p95/p99 time to first event,
+the failures that reached the caller and the router's endpoint stats. No
+network, database or credentials are needed. The behaviour itself (who
+wins a hedge, fallback, circuit states) is covered by
+tests/test_model_router.py; this script only measures latency.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+# backend.config requires DB_URL; the router never opens a connection
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite://")
+
+from agents.models.interface import Model  # noqa: E402
+
+from backend.app.agents.my_config.model_router import ModelEndpoint, ModelRouter  # noqa: E402
+
+
+class StubModel(Model):
+    """Streams `events` placeholder events after a random first-event delay."""
+
+    def __init__(self, delays, error_rate: float = 0.0, events: int = 20, seed: int = 0):
+        self.delays = delays
+        self.error_rate = error_rate
+        self.events = events
+        self.random = random.Random(seed)
+
+    async def get_response(self, *args, **kwargs):
+        async for _ in self.stream_response(*args, **kwargs):
+            pass
+        return "ok"
+
+    async def stream_response(self, *args, **kwargs):
+        delay = self.delays(self.random)
+        failing = self.random.random() < self.error_rate
+        await asyncio.sleep(delay)
+        if failing:
+            raise ConnectionError("stub endpoint failed")
+        for i in range(self.events):
+            yield {"type": "stub.delta", "index": i}
+            await asyncio.sleep(0)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(label: str, router: ModelRouter, requests: int, concurrency: int) -> None:
+    ttfts: list[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in router.stream_response():
+                    if first is None:
+                        first = time.perf_counter() - started
+            except Exception:
+                failures += 1
+                return
+            ttfts.append(first)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    print(
+        f"{label:<12} p50 {_percentile(ttfts, 50) * 1000:8.1f} ms  p95 {_percentile(ttfts, 95) * 1000:8.1f} ms"
+        f"  p99 {_percentile(ttfts, 99) * 1000:8.1f} ms  failed {failures}"
+    )
+    for stats in router.stats():
+        print(f"{'':12} {stats}")
+
+
+def _endpoints(args) -> list[ModelEndpoint]:
+    def primary_delay(rng: random.Random) -> float:
+        return args.slow if rng.random() < args.stall_rate else args.fast * rng.uniform(0.5, 1.5)
+
+    def secondary_delay(rng: random.Random) -> float:
+        return args.secondary * rng.uniform(0.8, 1.2)
+
+    return [
+        ModelEndpoint("primary", StubModel(primary_delay, error_rate=args.error_rate, seed=1)),
+        ModelEndpoint("secondary", StubModel(secondary_delay, seed=2)),
+    ]
+
+
+async def main_async(args) -> None:
+    # open circuits would hide the difference between the runs, so keep them closed
+    await run("no hedge", ModelRouter(_endpoints(args), hedge_after=0, circuit_failures=10**9), args.requests, args.concurrency)
+    await run("hedged", ModelRouter(_endpoints(args), hedge_after=args.hedge_after, circuit_failures=10**9), args.requests, args.concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--fast", type=float, default=0.1)
+    parser.add_argument("--slow", type=float, default=3.0)
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--secondary", type=float, default=0.25)
+    parser.add_argument("--hedge-after", type=float, default=0.3)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Microbenchmark: serialising the menu from ORM instances vs plain rows.
+
+    uv run python -m benchmarks.serialization [--sizes 1000 10000 100000] [--repeat 5]
+
+"before" mirrors the old read path: one `Menu` SQLModel instance per row,
+FastAPI's `jsonable_encoder`, then the stdlib encoder. "after" is the
+current path: `MenuRow` tuples from a column-only select, dicts built once
+and encoded by `FastJSONResponse` (orjson when installed). Both report CPU
+time per request and peak traced memory; no database is needed.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.app.db.models.menu_model import Menu
+from backend.app.services.menu_index import MenuRow, compact_table, MENU_COLUMNS
+from backend.app.api.json_response import dumps, orjson
+
+
+def _raw_rows(n: int) -> list[tuple]:
+    return [(i, f"menu item {i}", round(3.5 + (i % 97) * 0.25, 2)) for i in range(1, n + 1)]
+
+
+def before(raw: list[tuple]) -> bytes:
+    items = [Menu(item_id=i, item_name=name, item_price=price) for i, name, price in raw]
+    return json.dumps(jsonable_encoder(items)).encode()
+
+
+def after(raw: list[tuple]) -> bytes:
+    rows = [MenuRow(*r) for r in raw]
+    return dumps([row._asdict() for row in rows])
+
+
+def after_compact(raw: list[tuple]) -> bytes:
+    rows = [MenuRow(*r) for r in raw]
+    return dumps(compact_table(rows, MENU_COLUMNS))
+
+
+def measure(fn, raw: list[tuple], repeat: int) -> tuple[float, float, int]:
+    fn(raw)  # warm up
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        body = fn(raw)
+        cpu.append(time.process_time() - start)
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(cpu), peak / 1e6, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if orjson is not None else 'stdlib json'}")
+    print(f"{'items':>8} {'path':<14} {'cpu ms':>9} {'peak MB':>9} {'bytes':>10}")
+    for n in args.sizes:
+        raw = _raw_rows(n)
+        for name, fn in (("before", before), ("after", after), ("after_compact", after_compact)):
+            cpu, peak, size = measure(fn, raw, args.repeat)
+            print(f"{n:>8} {name:<14} {cpu * 1000:>9.2f} {peak:>9.2f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Service-layer benchmarks for order_service, user_service and PostgresSession.
+
+    uv run python -m benchmarks.services            # compare with the baseline
+    uv run python -m benchmarks.services --update-baseline [--record-timings]
+    DB_URL=postgresql+asyncpg://... uv run python -m benchmarks.services --db-url env
+
+Every case seeds data at several sizes (menu items, cart lines, history
+length, order count), then times the service call with a fresh session per
+call, like a request would get. It records the median wall time and the
+SQL statements per call. Caches are warm, as in steady-state traffic,
+unless the case name ends in `_cold`.
+
+Results are compared with `benchmarks/baseline.json`. A case fails when it
+runs more statements than its baseline; a missing baseline fails the run
+too. Statement counts do not depend on the machine or its load, so the
+committed baseline holds only those. Timings are advisory: a baseline
+recorded with `--record-timings` (on the machine that runs the comparison)
+makes cases slower than it by more than `--threshold` (default 100%) print
+a SLOWER line, but never fails the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+
+def _configure_db(db_url: str) -> None:
+    # the app reads DB_URL when backend.app.db.main is first imported
+    if db_url != "env":
+        os.environ["DB_URL"] = db_url
+    elif "DB_URL" not in os.environ:
+        sys.exit("--db-url env needs DB_URL to be set")
+
+
+class Bench:
+    def __init__(self, iterations: int):
+        self.iterations = iterations
+        self.results: dict[str, dict] = {}
+
+    async def run(
+        self,
+        name: str,
+        size: int,
+        op: Callable[[object], Awaitable],
+        before: Callable[[], Awaitable] | None = None,
+    ) -> None:
+        """Time `op(session)`; `before()` runs untimed ahead of every call."""
+        from backend.app.db.main import async_session
+        from backend.app.observability.query_stats import track_queries
+
+        timings, queries = [], []
+        for i in range(self.iterations + 1):
+            if before is not None:
+                await before()
+            async with async_session() as session:
+                with track_queries() as stats:
+                    started = time.perf_counter()
+                    await op(session)
+                    elapsed = time.perf_counter() - started
+            if i == 0:
+                continue  # warm-up
+            timings.append(elapsed)
+            queries.append(stats.count)
+
+        key = f"{name}[{size}]"
+        self.results[key] = {
+            "ms": round(statistics.median(timings) * 1000, 3),
+            "queries": max(queries),
+        }
+        print(f"{key:<44} {self.results[key]['ms']:>10.3f} ms {self.results[key]['queries']:>4} queries")
+
+
+async def _reset(session) -> None:
+    from sqlmodel import SQLModel
+    from backend.app.services.order_service import menu_snapshots
+    from backend.app.services.cart_store import cart_store
+
+    for table in reversed(SQLModel.metadata.sorted_tables):
+        await session.execute(table.delete())
+    await session.commit()
+    menu_snapshots.clear()
+    await cart_store.drop("user0")
+
+
+async def _seed(menu_items: int = 0, users: int = 1) -> None:
+    from backend.app.db.main import async_session
+    from backend.app.db.models.user_model import Users
+    from backend.app.db.models.menu_model import Menu, MenuVersion
+    from backend.app.db.models.restaurant_model import Restaurant, DEFAULT_RESTAURANT_ID
+
+    async with async_session() as session:
+        await _reset(session)
+        session.add(Restaurant(restaurant_id=DEFAULT_RESTAURANT_ID, name="default"))
+        session.add_all(Users(username=f"user{u}", password="x") for u in range(users))
+        session.add_all(
+            Menu(
+                item_id=i, restaurant_id=DEFAULT_RESTAURANT_ID, item_code=f"I{i}",
+                item_name=f"menu item {i}", item_price=5.0 + i % 17,
+            )
+            for i in range(1, menu_items + 1)
+        )
+        session.add(MenuVersion(id=DEFAULT_RESTAURANT_ID, version=1))
+        await session.commit()
+
+
+async def _fill_cart(username: str, lines: int) -> None:
+    from backend.app.db.main import async_session
+    from backend.app.db.schemas import CartOp
+    from backend.app.services.order_service import order_service
+
+    async with async_session() as session:
+        await order_service().apply_cart_changes(
+            username, [CartOp(op="set", item_id=i, quantity=1 + i % 3) for i in range(1, lines + 1)], session
+        )
+
+
+async def _fill_history(conversation_id: str, length: int) -> None:
+    from backend.app.db.main import async_session
+    from backend.app.services.agent_service import PostgresSession
+
+    async with async_session() as session:
+        items = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 80}
+            for i in range(length)
+        ]
+        await PostgresSession(session, conversation_id).add_items(items)
+
+
+async def _fill_orders(username: str, count: int, items_per_order: int = 5) -> None:
+    from backend.app.db.main import async_session
+    from backend.app.db.models.order_model import Order
+    from backend.app.db.models.orderitems_model import OrderItem
+    from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+
+    async with async_session() as session:
+        orders = [Order(restaurant_id=DEFAULT_RESTAURANT_ID, username=username, status="recieved") for _ in range(count)]
+        session.add_all(orders)
+        await session.flush()
+        session.add_all(
+            OrderItem(restaurant_id=DEFAULT_RESTAURANT_ID, order_id=o.order_id, item_id=i, quantity=1)
+            for o in orders for i in range(1, items_per_order + 1)
+        )
+        await session.commit()
+
+
+async def menu_cases(bench: Bench, sizes: list[int]) -> None:
+    from backend.app.services.order_service import order_service, menu_snapshots
+
+    service = order_service()
+    for n in sizes:
+        await _seed(menu_items=n)
+
+        async def cold():
+            menu_snapshots.clear()
+
+        await bench.run("menu.get_menu", n, service.get_menu)
+        await bench.run("menu.get_menu_cold", n, service.get_menu, before=cold)
+        await bench.run("menu.search_menu", n, lambda s: service.search_menu("menu itm 42", s))
+
+
+async def cart_cases(bench: Bench, sizes: list[int]) -> None:
+    from backend.app.db.schemas import CartOp
+    from backend.app.services.order_service import order_service
+    from backend.app.services.cart_store import cart_store
+
+    service = order_service()
+    for n in sizes:
+        await _seed(menu_items=max(sizes) + 10)
+        await _fill_cart("user0", n)
+
+        async def cold():
+            await cart_store.drop("user0")
+
+        extra = max(sizes) + 1
+        await bench.run("cart.get_cart", n, lambda s: service.get_cart("user0", s))
+        await bench.run("cart.get_cart_cold", n, lambda s: service.get_cart("user0", s), before=cold)
+        await bench.run("cart.add_to_cart", n, lambda s: service.add_to_cart("user0", item_id=1, quantity=1, session=s))
+        await bench.run(
+            "cart.apply_cart_changes", n,
+            lambda s: service.apply_cart_changes(
+                "user0", [CartOp(op="add", item_id=extra, quantity=1), CartOp(op="remove", item_id=extra)], s
+            ),
+        )
+        await bench.run("cart.update_cart", n, lambda s: service.update_cart("user0", 1, 2, s))
+
+
+async def order_cases(bench: Bench, cart_sizes: list[int], order_counts: list[int]) -> None:
+    from backend.app.services.order_service import order_service
+
+    service = order_service()
+    for n in cart_sizes:
+        await _seed(menu_items=max(cart_sizes))
+        await bench.run(
+            "order.create_order_from_cart", n,
+            lambda s: service.create_order_from_cart("user0", s),
+            before=lambda: _fill_cart("user0", n),
+        )
+    for n in order_counts:
+        await _seed(menu_items=10)
+        await _fill_orders("user0", n)
+        await bench.run("order.get_most_recent_order", n, lambda s: service.get_most_recent_order("user0", s))
+
+
+async def history_cases(bench: Bench, sizes: list[int]) -> None:
+    from backend.app.services.agent_service import PostgresSession
+    from backend.app.services.user_service import user_service
+
+    users = user_service()
+    for n in sizes:
+        await _seed()
+        await _fill_history("user0", n)
+        reply = [{"role": "assistant", "content": "ok"}]
+
+        await bench.run("history.get_items", n, lambda s: PostgresSession(s, "user0").get_items())
+        await bench.run("history.get_items_limit20", n, lambda s: PostgresSession(s, "user0").get_items(limit=20))
+        await bench.run("history.add_items", n, lambda s: PostgresSession(s, "user0").add_items(reply))
+        await bench.run(
+            "history.pop_item", n,
+            lambda s: PostgresSession(s, "user0").pop_item(),
+            before=lambda: _fill_history("user0", 1),
+        )
+        await bench.run("user.get_chat", n, lambda s: users.get_chat("user0", s))
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """Statement regressions, which fail the run, and advisory timing notes."""
+    failures, slower = [], []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if current["queries"] > base["queries"]:
+            failures.append(f"{key}: {current['queries']} queries, baseline {base['queries']}")
+        if "ms" in base and current["ms"] > base["ms"] * (1 + threshold):
+            slower.append(f"{key}: {current['ms']:.3f} ms, baseline {base['ms']:.3f} ms (+{threshold:.0%} allowed)")
+    return failures, slower
+
+
+async def main_async(args) -> int:
+    from backend.app.db.main import init_db, engine
+
+    await init_db()
+    bench = Bench(args.iterations)
+    try:
+        if "menu" in args.groups:
+            await menu_cases(bench, args.menu_sizes)
+        if "cart" in args.groups:
+            await cart_cases(bench, args.cart_sizes)
+        if "order" in args.groups:
+            await order_cases(bench, args.cart_sizes, args.order_counts)
+        if "history" in args.groups:
+            await history_cases(bench, args.history_sizes)
+    finally:
+        await engine.dispose()
+
+    if args.update_baseline:
+        baseline = {
+            key: result if args.record_timings else {"queries": result["queries"]}
+            for key, result in bench.results.items()
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --update-baseline first", file=sys.stderr)
+        return 1
+    failures, slower = compare(bench.results, json.loads(args.baseline.read_text()), args.threshold)
+    for note in slower:
+        print(f"SLOWER (advisory) {note}")
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default=None, help='SQLAlchemy URL, or "env" to use DB_URL (default: a temporary SQLite file)')
+    parser.add_argument("--groups", nargs="+", default=["menu", "cart", "order", "history"], choices=["menu", "cart", "order", "history"])
+    parser.add_argument("--menu-sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--cart-sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--order-counts", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=1.0, help="advisory slowdown allowed against recorded timings")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--record-timings", action="store_true", help="also store this machine's timings in the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_db(args.db_url or f"sqlite+aiosqlite:///{tmp}/bench.db")
+        os.environ.setdefault("METRICS_ENABLED", "false")
+        return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
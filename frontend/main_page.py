@@ -1,16 +1,158 @@
 import chainlit as cl
 import httpx
-from typing import Optional
+from typing import Optional, Awaitable, Callable
+import asyncio
+import codecs
+import json
 import os
+import uuid
+import websockets
 
 # Configure your API endpoint here
 base_url  = os.getenv("BASE_SERVER_URL")
 AUTH_API_URL = os.getenv("AUTH_API_URL", "http://http://127.0.0.1:8000/api/v1/user/login")
+# e.g. ws://127.0.0.1:8000/api/v1/user/ws; when set, each chat session keeps one
+# WebSocket for all its turns and order updates instead of a POST per message
+CHAT_WS_URL = os.getenv("CHAT_WS_URL")
+
+# Streaming budgets: tokens are buffered and pushed to the browser at most
+# every STREAM_FLUSH_INTERVAL seconds, or as soon as STREAM_FLUSH_CHARS pile up.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+
+
+class TokenCoalescer:
+    """Batch small stream deltas into fewer UI updates.
+
+    Text is flushed when the buffer reaches `max_chars` or when it has been
+    waiting for `max_delay` seconds, whichever comes first. Use it as an
+    async context manager so the timer is stopped and the tail is flushed.
+    """
+
+    def __init__(self, emit: Callable[[str], Awaitable[None]], max_delay: float = STREAM_FLUSH_INTERVAL, max_chars: int = STREAM_FLUSH_CHARS):
+        self.emit = emit
+        self.max_delay = max_delay
+        self.max_chars = max_chars
+        self._buffer: list[str] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._ticker: Optional[asyncio.Task] = None
+
+    async def push(self, text: str):
+        if not text:
+            return
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.max_chars:
+            await self.flush()
+
+    async def flush(self):
+        # the lock keeps the timer and size-triggered flushes in order
+        async with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._size = 0
+            await self.emit(text)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.max_delay)
+            await self.flush()
+
+    async def __aenter__(self):
+        self._ticker = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._ticker:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+        # only flush the tail when the stream ended normally
+        if exc_type is None:
+            await self.flush()
+
+
+class ChatSocket:
+    """The session's WebSocket to the backend, shared by all of its turns.
+
+    A reader task routes frames to the turn they belong to by message id;
+    order updates go to `on_order`.
+    """
+
+    def __init__(self, url: str, token: str, on_order: Callable[[dict], Awaitable[None]]):
+        self.url = url
+        self.token = token
+        self.on_order = on_order
+        self.closed = True
+        self._ws = None
+        self._reader: Optional[asyncio.Task] = None
+        self._turns: dict[str, asyncio.Queue] = {}
+
+    async def connect(self):
+        self._ws = await websockets.connect(self.url)
+        try:
+            await self._ws.send(json.dumps({"type": "auth", "token": self.token}))
+            ready = json.loads(await self._ws.recv())
+            if ready.get("type") != "ready":
+                raise Exception(f"WebSocket auth failed: {ready}")
+        except BaseException:
+            # the caller falls back to HTTP, so don't leave this socket open
+            await self._ws.close()
+            self._ws = None
+            raise
+        self.closed = False
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self._ws:
+                frame = json.loads(raw)
+                if frame.get("type") == "order":
+                    await self.on_order(frame)
+                elif frame.get("id") in self._turns:
+                    self._turns[frame["id"]].put_nowait(frame)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.closed = True
+            for queue in self._turns.values():
+                queue.put_nowait({"type": "error", "detail": "connection to the server was lost"})
+
+    async def send_message(self, text: str) -> tuple[str, asyncio.Queue]:
+        """Send one message; its frames arrive on the returned queue until "done" or "error"."""
+        msg_id = str(uuid.uuid4())
+        queue: asyncio.Queue = asyncio.Queue()
+        self._turns[msg_id] = queue
+        await self._ws.send(json.dumps({"type": "message", "id": msg_id, "text": text}))
+        return msg_id, queue
+
+    async def cancel(self, msg_id: str):
+        # stops the agent run on the server; the connection stays open
+        if not self.closed:
+            try:
+                await self._ws.send(json.dumps({"type": "cancel", "id": msg_id}))
+            except websockets.ConnectionClosed:
+                pass
+
+    def finish(self, msg_id: str):
+        self._turns.pop(msg_id, None)
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+        self.closed = True
 
 
 async def get_messages_from_db_api(username: str) -> list[dict]:
     """Fetches messages from your FastAPI/Postgres API."""
-    api_url = f"http://localhost:8000/api/v1/user/chat?username={username}"
+    api_url = f"http://localhost:8000/api/v1/user/chat?username={username}&include_archived=true"
     
     async with httpx.AsyncClient() as client:
         try:
@@ -58,6 +200,8 @@ async def auth_callback(username: str, password: str) -> Optional[cl.User]:
                 # Create and return a Chainlit User object
                 return cl.User(
                     identifier=username,
+                    # the WebSocket authenticates with the login token
+                    metadata={"token": data.get("access_token")},
                     # metadata={
                     #     "role": data.get("role", "user"),
                     #     "email": data.get("email", ""),
@@ -136,6 +280,77 @@ async def start():
     # Store user info in session for later use
     cl.user_session.set("username", user.identifier)
 
+    token = (user.metadata or {}).get("token")
+    if CHAT_WS_URL and token:
+        async def on_order(frame: dict):
+            await cl.Message(content=f"Order #{frame['order_id']} is now **{frame['status']}**.").send()
+
+        socket = ChatSocket(CHAT_WS_URL, token, on_order)
+        try:
+            await socket.connect()
+            cl.user_session.set("chat_socket", socket)
+        except Exception as e:
+            # fall back to one POST per message
+            print(f"Could not open chat WebSocket, using HTTP: {e}")
+
+
+
+async def stream_over_http(msg: cl.Message, text: str, username: str):
+    """Stream one reply from a POST to /message."""
+    # Use httpx.AsyncClient for async requests
+    # Set timeout to None or a very high value for long-running streams
+    async with httpx.AsyncClient(timeout=None) as client:
+        
+        # 2. Use client.stream() and async with to manage the response stream
+        async with client.stream(
+            "POST", 
+            base_url + f'/message?username={username}',
+            json={"message": text},
+        ) as response:
+            
+            # Check for an immediate non-streaming error
+            if response.status_code != 200:
+                # Read the error body completely if the request failed
+                error_text = await response.aread()
+                raise Exception(f"API Error {response.status_code}: {error_text.decode()}")
+
+            # Chunks can end in the middle of a multi-byte character, so
+            # decode incrementally instead of chunk by chunk.
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            try:
+                # 3. Iterate over the stream and coalesce tiny deltas
+                # before pushing them to the browser
+                async with TokenCoalescer(msg.stream_token) as coalescer:
+                    async for chunk in response.aiter_bytes():
+                        await coalescer.push(decoder.decode(chunk))
+                    await coalescer.push(decoder.decode(b"", final=True))
+            except asyncio.CancelledError:
+                # Close the upstream response right away so the server
+                # sees the disconnect and cancels the agent run.
+                await response.aclose()
+                raise
+
+
+async def stream_over_socket(msg: cl.Message, socket: ChatSocket, text: str):
+    """Stream one reply over the session's WebSocket; cancelling stops the server run."""
+    msg_id, frames = await socket.send_message(text)
+    try:
+        async with TokenCoalescer(msg.stream_token) as coalescer:
+            while True:
+                frame = await frames.get()
+                if frame["type"] == "delta":
+                    await coalescer.push(frame["text"])
+                elif frame["type"] == "error":
+                    raise Exception(frame.get("detail"))
+                elif frame["type"] == "done":
+                    break
+                # "accepted" and "tool" progress frames are not shown yet
+    except asyncio.CancelledError:
+        await socket.cancel(msg_id)
+        raise
+    finally:
+        socket.finish(msg_id)
 
 
 @cl.on_message
@@ -150,43 +365,27 @@ async def main(message: cl.Message):
     msg = cl.Message(content="")
     await msg.send()
     
-    payload = {
-        "message": message.content,
-    }
-    
     user = cl.user_session.get("user")
-    
+    socket = cl.user_session.get("chat_socket")
+
+    # Remember the running task so a stop or disconnect can cancel it,
+    # which in turn drops the backend connection and stops the agent run.
+    cl.user_session.set("stream_task", asyncio.current_task())
+
     try:
-        # Use httpx.AsyncClient for async requests
-        # Set timeout to None or a very high value for long-running streams
-        async with httpx.AsyncClient(timeout=None) as client:
-            
-            # 2. Use client.stream() and async with to manage the response stream
-            async with client.stream(
-                "POST", 
-                base_url + f'/message?username={user.identifier}',
-                json=payload,
-            ) as response:
-                
-                # Check for an immediate non-streaming error
-                if response.status_code != 200:
-                    # Read the error body completely if the request failed
-                    error_text = await response.aread()
-                    raise Exception(f"API Error {response.status_code}: {error_text.decode()}")
-
-                # 3. Iterate over the stream chunk-by-chunk
-                async for chunk in response.aiter_bytes():
-                    # Decode the bytes chunk to a string token
-                    token = chunk.decode("utf-8")
-                    
-                    # 4. Stream the token to the Chainlit message for real-time display
-                    # This updates the message content on the UI incrementally
-                    await msg.stream_token(token)
+        if socket is not None and not socket.closed:
+            await stream_over_socket(msg, socket, message.content)
+        else:
+            await stream_over_http(msg, message.content, user.identifier)
 
         # 5. Streaming is complete. Call update() to finalize the message.
         # The content is already set by stream_token, so we just call update().
         await msg.update()
 
+    except asyncio.CancelledError:
+        print(f"Stream cancelled for user: {user.identifier}")
+        raise
+
     except Exception as e:
         # Handle exceptions (e.g., connection errors, invalid URLs)
         error_content = f"An error occurred while streaming: {str(e)}"
@@ -198,12 +397,37 @@ async def main(message: cl.Message):
             author="Error"
         ).send()
 
+    finally:
+        if cl.user_session.get("stream_task") is asyncio.current_task():
+            cl.user_session.set("stream_task", None)
+
+
+def cancel_stream():
+    """Cancel the in-flight backend stream for this session, if any."""
+    task = cl.user_session.get("stream_task")
+    if task and not task.done():
+        task.cancel()
+
+
+@cl.on_stop
+async def on_stop():
+    """
+    This function is called when the user presses the stop button.
+    """
+    cancel_stream()
+
 
 @cl.on_chat_end
 async def end():
     """
     This function is called when the chat session ends.
     """
+    # The browser is gone, so stop paying for the backend agent run.
+    cancel_stream()
+    socket = cl.user_session.get("chat_socket")
+    if socket is not None:
+        await socket.close()
+
     user = cl.user_session.get("user")
     if user:
         print(f"Chat session ended for user: {user.identifier}")
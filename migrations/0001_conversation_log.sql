@@ -0,0 +1,38 @@
+-- Rekey conversationmessage as an append-only log: (conversation_id, seq)
+-- primary key, JSONB content, and a conversationhead row per conversation
+-- holding the last seq handed out.
+--
+-- Upgrades a table created with the uuid `id` key. seq is backfilled in the
+-- order history used to be read (created_at, then id), starting at 1.
+
+BEGIN;
+
+ALTER TABLE conversationmessage ADD COLUMN seq integer;
+
+UPDATE conversationmessage AS m
+SET seq = numbered.seq
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS seq
+    FROM conversationmessage
+) AS numbered
+WHERE m.id = numbered.id;
+
+ALTER TABLE conversationmessage ALTER COLUMN seq SET NOT NULL;
+ALTER TABLE conversationmessage DROP CONSTRAINT conversationmessage_pkey;
+ALTER TABLE conversationmessage DROP COLUMN id;
+ALTER TABLE conversationmessage ADD CONSTRAINT conversationmessage_pkey PRIMARY KEY (conversation_id, seq);
+
+ALTER TABLE conversationmessage ALTER COLUMN content TYPE jsonb USING content::jsonb;
+
+-- init_db creates this table too if the app was started before migrating
+CREATE TABLE IF NOT EXISTS conversationhead (
+    conversation_id character varying NOT NULL,
+    last_seq integer NOT NULL,
+    CONSTRAINT conversationhead_pkey PRIMARY KEY (conversation_id)
+);
+
+INSERT INTO conversationhead (conversation_id, last_seq)
+SELECT conversation_id, max(seq) FROM conversationmessage GROUP BY conversation_id
+ON CONFLICT (conversation_id) DO UPDATE SET last_seq = greatest(conversationhead.last_seq, excluded.last_seq);
+
+COMMIT;
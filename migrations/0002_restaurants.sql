@@ -0,0 +1,115 @@
+-- Scope menus, carts and orders to a restaurant.
+--
+-- Existing rows all belong to the default restaurant (id 1). Besides the
+-- restaurant_id columns this adds the columns the same tables gained
+-- alongside tenancy (menu.item_code, order.created_at/claimed_*), merges
+-- duplicate cart lines so (restaurant_id, username, item_id) can be unique,
+-- and moves order and orderitem into tables list-partitioned by
+-- restaurant_id, with one partition per restaurant.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS restaurant (
+    restaurant_id serial NOT NULL,
+    name character varying NOT NULL,
+    CONSTRAINT restaurant_pkey PRIMARY KEY (restaurant_id),
+    CONSTRAINT restaurant_name_key UNIQUE (name)
+);
+INSERT INTO restaurant (restaurant_id, name) VALUES (1, 'default') ON CONFLICT DO NOTHING;
+SELECT setval(pg_get_serial_sequence('restaurant', 'restaurant_id'), (SELECT max(restaurant_id) FROM restaurant));
+
+-- menu: item_code is unique per restaurant rather than globally
+ALTER TABLE menu ADD COLUMN restaurant_id integer NOT NULL DEFAULT 1
+    CONSTRAINT menu_restaurant_id_fkey REFERENCES restaurant (restaurant_id);
+ALTER TABLE menu ALTER COLUMN restaurant_id DROP DEFAULT;
+CREATE INDEX ix_menu_restaurant_id ON menu (restaurant_id);
+ALTER TABLE menu ADD COLUMN IF NOT EXISTS item_code character varying;
+DROP INDEX IF EXISTS ix_menu_item_code;
+ALTER TABLE menu ADD CONSTRAINT menu_restaurant_id_item_code_key UNIQUE (restaurant_id, item_code);
+
+-- cartitem: one line per (restaurant, user, item), which the cart store upserts on
+ALTER TABLE cartitem ADD COLUMN restaurant_id integer NOT NULL DEFAULT 1
+    CONSTRAINT cartitem_restaurant_id_fkey REFERENCES restaurant (restaurant_id);
+ALTER TABLE cartitem ALTER COLUMN restaurant_id DROP DEFAULT;
+ALTER TABLE cartitem DROP CONSTRAINT IF EXISTS cartitem_username_item_id_key;
+UPDATE cartitem AS c
+SET quantity = dup.total
+FROM (
+    SELECT min(cart_id) AS cart_id, sum(quantity) AS total
+    FROM cartitem
+    GROUP BY restaurant_id, username, item_id
+    HAVING count(*) > 1
+) AS dup
+WHERE c.cart_id = dup.cart_id;
+DELETE FROM cartitem AS c
+USING cartitem AS kept
+WHERE kept.restaurant_id = c.restaurant_id
+  AND kept.username = c.username
+  AND kept.item_id = c.item_id
+  AND kept.cart_id < c.cart_id;
+ALTER TABLE cartitem ADD CONSTRAINT cartitem_restaurant_id_username_item_id_key UNIQUE (restaurant_id, username, item_id);
+
+-- order and orderitem: move the rows into partitioned tables. The old
+-- tables and their indexes are renamed out of the way, and order ids keep
+-- coming from the existing sequence.
+ALTER TABLE orderitem RENAME TO orderitem_unpartitioned;
+ALTER INDEX orderitem_pkey RENAME TO orderitem_unpartitioned_pkey;
+ALTER TABLE "order" RENAME TO order_unpartitioned;
+ALTER INDEX order_pkey RENAME TO order_unpartitioned_pkey;
+ALTER INDEX ix_order_order_id RENAME TO ix_order_unpartitioned_order_id;
+DROP INDEX IF EXISTS ix_order_status;
+DROP INDEX IF EXISTS ix_order_created_at;
+ALTER SEQUENCE order_order_id_seq OWNED BY NONE;
+
+ALTER TABLE order_unpartitioned ADD COLUMN IF NOT EXISTS created_at timestamp without time zone NOT NULL DEFAULT (now() AT TIME ZONE 'utc');
+ALTER TABLE order_unpartitioned ADD COLUMN IF NOT EXISTS claimed_by character varying;
+ALTER TABLE order_unpartitioned ADD COLUMN IF NOT EXISTS claimed_at timestamp without time zone;
+
+CREATE TABLE "order" (
+    restaurant_id integer NOT NULL,
+    order_id integer NOT NULL DEFAULT nextval('order_order_id_seq'),
+    username character varying NOT NULL,
+    status character varying NOT NULL,
+    created_at timestamp without time zone NOT NULL,
+    claimed_by character varying,
+    claimed_at timestamp without time zone,
+    CONSTRAINT order_pkey PRIMARY KEY (order_id, restaurant_id),
+    CONSTRAINT order_restaurant_id_fkey FOREIGN KEY (restaurant_id) REFERENCES restaurant (restaurant_id),
+    CONSTRAINT order_username_fkey FOREIGN KEY (username) REFERENCES users (username)
+) PARTITION BY LIST (restaurant_id);
+ALTER SEQUENCE order_order_id_seq OWNED BY "order".order_id;
+CREATE INDEX ix_order_order_id ON "order" (order_id);
+CREATE INDEX ix_order_status ON "order" (status);
+CREATE INDEX ix_order_created_at ON "order" (created_at);
+
+CREATE TABLE orderitem (
+    restaurant_id integer NOT NULL,
+    order_id integer NOT NULL,
+    item_id integer NOT NULL,
+    quantity integer NOT NULL,
+    CONSTRAINT orderitem_pkey PRIMARY KEY (restaurant_id, order_id, item_id),
+    CONSTRAINT orderitem_restaurant_id_order_id_fkey FOREIGN KEY (restaurant_id, order_id) REFERENCES "order" (restaurant_id, order_id),
+    CONSTRAINT orderitem_item_id_fkey FOREIGN KEY (item_id) REFERENCES menu (item_id)
+) PARTITION BY LIST (restaurant_id);
+
+-- the same partitions init_db creates for every restaurant
+DO $$
+DECLARE
+    rid integer;
+BEGIN
+    FOR rid IN SELECT restaurant_id FROM restaurant LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF "order" FOR VALUES IN (%s)', 'order_r' || rid, rid);
+        EXECUTE format('CREATE TABLE %I PARTITION OF orderitem FOR VALUES IN (%s)', 'orderitem_r' || rid, rid);
+    END LOOP;
+END
+$$;
+
+INSERT INTO "order" (restaurant_id, order_id, username, status, created_at, claimed_by, claimed_at)
+SELECT 1, order_id, username, status, created_at, claimed_by, claimed_at FROM order_unpartitioned;
+INSERT INTO orderitem (restaurant_id, order_id, item_id, quantity)
+SELECT 1, order_id, item_id, quantity FROM orderitem_unpartitioned;
+
+DROP TABLE orderitem_unpartitioned;
+DROP TABLE order_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,5 @@
+-- Index a user's orders by time, for the chat socket's poll of the orders
+-- placed in the last WS_ORDER_WINDOW_HOURS. On the partitioned "order" table
+-- this creates the index on every partition as well.
+
+CREATE INDEX IF NOT EXISTS ix_order_restaurant_id_username_created_at ON "order" (restaurant_id, username, created_at);
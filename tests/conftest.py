@@ -0,0 +1,79 @@
+"""Tests run against TEST_DB_URL when set, otherwise a temporary SQLite file.
+
+    uv run pytest
+    TEST_DB_URL=postgresql+asyncpg://postgres@localhost/food_test uv run pytest
+
+The database is emptied before every test, so never point TEST_DB_URL at
+real data. Tests marked `postgres` are skipped on SQLite.
+"""
+import os
+import tempfile
+
+import pytest
+
+# the app reads DB_URL when backend.app.db.main is first imported
+os.environ["DB_URL"] = os.environ.get("TEST_DB_URL") or f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+from sqlmodel import SQLModel, text  # noqa: E402
+
+from backend.app.db.main import async_session, engine, init_db  # noqa: E402
+from backend.app.db.models.menu_model import Menu, MenuVersion  # noqa: E402
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID, PARTITIONED  # noqa: E402
+from backend.app.db.models.user_model import Users  # noqa: E402
+
+MENU_ITEMS = 10
+USERS = ("alice", "bob")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs TEST_DB_URL to point at Postgres")
+
+
+def pytest_collection_modifyitems(config, items):
+    if PARTITIONED:
+        return
+    skip = pytest.mark.skip(reason="needs TEST_DB_URL to point at Postgres")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+def clear_process_caches():
+    """Forget everything this process cached about the database: the next request starts cold."""
+    from backend.app.services.cart_store import cart_store
+    from backend.app.services.order_service import menu_snapshots
+    from backend.app.services.popularity import _trackers
+    from backend.app.services.restaurant_service import _known_restaurants
+
+    menu_snapshots.clear()
+    _trackers.clear()
+    _known_restaurants.clear()
+    cart_store.backend._carts.clear()
+
+
+@pytest.fixture
+async def db():
+    """An empty database holding the default restaurant, USERS and MENU_ITEMS menu items."""
+    await init_db()
+    async with async_session() as session:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            if table.name == "restaurant":
+                await session.execute(table.delete().where(table.c.restaurant_id != DEFAULT_RESTAURANT_ID))
+            else:
+                await session.execute(table.delete())
+        session.add_all(Users(username=username, password="x") for username in USERS)
+        session.add_all(
+            Menu(item_id=i, restaurant_id=DEFAULT_RESTAURANT_ID, item_code=f"I{i}", item_name=f"item {i}", item_price=float(i))
+            for i in range(1, MENU_ITEMS + 1)
+        )
+        session.add(MenuVersion(id=DEFAULT_RESTAURANT_ID, version=1))
+        await session.flush()
+        if PARTITIONED:
+            # the ids above were explicit, so move the sequence past them
+            await session.execute(text(f"SELECT setval(pg_get_serial_sequence('menu', 'item_id'), {MENU_ITEMS})"))
+        await session.commit()
+    clear_process_caches()
+    yield
+    # connections belong to this test's event loop
+    await engine.dispose()
@@ -0,0 +1,138 @@
+"""Concurrent chats each run against their own MCP server and get their own reply.
+
+Every `agent_stream_generator` run spawns an MCP server for its restaurant
+and binds it to a private clone of the agent. Here the model and the MCP
+server are stubs, so ~120 runs can go through the real Runner at once.
+"""
+import asyncio
+import json
+import os
+
+from agents.mcp import MCPServer
+from agents.models.interface import Model
+from mcp.types import CallToolResult, TextContent, Tool
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputItemDoneEvent,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+
+from backend.config import config
+
+RUNS = 120
+
+
+class StubServer(MCPServer):
+    """Stands in for the per-run MCP stdio server; answers `whoami` with its restaurant."""
+
+    instances: list["StubServer"] = []
+
+    def __init__(self, name: str, params: dict, cache_tools_list: bool = False):
+        super().__init__()
+        self._name = name
+        self.restaurant_id = params["env"]["RESTAURANT_ID"]
+        self.calls: list[dict] = []
+        self.closed = False
+        StubServer.instances.append(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def connect(self):
+        pass
+
+    async def cleanup(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cleanup()
+
+    async def list_tools(self, run_context=None, agent=None):
+        return [Tool(name="whoami", description="The restaurant this server serves", inputSchema={"type": "object", "properties": {}})]
+
+    async def call_tool(self, tool_name, arguments):
+        self.calls.append(arguments or {})
+        # let the other runs interleave between call and result
+        await asyncio.sleep(0.01)
+        return CallToolResult(content=[TextContent(type="text", text=f"restaurant {self.restaurant_id}")])
+
+    async def list_prompts(self):
+        raise NotImplementedError
+
+    async def get_prompt(self, name, arguments=None):
+        raise NotImplementedError
+
+
+def _response(item) -> ResponseCompletedEvent:
+    response = Response(
+        id="stub", created_at=0, model="stub", object="response", output=[item],
+        parallel_tool_calls=False, tool_choice="auto", tools=[],
+    )
+    return ResponseCompletedEvent(type="response.completed", response=response, sequence_number=2)
+
+
+class StubModel(Model):
+    """Calls `whoami` once, then replies with the prompt and the tool's answer."""
+
+    async def get_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def stream_response(self, system_instructions, input, *args, **kwargs):
+        prompt = next(item["content"] for item in reversed(input) if item.get("role") == "user")
+        outputs = [item["output"] for item in input if item.get("type") == "function_call_output"]
+        await asyncio.sleep(0)
+        if not outputs:
+            call = ResponseFunctionToolCall(type="function_call", call_id=f"call-{prompt}", name="whoami", arguments="{}")
+            yield ResponseOutputItemDoneEvent(type="response.output_item.done", item=call, output_index=0, sequence_number=0)
+            yield _response(call)
+            return
+        # the SDK hands MCP text content back as its JSON form
+        text = f"{prompt} from {json.loads(outputs[-1])['text']}"
+        for i, word in enumerate(text.split(" ")):
+            delta = word if i == 0 else " " + word
+            yield ResponseTextDeltaEvent(
+                type="response.output_text.delta", item_id="msg", output_index=0, content_index=0,
+                delta=delta, logprobs=[], sequence_number=i,
+            )
+            await asyncio.sleep(0)
+        message = ResponseOutputMessage(
+            type="message", id="msg", role="assistant", status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
+        yield _response(message)
+
+
+async def test_concurrent_runs_use_only_their_own_mcp_server(db, monkeypatch):
+    # building the module-level agent needs model settings, never a connection
+    monkeypatch.setenv("GEMINI_API_KEY", os.environ.get("GEMINI_API_KEY", "unused"))
+    monkeypatch.setenv("BASE_URL", os.environ.get("BASE_URL", "http://localhost/unused"))
+    from backend.app.agents import main
+
+    monkeypatch.setattr(config, "AGENT_PREFETCH_RATE", 0.0)
+    monkeypatch.setattr(main, "SharedToolsMCPServerStdio", StubServer)
+    monkeypatch.setattr(main, "agent", main.agent.clone(model=StubModel()))
+    monkeypatch.setattr(StubServer, "instances", [])
+
+    async def chat(i: int) -> str:
+        chunks = [chunk async for chunk in main.agent_stream_generator(f"hello {i}", conversation_id=f"conv-{i}", restaurant_id=i)]
+        return "".join(chunks)
+
+    replies = await asyncio.gather(*(chat(i) for i in range(1, RUNS + 1)))
+
+    assert replies == [f"hello {i} from restaurant {i}" for i in range(1, RUNS + 1)]
+    servers = {server.restaurant_id: server for server in StubServer.instances}
+    assert len(StubServer.instances) == len(servers) == RUNS
+    for i in range(1, RUNS + 1):
+        assert servers[str(i)].calls == [{}]
+        assert servers[str(i)].closed
+    # the shared agent was never bound to any run's server
+    assert main.agent.mcp_servers == []
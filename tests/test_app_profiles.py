@@ -0,0 +1,47 @@
+"""The "rest" profile never imports the agent stack, at startup or while serving.
+
+Each check runs in a fresh interpreter, since this test process may already
+have imported the agents SDK for other tests.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+AGENT_MODULES = ("agents", "mcp", "openai", "backend.app.agents")
+
+_PROBE = r"""
+import asyncio, json, sys
+import httpx
+from backend import create_app
+from backend.app.db.main import engine
+
+app = create_app("rest")
+
+async def serve():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for path in ("/api/v1/order/menu", "/api/v1/order/cartitems?username=alice", "/api/v1/order/recommendations?username=alice"):
+            response = await client.get(path)
+            assert response.status_code == 200, (path, response.text)
+    # aiosqlite's worker thread would keep the interpreter from exiting
+    await engine.dispose()
+
+asyncio.run(serve())
+prefixes = json.loads(sys.argv[1])
+print(json.dumps(sorted(m for m in sys.modules if any(m == p or m.startswith(p + ".") for p in prefixes))))
+"""
+
+
+def test_rest_profile_loads_no_agent_modules(db):
+    env = {key: value for key, value in os.environ.items() if key not in ("GEMINI_API_KEY", "BASE_URL", "MODEL_NAME")}
+    # the module-level app is built too, so it must not pull the agent stack in either
+    env["APP_PROFILE"] = "rest"
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, json.dumps(AGENT_MODULES)],
+        env=env, cwd=Path(__file__).resolve().parents[1], capture_output=True, text=True, timeout=120,
+    )
+
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,54 @@
+"""Hot cart copies must never outlive a change made by another worker."""
+from backend.app.db.main import async_session
+from backend.app.services.cart_store import CartStore, MemoryCartBackend
+
+
+def worker() -> CartStore:
+    # each worker process has its own memory backend
+    return CartStore(MemoryCartBackend(idle_seconds=3600, max_carts=100))
+
+
+async def set_quantities(store: CartStore, quantities: dict[int, int], username: str = "alice") -> None:
+    async with async_session() as session:
+        async with store.lock(username):
+            state = await store.load(username, session, for_update=True)
+            await store.write(state, {**state.quantities(), **quantities}, session)
+
+
+async def quantities(store: CartStore, username: str = "alice") -> dict[int, int]:
+    async with async_session() as session:
+        return (await store.load(username, session)).quantities()
+
+
+async def test_reads_reload_a_copy_changed_by_another_worker(db):
+    rest, agent = worker(), worker()
+    assert await quantities(agent) == {}
+
+    await set_quantities(rest, {1: 2})
+
+    assert await quantities(agent) == {1: 2}
+
+
+async def test_writes_start_from_the_committed_cart(db):
+    rest, agent = worker(), worker()
+    await set_quantities(agent, {1: 1})
+    assert await quantities(agent) == {1: 1}
+
+    # rest changes item 1 while agent still holds the old copy
+    await set_quantities(rest, {1: 5})
+    await set_quantities(agent, {2: 1})
+
+    assert await quantities(rest) == {1: 5, 2: 1}
+    assert await quantities(agent) == {1: 5, 2: 1}
+
+
+async def test_revision_moves_with_every_change(db):
+    rest, agent = worker(), worker()
+    async with async_session() as session:
+        before = (await agent.load("alice", session)).revision
+
+    await set_quantities(rest, {3: 1})
+
+    async with async_session() as session:
+        after = (await agent.load("alice", session)).revision
+    assert after > before
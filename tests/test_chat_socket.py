@@ -0,0 +1,71 @@
+"""Chat WebSocket frame handling, against a scripted socket."""
+import pytest
+from fastapi import WebSocketDisconnect, status
+
+from backend.app.api.chat_socket import ChatConnection, _authenticate
+
+
+class ScriptedSocket:
+    """Hands out the given ASGI receive messages, then a disconnect."""
+
+    def __init__(self, *messages: dict):
+        self.messages = list(messages)
+        self.closed_with: tuple[int, str] | None = None
+
+    async def receive(self) -> dict:
+        if self.messages:
+            return self.messages.pop(0)
+        return {"type": "websocket.disconnect", "code": status.WS_1000_NORMAL_CLOSURE}
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE, reason: str | None = None) -> None:
+        self.closed_with = (code, reason)
+
+
+def text(data: str) -> dict:
+    return {"type": "websocket.receive", "text": data}
+
+
+def binary(data: bytes) -> dict:
+    return {"type": "websocket.receive", "bytes": data}
+
+
+def sent(connection: ChatConnection) -> list[dict]:
+    frames = []
+    while not connection.outbox.empty():
+        frames.append(connection.outbox.get_nowait())
+    return frames
+
+
+async def test_binary_frame_gets_an_error_and_the_connection_stays_open():
+    socket = ScriptedSocket(binary(b'{"type": "ping"}'), text('{"type": "ping"}'))
+    connection = ChatConnection(socket, "alice", 1)
+
+    with pytest.raises(WebSocketDisconnect):
+        await connection._reader()
+
+    assert sent(connection) == [
+        {"type": "error", "detail": "binary frames are not supported, send JSON text"},
+        {"type": "pong"},
+    ]
+
+
+async def test_invalid_json_gets_an_error():
+    socket = ScriptedSocket(text("not json"))
+    connection = ChatConnection(socket, "alice", 1)
+
+    with pytest.raises(WebSocketDisconnect):
+        await connection._reader()
+
+    assert sent(connection) == [{"type": "error", "detail": "frames must be JSON objects"}]
+
+
+async def test_binary_auth_frame_closes_with_unsupported_data():
+    socket = ScriptedSocket(binary(b"token"))
+
+    assert await _authenticate(socket) is None
+    assert socket.closed_with[0] == status.WS_1003_UNSUPPORTED_DATA
+
+
+async def test_disconnect_before_auth_is_reported_as_disconnect():
+    with pytest.raises(WebSocketDisconnect):
+        await _authenticate(ScriptedSocket())
@@ -0,0 +1,70 @@
+"""History reads see archived messages; conversations never archived cost one query."""
+import pytest
+
+from backend.app.db.main import async_session
+from backend.app.observability.query_stats import track_queries
+from backend.app.services.agent_service import PostgresSession
+from backend.app.services.archive_service import archive_service
+from backend.config import config
+
+MESSAGES = 12
+
+
+def turn(i: int) -> dict:
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+
+
+@pytest.fixture
+async def archived(db, monkeypatch):
+    """A conversation of MESSAGES messages whose newest 3 are hot and the rest archived in chunks of 4."""
+    monkeypatch.setattr(config, "ARCHIVE_KEEP_LAST", 3)
+    monkeypatch.setattr(config, "ARCHIVE_AFTER_DAYS", 0)
+    monkeypatch.setattr(config, "ARCHIVE_CHUNK_MESSAGES", 4)
+    async with async_session() as session:
+        await PostgresSession(session, "alice").add_items([turn(i) for i in range(MESSAGES)])
+        assert await archive_service().archive_conversation("alice", session) == MESSAGES - 3
+    return "alice"
+
+
+async def test_unlimited_read_includes_the_archive(archived):
+    async with async_session() as session:
+        items = await PostgresSession(session, archived).get_items()
+
+    assert items == [turn(i) for i in range(MESSAGES)]
+
+
+async def test_preloaded_history_includes_the_archive(archived):
+    async with async_session() as session:
+        history = PostgresSession(session, archived)
+        await history.preload()
+        items = await history.get_items()
+
+    assert items == [turn(i) for i in range(MESSAGES)]
+
+
+@pytest.mark.parametrize("limit", [2, 3, 5, MESSAGES, MESSAGES + 5])
+async def test_limited_read_pages_into_the_archive_as_far_as_needed(archived, limit):
+    async with async_session() as session:
+        items = await PostgresSession(session, archived).get_items(limit=limit)
+
+    assert items == [turn(i) for i in range(max(0, MESSAGES - limit), MESSAGES)]
+
+
+async def test_new_messages_follow_the_archived_ones(archived):
+    async with async_session() as session:
+        history = PostgresSession(session, archived)
+        await history.add_items([turn(MESSAGES)])
+        items = await history.get_items()
+
+    assert items == [turn(i) for i in range(MESSAGES + 1)]
+
+
+async def test_conversation_never_archived_reads_only_the_hot_table(db):
+    async with async_session() as session:
+        await PostgresSession(session, "bob").add_items([turn(i) for i in range(4)])
+    async with async_session() as session:
+        with track_queries() as stats:
+            items = await PostgresSession(session, "bob").get_items()
+
+    assert items == [turn(i) for i in range(4)]
+    assert stats.count == 1
@@ -0,0 +1,51 @@
+"""Concurrent saves never reuse or skip a message seq within a conversation."""
+import asyncio
+from collections import defaultdict
+
+import pytest
+from sqlmodel import select
+
+from backend.app.db.main import async_session
+from backend.app.db.models.conversation_msg_model import ConversationHead, ConversationMessage
+from backend.app.services.agent_service import PostgresSession
+
+CONVERSATIONS = 120
+WRITERS = 3  # saves racing on each conversation at once
+ROUNDS = 2
+
+pytestmark = pytest.mark.postgres
+
+
+async def save(conversation_id: str, writer: int, round_: int) -> None:
+    async with async_session() as session:
+        await PostgresSession(session, conversation_id).add_items([
+            {"role": "user", "content": f"{writer}.{round_}.question"},
+            {"role": "assistant", "content": f"{writer}.{round_}.answer"},
+        ])
+
+
+async def test_concurrent_conversations_get_contiguous_seqs(db):
+    await asyncio.gather(*(
+        save(f"conv-{c}", writer, round_)
+        for round_ in range(ROUNDS) for writer in range(WRITERS) for c in range(CONVERSATIONS)
+    ))
+
+    async with async_session() as session:
+        rows = (await session.exec(
+            select(ConversationMessage.conversation_id, ConversationMessage.seq, ConversationMessage.content)
+        )).all()
+        heads = dict((await session.exec(select(ConversationHead.conversation_id, ConversationHead.last_seq))).all())
+
+    messages = defaultdict(dict)
+    for conversation_id, seq, content in rows:
+        messages[conversation_id][seq] = content["text"]
+
+    saved = WRITERS * ROUNDS * 2
+    assert len(messages) == CONVERSATIONS
+    for conversation_id, by_seq in messages.items():
+        assert sorted(by_seq) == list(range(1, saved + 1))
+        assert heads[conversation_id] == saved
+        # the two messages of one save sit next to each other, question first
+        for seq, text in by_seq.items():
+            if text.endswith(".question"):
+                assert by_seq[seq + 1] == text.replace(".question", ".answer")
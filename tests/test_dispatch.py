@@ -0,0 +1,91 @@
+"""The dispatcher fills each kitchen up to its capacity; the kitchen moves orders on."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app.db.main import async_session
+from backend.app.db.models.order_model import Order
+from backend.app.db.models.orderitems_model import OrderItem
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.dispatch_service import dispatch_service
+from backend.app.services.order_service import order_service
+from backend.app.services.restaurant_service import restaurant_service
+from backend.config import config
+
+START = datetime(2025, 1, 1, 12, 0)
+
+
+async def place(restaurant_id: int, sizes: list[int]) -> list[int]:
+    """One order per entry, all created at the same time, with that many of item 1."""
+    async with async_session() as session:
+        orders = [Order(restaurant_id=restaurant_id, username="alice", status="recieved", created_at=START) for _ in sizes]
+        session.add_all(orders)
+        await session.flush()
+        session.add_all(
+            OrderItem(restaurant_id=restaurant_id, order_id=o.order_id, item_id=1, quantity=size)
+            for o, size in zip(orders, sizes)
+        )
+        await session.commit()
+        return [o.order_id for o in orders]
+
+
+@pytest.fixture
+def capacity(monkeypatch):
+    monkeypatch.setattr(config, "DISPATCH_KITCHEN_CAPACITY", 2)
+
+
+async def test_claims_stay_within_the_restaurant_and_its_capacity(db, capacity):
+    async with async_session() as session:
+        other = (await restaurant_service().create_restaurant("other", session))["restaurant_id"]
+    big, small, medium = await place(DEFAULT_RESTAURANT_ID, [5, 1, 2])
+    elsewhere = await place(other, [1])
+    service = dispatch_service("test")
+
+    async with async_session() as session:
+        claimed = await service.claim_batch(DEFAULT_RESTAURANT_ID, 20, session)
+        # smaller orders first, and only as many as the kitchen has room for
+        assert [(o.order_id, o.items) for o in claimed] == [(small, 1), (medium, 2)]
+        assert await service.claim_batch(DEFAULT_RESTAURANT_ID, 20, session) == []
+        assert await service.status_of(big, session) == "recieved"
+        assert await service.status_of(elsewhere[0], session, other) == "recieved"
+
+        loads = {load.restaurant_id: load for load in await service.loads(session)}
+        assert (loads[DEFAULT_RESTAURANT_ID].waiting, loads[DEFAULT_RESTAURANT_ID].preparing) == (1, 2)
+        assert (loads[other].waiting, loads[other].preparing) == (1, 0)
+
+
+async def test_kitchen_reports_free_room_for_the_next_order(db, capacity):
+    big, small, medium = await place(DEFAULT_RESTAURANT_ID, [5, 1, 2])
+    service = dispatch_service("test")
+
+    async with async_session() as session:
+        await service.claim_batch(DEFAULT_RESTAURANT_ID, 20, session)
+        queue = await service.kitchen_queue(session)
+        assert [o["order_id"] for o in queue] == [small, medium]
+        assert queue[0]["items"] == [{"item_id": 1, "item_name": "item 1", "quantity": 1}]
+
+        assert await service.advance(small, "ready", session)
+        # a repeated report changes nothing
+        assert not await service.advance(small, "ready", session)
+        assert not await service.advance(medium, "completed", session)
+        # an order the kitchen never got can't be ready
+        assert not await service.advance(big, "ready", session)
+        with pytest.raises(ValueError):
+            await service.advance(big, "preparing", session)
+
+        assert [o.order_id for o in await service.claim_batch(DEFAULT_RESTAURANT_ID, 20, session)] == [big]
+        assert await service.advance(small, "completed", session)
+        assert await service.status_of(small, session) == "completed"
+
+
+async def test_status_poll_sees_completion_and_skips_old_orders(db):
+    old, = await place(DEFAULT_RESTAURANT_ID, [1])
+    async with async_session() as session:
+        recent = Order(restaurant_id=DEFAULT_RESTAURANT_ID, username="alice", status="ready", created_at=START + timedelta(days=2))
+        session.add(recent)
+        await session.commit()
+        await dispatch_service("test").advance(recent.order_id, "completed", session)
+
+        statuses = await order_service().get_recent_order_statuses("alice", START + timedelta(days=1), session)
+        assert statuses == {recent.order_id: "completed"}
+        assert old not in statuses
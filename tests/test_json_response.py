@@ -0,0 +1,45 @@
+"""orjson and the stdlib fallback must encode responses byte for byte alike."""
+from datetime import datetime
+from typing import NamedTuple
+
+import pytest
+from pydantic import BaseModel
+
+from backend.app.api import json_response
+
+
+class Row(NamedTuple):
+    item_id: int
+    item_name: str
+
+
+class Line(BaseModel):
+    row: Row
+    quantity: int
+
+
+PAYLOADS = [
+    {"columns": ("item_id", "item_name"), "rows": [(1, "soup"), (2, "crème brûlée")]},
+    [Row(1, "soup"), Row(2, "tea")],
+    {"rows": [Row(1, "soup")], "nested": {"row": Row(2, "tea"), "pair": (Row(3, "pie"), (4, 5))}},
+    {1: "non-str keys", 2: None, "price": 1.5, "ok": True},
+    {"line": Line(row=Row(1, "soup"), quantity=2), "at": datetime(2025, 1, 2, 3, 4, 5, 6)},
+    Row(1, "soup"),
+]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_orjson_and_stdlib_paths_match(payload, monkeypatch):
+    if json_response.orjson is None:
+        pytest.skip("orjson is not installed")
+    fast = json_response.dumps(payload)
+    monkeypatch.setattr(json_response, "orjson", None)
+    assert json_response.dumps(payload) == fast
+
+
+def test_named_tuples_are_objects_and_tuples_are_arrays(monkeypatch):
+    payload = {"row": Row(1, "soup"), "pair": (1, 2)}
+    expected = b'{"row":{"item_id":1,"item_name":"soup"},"pair":[1,2]}'
+    assert json_response.dumps(payload) == expected
+    monkeypatch.setattr(json_response, "orjson", None)
+    assert json_response.dumps(payload) == expected
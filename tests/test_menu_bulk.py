@@ -0,0 +1,151 @@
+"""Bulk menu import and export through the API.
+
+On SQLite this runs the batched upsert path, on Postgres (asyncpg) the COPY path.
+"""
+import json
+
+import httpx
+import pytest
+from sqlmodel import select
+
+from backend import create_app
+from backend.app.db.main import async_session
+from backend.app.db.models.menu_model import Menu, MenuVersion
+from backend.config import config
+from conftest import MENU_ITEMS
+
+MENU = "/api/v1/order/menu"
+
+
+@pytest.fixture
+async def client(db):
+    transport = httpx.ASGITransport(app=create_app("rest"))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def import_menu(client, body: str, fmt: str, **params) -> httpx.Response:
+    return await client.post(f"{MENU}/import", params={"format": fmt, **params}, content=body.encode())
+
+
+async def menu() -> dict[str, tuple[str, float]]:
+    async with async_session() as session:
+        rows = await session.execute(select(Menu.item_code, Menu.item_name, Menu.item_price))
+        return {code: (name, price) for code, name, price in rows.all()}
+
+
+async def menu_version() -> int:
+    async with async_session() as session:
+        return (await session.execute(select(MenuVersion.version))).scalar_one()
+
+
+def ndjson(*rows) -> str:
+    return "".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows)
+
+
+async def test_csv_import_inserts_and_updates_by_item_code(client):
+    body = "item_code,item_name,item_price\nI1,renamed,1.5\nN1,new one,3\nN2,\"new, two\",4.25\n"
+
+    response = await import_menu(client, body, "csv")
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["received"], report["inserted"], report["updated"], report["rejected"]) == (3, 2, 1, 0)
+    assert report["applied"] and report["menu_version"] == 2
+    items = await menu()
+    assert items["I1"] == ("renamed", 1.5)
+    assert items["N2"] == ("new, two", 4.25)
+    assert len(items) == MENU_ITEMS + 2
+
+
+async def test_invalid_rows_are_skipped_and_reported(client):
+    body = ndjson(
+        {"item_code": "N1", "item_name": "ok", "item_price": 2},
+        {"item_code": "N2", "item_name": "bad price", "item_price": "free"},
+        {"item_code": "N3", "item_price": 1},
+        "{not json",
+        "[1, 2]",
+        {"item_code": "N4", "item_name": "negative", "item_price": -1},
+    )
+
+    response = await import_menu(client, body, "ndjson")
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["received"], report["inserted"], report["rejected"]) == (6, 1, 5)
+    assert [error["line"] for error in report["errors"]] == [2, 3, 4, 5, 6]
+    assert "N1" in await menu()
+
+
+async def test_atomic_import_with_an_invalid_row_changes_nothing(client):
+    body = ndjson(
+        {"item_code": "I1", "item_name": "renamed", "item_price": 1},
+        {"item_code": "N1", "item_name": "new", "item_price": 2},
+        {"item_code": "N2", "item_name": "bad", "item_price": None},
+    )
+    before = await menu()
+
+    response = await import_menu(client, body, "ndjson", atomic="true")
+
+    assert response.status_code == 422
+    report = response.json()
+    assert not report["applied"]
+    assert (report["inserted"], report["updated"], report["rejected"]) == (0, 0, 1)
+    assert await menu() == before
+    assert await menu_version() == 1
+
+
+async def test_repeated_item_code_last_row_wins(client):
+    body = ndjson(
+        {"item_code": "N1", "item_name": "first", "item_price": 1},
+        {"item_code": "I1", "item_name": "renamed", "item_price": 1},
+        {"item_code": "N1", "item_name": "last", "item_price": 2},
+    )
+
+    report = (await import_menu(client, body, "ndjson")).json()
+
+    assert (report["received"], report["inserted"], report["updated"]) == (3, 1, 1)
+    assert (await menu())["N1"] == ("last", 2.0)
+
+
+async def test_import_over_several_batches_bumps_the_menu_version_once(client, monkeypatch):
+    monkeypatch.setattr(config, "MENU_IMPORT_BATCH", 2)
+    rows = [{"item_code": f"N{i}", "item_name": f"new {i}", "item_price": i} for i in range(7)]
+    # a repeat in a later batch still wins
+    rows.append({"item_code": "N0", "item_name": "new 0 again", "item_price": 9})
+
+    report = (await import_menu(client, ndjson(*rows), "ndjson")).json()
+
+    assert report["applied"] and report["menu_version"] == 2
+    assert await menu_version() == 2
+    items = await menu()
+    assert len(items) == MENU_ITEMS + 7
+    assert items["N0"] == ("new 0 again", 9.0)
+
+
+async def test_csv_header_without_required_columns_is_rejected(client):
+    response = await import_menu(client, "item_code,item_name\nN1,new\n", "csv")
+
+    assert response.status_code == 400
+    assert "item_price" in response.json()["detail"]
+    assert await menu_version() == 1
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+async def test_export_round_trips_through_import(client, fmt):
+    response = await client.get(f"{MENU}/export", params={"format": fmt})
+
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    if fmt == "csv":
+        assert lines[0] == "item_id,item_code,item_name,item_price"
+        assert lines[1] == "1,I1,item 1,1.0"
+        assert len(lines) == MENU_ITEMS + 1
+    else:
+        assert json.loads(lines[0]) == {"item_id": 1, "item_code": "I1", "item_name": "item 1", "item_price": 1.0}
+        assert len(lines) == MENU_ITEMS
+
+    before = await menu()
+    report = (await import_menu(client, response.text, fmt)).json()
+    assert (report["inserted"], report["updated"], report["rejected"]) == (0, MENU_ITEMS, 0)
+    assert await menu() == before
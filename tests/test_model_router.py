@@ -0,0 +1,179 @@
+"""Hedging, fallback and circuit breaking in ModelRouter, against local stub endpoints."""
+import asyncio
+
+import pytest
+from agents.models.interface import Model
+
+from backend.app.agents.my_config.model_router import ModelEndpoint, ModelRouter
+
+
+class StubModel(Model):
+    """Streams three events named after itself once `delay` seconds have passed.
+
+    With `fail` set it raises instead of streaming; with `fail_after_first`
+    it raises after its first event. Cancelled streams are counted.
+    """
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False, fail_after_first: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.fail_after_first = fail_after_first
+        self.started = 0
+        self.cancelled = 0
+
+    async def get_response(self, *args, **kwargs):
+        return [event async for event in self.stream_response()]
+
+    async def stream_response(self, *args, **kwargs):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError(f"{self.name} failed")
+            for i in range(3):
+                yield f"{self.name}:{i}"
+                if self.fail_after_first:
+                    raise ConnectionError(f"{self.name} broke mid-stream")
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def router(*models: StubModel, **kwargs) -> ModelRouter:
+    kwargs.setdefault("hedge_after", 0)
+    kwargs.setdefault("circuit_failures", 2)
+    kwargs.setdefault("circuit_open_seconds", 60)
+    return ModelRouter([ModelEndpoint(model.name, model) for model in models], **kwargs)
+
+
+async def stream(router: ModelRouter) -> list[str]:
+    events = [event async for event in router.stream_response()]
+    # let cancelled attempts unwind
+    await asyncio.sleep(0.01)
+    return events
+
+
+def circuit(router: ModelRouter, name: str) -> str:
+    return next(stats["circuit"] for stats in router.stats() if stats["endpoint"] == name)
+
+
+async def test_fast_primary_is_not_hedged():
+    primary, secondary = StubModel("primary"), StubModel("secondary")
+    r = router(primary, secondary, hedge_after=0.5)
+
+    assert await stream(r) == ["primary:0", "primary:1", "primary:2"]
+    assert secondary.started == 0
+
+
+async def test_slow_primary_is_hedged_and_loser_cancelled():
+    primary, secondary = StubModel("primary", delay=5), StubModel("secondary")
+    r = router(primary, secondary, hedge_after=0.05)
+
+    assert await stream(r) == ["secondary:0", "secondary:1", "secondary:2"]
+    assert (primary.started, primary.cancelled) == (1, 1)
+    assert secondary.cancelled == 0
+    # losing a hedge is not a failure
+    assert r.endpoints[0].errors == 0
+    assert circuit(r, "primary") == "closed"
+
+
+async def test_hedge_prefers_the_endpoint_measured_faster():
+    primary, secondary = StubModel("primary", delay=5), StubModel("secondary")
+    r = router(primary, secondary, hedge_after=0.05)
+    await stream(r)
+
+    primary.delay = 0
+    assert await stream(r) == ["secondary:0", "secondary:1", "secondary:2"]
+    # the secondary now has a measured first-event time, so it goes first
+    assert primary.started == 1
+
+
+async def test_failure_before_first_event_falls_back_without_waiting_for_the_hedge():
+    primary, secondary = StubModel("primary", fail=True), StubModel("secondary")
+    r = router(primary, secondary, hedge_after=5)
+
+    assert await asyncio.wait_for(stream(r), timeout=1) == ["secondary:0", "secondary:1", "secondary:2"]
+    assert r.endpoints[0].errors == 1
+    assert circuit(r, "primary") == "closed"
+
+
+async def test_failure_after_first_event_reaches_the_caller():
+    primary, secondary = StubModel("primary", fail_after_first=True), StubModel("secondary")
+    r = router(primary, secondary)
+
+    events = []
+    with pytest.raises(ConnectionError):
+        async for event in r.stream_response():
+            events.append(event)
+    assert events == ["primary:0"]
+    assert secondary.started == 0
+    assert r.endpoints[0].errors == 1
+
+
+async def test_all_endpoints_failing_raises_the_last_error():
+    r = router(StubModel("primary", fail=True), StubModel("secondary", fail=True))
+
+    with pytest.raises(ConnectionError, match="secondary failed"):
+        await stream(r)
+
+
+async def test_circuit_opens_after_consecutive_failures():
+    primary = StubModel("primary", fail=True)
+    r = router(primary, circuit_failures=2)
+
+    with pytest.raises(ConnectionError):
+        await stream(r)
+    assert circuit(r, "primary") == "closed"
+    with pytest.raises(ConnectionError):
+        await stream(r)
+    assert circuit(r, "primary") == "open"
+
+
+async def test_circuit_opens_then_lets_one_trial_through_and_closes():
+    primary, secondary = StubModel("primary", fail=True), StubModel("secondary", delay=0.1)
+    r = router(primary, secondary, hedge_after=0.02, circuit_failures=1, circuit_open_seconds=0.3)
+
+    await stream(r)
+    assert circuit(r, "primary") == "open"
+
+    # open: not even hedged to
+    assert await stream(r) == ["secondary:0", "secondary:1", "secondary:2"]
+    assert primary.started == 1
+
+    await asyncio.sleep(0.3)
+    assert circuit(r, "primary") == "half_open"
+    primary.fail = False
+    primary.delay = 0.05
+    # the hedge is the trial request; requests meanwhile skip the primary
+    trial = asyncio.create_task(stream(r))
+    await asyncio.sleep(0.03)
+    assert await stream(r) == ["secondary:0", "secondary:1", "secondary:2"]
+    assert await trial == ["primary:0", "primary:1", "primary:2"]
+    assert primary.started == 2
+    assert circuit(r, "primary") == "closed"
+
+
+async def test_failed_trial_reopens_the_circuit():
+    primary, secondary = StubModel("primary", fail=True), StubModel("secondary", delay=0.1)
+    r = router(primary, secondary, hedge_after=0.02, circuit_failures=3, circuit_open_seconds=0.3)
+    r.endpoints[0].consecutive_failures = 2
+    await stream(r)
+    assert circuit(r, "primary") == "open"
+
+    await asyncio.sleep(0.3)
+    assert circuit(r, "primary") == "half_open"
+    # a single failed trial is enough, below the usual threshold
+    assert await stream(r) == ["secondary:0", "secondary:1", "secondary:2"]
+    assert primary.started == 2
+    assert circuit(r, "primary") == "open"
+
+
+async def test_get_response_is_hedged_and_loser_cancelled():
+    primary, secondary = StubModel("primary", delay=5), StubModel("secondary")
+    r = router(primary, secondary, hedge_after=0.05)
+
+    assert await r.get_response() == ["secondary:0", "secondary:1", "secondary:2"]
+    await asyncio.sleep(0.01)
+    assert primary.cancelled == 1
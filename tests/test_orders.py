@@ -0,0 +1,67 @@
+"""POST /orders only accepts items from the ordering restaurant's menu."""
+import httpx
+import pytest
+from sqlmodel import func, select
+
+from backend import create_app
+from backend.app.db.main import async_session
+from backend.app.db.models.order_model import Order
+from backend.app.db.models.popularity_model import ItemPopularity, UserItemCount
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+
+ORDER = "/api/v1/order"
+
+
+@pytest.fixture
+async def client(db):
+    transport = httpx.ASGITransport(app=create_app("rest"))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def other_restaurant_item(client) -> tuple[int, int]:
+    """A second restaurant and the id of an item on its menu."""
+    response = await client.post(f"{ORDER}/restaurants", json={"name": "second"})
+    restaurant_id = response.json()["restaurant_id"]
+    response = await client.post(
+        f"{ORDER}/menu", headers={"X-Restaurant-Id": str(restaurant_id)},
+        json={"item_code": "B1", "item_name": "other", "item_price": 4.0},
+    )
+    return restaurant_id, response.json()["item_id"]
+
+
+def order_body(*item_ids: int) -> dict:
+    return {
+        "order": {"username": "alice", "status": "recieved"},
+        "items": [{"order_id": 0, "item_id": item_id, "quantity": 1} for item_id in item_ids],
+    }
+
+
+async def count(model) -> int:
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+@pytest.mark.parametrize("idempotency_key", [None, "key-1"])
+async def test_order_rejects_items_from_another_restaurants_menu(client, idempotency_key):
+    _, foreign_item = await other_restaurant_item(client)
+    headers = {"X-Restaurant-Id": str(DEFAULT_RESTAURANT_ID)}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+
+    response = await client.post(f"{ORDER}/orders", headers=headers, json=order_body(1, foreign_item))
+
+    assert response.status_code == 400
+    assert str(foreign_item) in response.json()["detail"]
+    assert await count(Order) == 0
+    assert await count(ItemPopularity) == 0
+    assert await count(UserItemCount) == 0
+
+
+async def test_order_accepts_items_from_its_own_menu(client):
+    restaurant_id, item_id = await other_restaurant_item(client)
+
+    response = await client.post(f"{ORDER}/orders", headers={"X-Restaurant-Id": str(restaurant_id)}, json=order_body(item_id))
+
+    assert response.status_code == 201, response.text
+    assert [item["item_id"] for item in response.json()["items"]] == [item_id]
@@ -0,0 +1,104 @@
+"""Every route stays within its query budget, even when this process has cached nothing.
+
+Each request names its restaurant explicitly, so the tenant lookup is paid
+too, and is sent both with and without an Idempotency-Key.
+"""
+import httpx
+import pytest
+from sqlalchemy import update
+
+from backend import create_app
+from backend.app.db.main import async_session
+from backend.app.db.models.order_model import Order
+from backend.app.db.models.restaurant_model import DEFAULT_RESTAURANT_ID
+from backend.app.services.agent_service import PostgresSession
+from backend.config import config
+from conftest import clear_process_caches
+
+ORDER = "/api/v1/order"
+USER = "/api/v1/user"
+
+
+async def fill_cart(client):
+    await client.post(f"{ORDER}/cartitems", params={"username": "alice"}, json=[{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}])
+
+
+async def place_order(client, status="recieved"):
+    await fill_cart(client)
+    response = await client.post(f"{ORDER}/orders_cart", params={"username": "alice"})
+    order_id = response.json()["order"]["order_id"]
+    async with async_session() as session:
+        await session.execute(update(Order).where(Order.order_id == order_id).values(status=status))
+        await session.commit()
+    return order_id
+
+
+async def in_kitchen(client):
+    return await place_order(client, "preparing")
+
+
+async def completed(client):
+    return await place_order(client, "completed")
+
+
+async def registered(client):
+    await client.post(f"{USER}/register", json={"username": "dave", "password": "secret"})
+
+
+async def chat_history(client):
+    async with async_session() as session:
+        await PostgresSession(session, "alice").add_items([{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+
+
+# name: (method, path, request arguments, setup run before the caches are cleared)
+ROUTES = {
+    "list restaurants": ("GET", f"{ORDER}/restaurants", {}, None),
+    "create restaurant": ("POST", f"{ORDER}/restaurants", {"json": {"name": "second"}}, None),
+    "menu": ("GET", f"{ORDER}/menu", {}, None),
+    "menu search": ("GET", f"{ORDER}/menu/search", {"params": {"q": "item"}}, None),
+    "create menu item": ("POST", f"{ORDER}/menu", {"json": {"item_code": "NEW", "item_name": "new", "item_price": 2.5}}, None),
+    "create order": (
+        "POST", f"{ORDER}/orders",
+        {"json": {"order": {"username": "alice", "status": "recieved"}, "items": [{"order_id": 0, "item_id": 1, "quantity": 1}, {"order_id": 0, "item_id": 2, "quantity": 3}]}},
+        None,
+    ),
+    "order from cart": ("POST", f"{ORDER}/orders_cart", {"params": {"username": "alice"}}, fill_cart),
+    "recent order": ("GET", f"{ORDER}/orders", {"params": {"username": "alice"}}, place_order),
+    "kitchen queue": ("GET", f"{ORDER}/kitchen", {}, in_kitchen),
+    # a repeated report is the longest path: the no-op update, then the status read
+    "order status": ("POST", f"{ORDER}/orders/{{order_id}}/status", {"json": {"status": "completed"}}, completed),
+    "recommendations": ("GET", f"{ORDER}/recommendations", {"params": {"username": "alice"}}, place_order),
+    "add to cart": ("POST", f"{ORDER}/cartitems", {"params": {"username": "alice"}, "json": [{"item_id": 1, "quantity": 1}, {"item_id": 3, "quantity": 1}]}, fill_cart),
+    "cart": ("GET", f"{ORDER}/cartitems", {"params": {"username": "alice"}}, fill_cart),
+    "apply cart changes": ("POST", f"{ORDER}/cartitems/apply", {"params": {"username": "alice"}, "json": [{"op": "add", "item_id": 3}, {"op": "remove", "item_id": 2}]}, fill_cart),
+    "update cart": ("PUT", f"{ORDER}/cartitems", {"params": {"username": "alice"}, "json": {"item_id": 1, "quantity": 5}}, fill_cart),
+    "delete cart item": ("DELETE", f"{ORDER}/cartitem", {"params": {"username": "alice", "item_id": 1}}, fill_cart),
+    "clear cart": ("DELETE", f"{ORDER}/cartitems", {"params": {"username": "alice"}}, fill_cart),
+    "register": ("POST", f"{USER}/register", {"json": {"username": "carol", "password": "secret"}}, None),
+    "login": ("POST", f"{USER}/login", {"data": {"username": "dave", "password": "secret"}}, registered),
+    "chat history": ("GET", f"{USER}/chat", {"params": {"username": "alice"}}, chat_history),
+}
+
+
+@pytest.fixture
+async def client(db):
+    transport = httpx.ASGITransport(app=create_app("rest"))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.parametrize("idempotency_key", [None, "key-1"])
+@pytest.mark.parametrize("route", list(ROUTES))
+async def test_route_stays_within_budget_with_cold_caches(client, route, idempotency_key, monkeypatch):
+    method, path, kwargs, setup = ROUTES[route]
+    order_id = await setup(client) if setup else None
+    clear_process_caches()
+    # raises QueryBudgetExceeded out of the app when the route runs too many statements
+    monkeypatch.setattr(config, "QUERY_BUDGET_ENFORCE", True)
+
+    headers = {"X-Restaurant-Id": str(DEFAULT_RESTAURANT_ID)}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    response = await client.request(method, path.format(order_id=order_id), headers=headers, **kwargs)
+
+    assert response.status_code < 400, response.text